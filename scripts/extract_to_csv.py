@@ -1,70 +1,292 @@
 #!/usr/bin/env python3
+'''
+Extracts the posts of a corpus of forum pages (``*.json.gz`` files that
+contain the page's `url` and `html`) to per-domain CSV files.
+
+The corpus is streamed: worker processes read and process one file at a
+time, while the main process is the only writer. It keeps the per-domain CSV
+files open and appends the learned patterns to a JSON lines output file as
+soon as a page has been processed. Memory usage, therefore, does not grow
+with the corpus size.
+
+With ``--journal`` the progress of the run is recorded in a
+:class:`harvest.journal.ProgressJournal`. A restarted run skips the files that
+have already been completed and have not been modified since (failed, aborted
+and filtered files are processed again). It truncates the outputs to their
+last committed offsets before appending to them.
+
+``--time-limit`` and ``--memory-limit`` set a per-page budget (see
+:mod:`harvest.budget`). Pages that exceed their budget are given up and
+logged together with the stage that was running. Worker processes are
+replaced after a page exceeded its memory budget (see
+:class:`harvest.worker.WorkerPool`).
+'''
 
 import argparse
 import gzip
 import logging
 import os
 
-from glob import glob
-from json import load, dump
+from collections import OrderedDict
 from csv import writer
-from collections import defaultdict
-from harvest import posts
-from harvest.extract import extract_posts
+from glob import iglob
+from json import dumps, load
 from urllib.parse import urlparse
 
+from harvest import posts, worker
+from harvest.document import Document
+from harvest.extract import extract_posts
+from harvest.budget import BudgetExceeded
+from harvest.journal import ABORTED, COMPLETED, FAILED, SKIPPED, ProgressJournal, get_file_signature
+
 logging.getLogger().setLevel(logging.INFO)
 
+CSV_HEADER = ['forum_link', 'post_link', 'user', 'date', 'post']
+# maximum number of per-domain CSV files that are kept open at the same time
+MAX_OPEN_CSV_FILES = 256
+
+
+def iter_corpus(corpus_path):
+    '''
+    Yields the corpus files without listing the whole corpus directory up
+    front. The files are yielded in directory order, which is not sorted and
+    may differ between runs; a resumed run, therefore, identifies the
+    processed files by their journal records rather than their position.
+    '''
+    yield from iglob(corpus_path + '*.json.gz')
+
+
+def process_file(fname, corpus_include_string=None, debug_directory=None, no=0):
+    '''
+    Extracts the posts of a single corpus file.
+
+    Returns:
+      tuple -- (fname, domain, url, extract_post_result, rows) or None, if
+      the file is not part of the selected corpus.
+    '''
+    opener = gzip.open if fname.endswith('.gz') else open
+    with opener(fname) as f:
+        forum = load(f)
+    if corpus_include_string and corpus_include_string not in forum['url']:
+        return None
+
+    domain = urlparse(forum['url']).netloc
+    if debug_directory:
+        debug_fname = os.path.join(debug_directory, '{}-{}.html'.format(no, domain))
+        with open(debug_fname, 'w') as g:
+            g.write(forum['html'])
+
+    logging.info('Processing ' + forum['url'])
+    document = Document(forum['html'], forum['url'])
+    extract_post_result = posts.extract_posts(forum['html'], forum['url'], document=document)
+
+    rows = []
+    if extract_post_result['text_xpath_pattern']:
+        rows = [[forum['url'], post.url, post.user, post.date, post.post]
+                for post in extract_posts(forum['html'], forum['url'],
+                                          extract_post_result['text_xpath_pattern'],
+                                          extract_post_result['url_xpath_pattern'],
+                                          extract_post_result['date_xpath_pattern'],
+                                          extract_post_result['user_xpath_pattern'],
+                                          document=document,
+                                          date_format=extract_post_result['date_format'])]
+    return fname, domain, forum['url'], extract_post_result, rows
+
+
+def _process_file(item):
+    no, (fname, content_hash, corpus_include_string, debug_directory) = item
+    try:
+        return fname, content_hash, worker.run_with_budget(process_file, fname, corpus_include_string,
+                                                           debug_directory, no)
+    except BudgetExceeded as e:
+        logging.warning('Giving up on %s: %s budget exceeded in %s', fname, e.reason, e.stage)
+        return fname, content_hash, ABORTED
+    except Exception:
+        logging.exception('Cannot process %s', fname)
+        return fname, content_hash, FAILED
+
+
+def _iter_results(results):
+    '''
+    Yields the results of the files processed by a :class:`harvest.worker.WorkerPool`.
+    '''
+    for (_, (fname, content_hash, *_)), future in results:
+        try:
+            yield future.result()
+        except Exception:
+            # the worker process died
+            logging.exception('Cannot process %s', fname)
+            yield fname, content_hash, FAILED
+
+
+def iter_tasks(corpus_path, corpus_include_string=None, debug_directory=None, journal=None):
+    '''
+    Yields the corpus files that still need to be processed.
+    '''
+    for fname in iter_corpus(corpus_path):
+        content_hash = None
+        if journal:
+            content_hash = get_file_signature(fname)
+            if journal.is_completed(fname, content_hash):
+                continue
+        yield fname, content_hash, corpus_include_string, debug_directory
+
+
+class CsvWriters:
+    '''
+    Long-lived per-domain CSV writers. At most `max_open` files are kept open;
+    the least recently used file is closed (and later reopened in append
+    mode) if this limit is reached. New files are registered with the
+    optional journal before the first row is written.
+
+    Without a journal every run starts over, i.e. existing CSV files are
+    truncated when they are opened for the first time.
+    '''
+
+    def __init__(self, result_directory, max_open=MAX_OPEN_CSV_FILES, journal=None):
+        self.result_directory = result_directory
+        self.max_open = max_open
+        self.journal = journal
+        self._files = OrderedDict()
+        # files that have been opened during this run
+        self._opened = set()
+        # offsets of the files that have been written since the last flush
+        self._offsets = {}
+
+    def _close(self, f):
+        if f.name in self._offsets:
+            f.flush()
+            os.fsync(f.fileno())
+            self._offsets[f.name] = f.tell()
+        f.close()
+
+    def writerows(self, domain, rows):
+        f = self._files.get(domain)
+        if f is None:
+            fname = os.path.join(self.result_directory, f'{domain}.csv')
+            f = open(fname, 'a' if self.journal or fname in self._opened else 'w', newline='')
+            self._opened.add(fname)
+            if self.journal:
+                self.journal.register_output(f.name, f.tell())
+            if f.tell() == 0:
+                writer(f).writerow(CSV_HEADER)
+            self._files[domain] = f
+            while len(self._files) > self.max_open:
+                self._close(self._files.popitem(last=False)[1])
+        self._files.move_to_end(domain)
+        self._offsets[f.name] = None
+        writer(f).writerows(rows)
+
+    def flush(self):
+        '''
+        Flushes the written files to disk.
+
+        Returns:
+          dict -- the offsets of the files written since the last flush.
+        '''
+        for f in self._files.values():
+            if f.name in self._offsets:
+                f.flush()
+                os.fsync(f.fileno())
+                self._offsets[f.name] = f.tell()
+        offsets, self._offsets = self._offsets, {}
+        return offsets
+
+    def close(self):
+        for f in self._files.values():
+            self._close(f)
+        self._files.clear()
+
+
+def _commit(journal, output_file, csv_writers):
+    output_file.flush()
+    os.fsync(output_file.fileno())
+    offsets = {output_file.name: output_file.tell()}
+    if csv_writers:
+        offsets.update(csv_writers.flush())
+    journal.commit(offsets)
+
 
 def extract_to_csv():
     parser = argparse.ArgumentParser(
         description='Forum harvester - extracts and harvests posts + metadata from Web forums')
     parser.add_argument('corpus_path', metavar='corpus_path', help='Path to the input corpus')
-    parser.add_argument('output_file', metavar='output_file', help='Output file for the parser\'s results.')
+    parser.add_argument('output_file', metavar='output_file',
+                        help='Output file for the learned patterns (one JSON object per line).')
 
     parser.add_argument('--result-directory', dest='result_directory',
                         help='Optional directory for storing CSV results.')
     parser.add_argument('--debug-directory', dest='debug_directory', help='Optional directory for debug information.')
     parser.add_argument('--corpus-include-string', dest='corpus_include_string',
                         help='Optionally restrict the input corpus to URLs that match the corpus include string.')
+    parser.add_argument('--workers', dest='workers', type=int, default=1,
+                        help='Number of worker processes (default: 1).')
+    parser.add_argument('--max-pages-per-worker', dest='max_pages_per_worker', type=int,
+                        help='Optionally replace worker processes after the given number of pages '
+                             '(processes the pages in a worker process, even if --workers is 1).')
+    parser.add_argument('--time-limit', dest='time_limit', type=float,
+                        help='Optional wall-clock budget per page in seconds.')
+    parser.add_argument('--memory-limit', dest='memory_limit', type=int,
+                        help='Optional memory budget per page in MB.')
+    parser.add_argument('--journal', dest='journal',
+                        help='Optional SQLite progress journal that allows resuming an interrupted run.')
+    parser.add_argument('--journal-batch-size', dest='journal_batch_size', type=int, default=100,
+                        help='Number of processed files after which the journal is committed (default: 100).')
 
     args = parser.parse_args()
+    if args.workers < 1:
+        parser.error('--workers must be at least 1')
+    if args.max_pages_per_worker is not None and args.max_pages_per_worker < 1:
+        parser.error('--max-pages-per-worker must be at least 1')
 
-    result = defaultdict(list)
+    journal = None
+    if args.journal:
+        journal = ProgressJournal(args.journal, batch_size=args.journal_batch_size)
+        journal.register_output(args.output_file, 0)
+        journal.truncate_outputs()
 
-    for no, fname in enumerate(glob(args.corpus_path + "*.json.gz")):
-        logging.info(fname)
-        opener = gzip.open if fname.endswith(".gz") else open
-        with opener(fname) as f:
-            forum = load(f)
-            domain = urlparse(forum['url']).netloc
-            if args.corpus_include_string and args.corpus_include_string not in forum['url']:
-                continue
+    memory_limit = args.memory_limit * 1024 * 1024 if args.memory_limit else None
+    tasks = enumerate(iter_tasks(args.corpus_path, args.corpus_include_string, args.debug_directory, journal))
+    csv_writers = CsvWriters(args.result_directory, journal=journal) if args.result_directory else None
+    # pages are processed in the main process, unless worker processes are required
+    pool = None
+    if args.workers > 1 or args.max_pages_per_worker:
+        pool = worker.WorkerPool(args.workers, time_limit=args.time_limit, memory_limit=memory_limit,
+                                 max_pages_per_worker=args.max_pages_per_worker)
+        results = _iter_results(pool.imap(_process_file, tasks, ordered=False))
+    else:
+        worker.initialize_worker(time_limit=args.time_limit, memory_limit=memory_limit)
+        results = map(_process_file, tasks)
+    try:
+        with open(args.output_file, 'a' if journal else 'w') as f:
+            for fname, content_hash, result in results:
+                output_offset = None
+                if result is None:
+                    status = SKIPPED
+                elif result in (FAILED, ABORTED):
+                    status = result
+                else:
+                    status = COMPLETED
+                    _, domain, url, extract_post_result, rows = result
+                    output_offset = f.tell()
+                    f.write(dumps({'domain': domain, 'url': url, 'result': extract_post_result}) + '\n')
+                    f.flush()
+                    if csv_writers and rows:
+                        csv_writers.writerows(domain, rows)
 
-            if args.debug_directory:
-                debug_fname = os.path.join(args.debug_directory, "{}-{}.html".format(no, domain))
-                with open(debug_fname, "w") as g:
-                    g.write(forum['html'])
-
-            logging.info("Processing " + forum['url'])
-            extract_post_result = posts.extract_posts(forum['html'], forum['url'])
-            result[domain].append(extract_post_result)
-
-            if args.result_directory and extract_post_result['text_xpath_pattern']:
-                result_fname = os.path.join(args.result_directory, f'{domain}.csv')
-                with open(result_fname, 'a+') as g:
-                    csvwriter = writer(g)
-                    if os.stat(result_fname).st_size == 0:
-                        csvwriter.writerow(['forum_link', 'post_link', 'user', 'date', 'post'])
-                    for post in extract_posts(forum['html'], forum['url'],
-                                              extract_post_result['text_xpath_pattern'],
-                                              extract_post_result['url_xpath_pattern'],
-                                              extract_post_result['date_xpath_pattern'],
-                                              extract_post_result['user_xpath_pattern']):
-                        csvwriter.writerow([forum['url'], post.url, post.user, post.date, post.post])
-
-    with open(args.output_file, "w") as f:
-        dump(result, f, indent=True)
+                if journal:
+                    journal.record(fname, content_hash, status, output_offset)
+                    if journal.pending >= journal.batch_size:
+                        _commit(journal, f, csv_writers)
+            if journal:
+                _commit(journal, f, csv_writers)
+    finally:
+        if pool:
+            pool.close(cancel=True)
+        if csv_writers:
+            csv_writers.close()
+        if journal:
+            journal.close()
 
 
 if __name__ == '__main__':
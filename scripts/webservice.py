@@ -1,75 +1,458 @@
+#!/usr/bin/env python3
 """
-This module is used to provide a web interface for orbis-eval [https://github.com/orbis-eval].
+This module provides a web interface for harvest and for orbis-eval [https://github.com/orbis-eval].
 With orbis-eval the scores of recall, precision and f1 is calculated.
+
+The extraction runs in a pool of preforked worker processes (see harvest.worker.WorkerPool), so that concurrent
+requests are processed in parallel while the HTTP front end only parses and serializes JSON.
+
+Endpoints:
+
+- POST /extract_from_html: extracts the posts of a single page in the orbis-compatible format.
+- POST /extract: extracts the posts of a single page (JSON object with `url` and `html`).
+- POST /extract/apply: extracts the posts of a single page with known xpath patterns (`text_xpath_pattern`,
+  `url_xpath_pattern`, `date_xpath_pattern`, `user_xpath_pattern` and an optional `date_format`), skipping the
+  learning phase. The result's `valid` flag indicates whether the patterns need to be relearned.
+- GET /metrics: service metrics in the Prometheus text format (see harvest.metrics), i.e. latency histograms per
+  extraction stage and page, page size and DOM node count distributions, dateparser calls, cache lookups by cache
+  and result (hit ratio = hits / lookups), errors by stage and error type and the worker pool's load.
+- POST /extract/batch: extracts the posts of many pages. The request body contains one JSON object per line
+  (NDJSON); the response streams one result object (`index`, `url`, `result`, `error`) per line in the order of
+  the request.
+
+`/extract` and `/extract/batch` return the result of harvest.extract_data or, with `?format=orbis`, the
+orbis-compatible output. `/extract/batch?format=apply` applies the known patterns of every page.
+
+Settings (command line arguments or environment variables):
+
+- workers (HARVEST_WORKERS): the number of worker processes.
+- queue depth (HARVEST_QUEUE_DEPTH): the maximum number of pages that are processed or queued. Single page requests
+  are rejected with `503 Service Unavailable` if the queue is full, batch requests wait for free slots.
+- time and memory limit (HARVEST_TIME_LIMIT, HARVEST_MEMORY_LIMIT): optional budget per page in seconds and MB.
+- template store (HARVEST_TEMPLATE_STORE): optional SQLite file for caching learned templates.
+- result cache (HARVEST_RESULT_CACHE_SIZE, HARVEST_RESULT_CACHE): the number of extraction results cached in memory
+  (default: 1024, 0 disables the cache) and an optional SQLite file that persists the most recent 65536 results.
+
+Results are cached by the hash of the page's domain, its HTML and the harvest version (see harvest.result_cache).
+Single page responses carry this hash as ETag; requests with a matching `If-None-Match` header are answered with
+`304 Not Modified` without any extraction.
+
+In production, serve the app returned by `get_flask_app()` with a single multi-threaded WSGI server process, e.g.
+`gunicorn --workers 1 --threads 16 'webservice:get_flask_app()'`.
 """
 
-from flask import Flask
-from flask import request
-from flask import jsonify
+import argparse
+import json
+import os
+import time
+
+from collections import deque, namedtuple
+from threading import BoundedSemaphore
 
-import harvest.posts as posts
-import harvest.extract as extract
+from flask import Flask, Response, jsonify, request, stream_with_context
+
+from harvest import apply_template, metrics, worker
+from harvest.batch import BatchResult
+from harvest.result_cache import ResultCache, get_result_key
+from harvest.template_store import Template
 from corpus.createGoldDocuments.calculate_position import get_start_end_for_post
 
+ORBIS_TYPES = ('user', 'datetime', 'post_link', 'post_text')
+# supported output formats: the result of harvest.extract_data, the orbis-compatible output and the result of
+# harvest.apply_template
+FORMATS = ('harvest', 'orbis', 'apply')
+RESULT_CACHE_SIZE = 1024
+
+PAGE_SIZE_BUCKETS = tuple(1024 * 4 ** exponent for exponent in range(9))
+DOM_NODE_BUCKETS = tuple(100 * 4 ** exponent for exponent in range(9))
+
+# the result of a page processed by the workers and its measurements (see harvest.metrics.PageMetrics)
+PageResult = namedtuple('PageResult', ('result', 'error', 'error_type', 'metrics'))
+
 app = Flask('harvest')
+service = None
+result_cache = None
+
+registry = metrics.Registry()
+STAGE_DURATION = registry.histogram('harvest_stage_duration_seconds', 'Duration of the extraction stages of a page.')
+PAGE_DURATION = registry.histogram('harvest_page_duration_seconds', 'Duration of the extraction of a page.')
+PAGE_SIZE = registry.histogram('harvest_page_size_bytes', 'Size of the HTML of the processed pages.',
+                               PAGE_SIZE_BUCKETS)
+DOM_NODES = registry.histogram('harvest_dom_nodes', 'Number of DOM nodes of the processed pages.', DOM_NODE_BUCKETS)
+PAGES = registry.counter('harvest_pages_total', 'Processed pages by format and status.')
+DATEPARSER_CALLS = registry.counter('harvest_dateparser_calls_total', 'Calls to dateparser.')
+CACHE_LOOKUPS = registry.counter('harvest_cache_lookups_total', 'Cache lookups by cache and result (hit or miss).')
+ERRORS = registry.counter('harvest_errors_total', 'Failed pages by stage and error type.')
+REJECTED = registry.counter('harvest_rejected_requests_total', 'Requests rejected because the queue was full.')
+WORKERS = registry.gauge('harvest_workers', 'Number of worker processes.')
+QUEUE_DEPTH = registry.gauge('harvest_queue_depth', 'Maximum number of pages processed or queued.')
+IN_FLIGHT = registry.gauge('harvest_pages_in_flight', 'Number of pages processed or queued.')
+
+
+def get_orbis_result(forum, posts):
+    '''
+    Converts the posts extracted from a forum page into the orbis-compatible
+    format.
+    '''
+    if forum.get('gold_standard_format'):
+        return [{item: {'surface_form': post.get(item)} for item in ORBIS_TYPES} for post in posts]
+
+    results = {'entities': {}}
+    doc_id = forum['url']
+    search_start_index = 0
+    for post in posts:
+        post_dict = {item: {'surface_form': post.get(item)} for item in ORBIS_TYPES}
+        if 'text' in forum:
+            new_search_start_index = get_start_end_for_post(post_dict, forum['text'], search_start_index,
+                                                            fuzzy_search=True)
+            if new_search_start_index > 0:
+                search_start_index = new_search_start_index
+
+        results['entities'][doc_id] = results['entities'].get(doc_id, [])
+        for item in ORBIS_TYPES:
+            result = {
+                'doc_id': doc_id,
+                'type': item,
+                'surface_form': post_dict[item]['surface_form']
+            }
+            if 'start' in post_dict[item] and 'end' in post_dict[item]:
+                result['start'] = post_dict[item]['start']
+                result['end'] = post_dict[item]['end']
+
+            results['entities'][doc_id].append(result)
+    return results
+
+
+def _process_page(forum, output_format='harvest'):
+    start = time.perf_counter()
+    with metrics.record_page() as page_metrics:
+        metrics.observe('page_bytes', len(forum['html'].encode('utf-8', 'surrogatepass')))
+        try:
+            if output_format == 'apply':
+                result = worker.run_with_budget(apply_template, forum['html'], forum['url'],
+                                          *(forum.get(field) for field in Template._fields))
+            else:
+                posts = worker.extract_data(forum['html'], forum['url'])
+                result = get_orbis_result(forum, posts['posts']) if output_format == 'orbis' else posts
+        except Exception as e:
+            return PageResult(None, worker.format_error(e), type(e).__name__, page_metrics)
+        finally:
+            metrics.observe('duration', time.perf_counter() - start)
+    return PageResult(result, None, None, page_metrics)
+
+
+class ExtractionService:
+    '''
+    A pool of preforked extraction workers with a bounded queue.
+
+    Args:
+      workers (int): the number of worker processes (default: the number of
+        CPUs).
+      queue_depth (int): the maximum number of pages that are processed or
+        queued at the same time (default: four times the number of workers).
+      template_store_path (str): an optional SQLite file that backs the
+        template store of every worker.
+      time_limit (float): an optional wall-clock budget per page in seconds.
+      memory_limit (int): an optional memory budget per page in bytes.
+    '''
+
+    def __init__(self, workers=None, queue_depth=None, template_store_path=None, time_limit=None,
+                 memory_limit=None):
+        self.workers = workers or os.cpu_count() or 1
+        self.queue_depth = queue_depth or 4 * self.workers
+        self._slots = BoundedSemaphore(self.queue_depth)
+        self._pool = worker.WorkerPool(self.workers, template_store_path, time_limit, memory_limit)
+
+    def _release(self, _):
+        IN_FLIGHT.dec()
+        self._slots.release()
+
+    def submit(self, forum, output_format='harvest', block=True):
+        '''
+        Queues a page for extraction.
+
+        Returns:
+          Future -- the pending result or None, if the queue is full and
+          `block` is False.
+        '''
+        if not self._slots.acquire(blocking=block):
+            return None
+        IN_FLIGHT.inc()
+        try:
+            future = self._pool.submit(_process_page, forum, output_format)
+        except Exception:
+            self._release(None)
+            raise
+        future.add_done_callback(self._release)
+        return future
+
+    def close(self):
+        self._pool.close(cancel=True)
+
+
+class _CachedResult:
+    '''
+    A result obtained from the result cache, which behaves like the pending
+    results of the worker pool.
+    '''
+
+    def __init__(self, result):
+        self._result = result
+
+    def done(self):
+        return True
+
+    def result(self):
+        return PageResult(self._result, None, None, None)
+
+
+class ExtractionError(Exception):
+    '''
+    The extraction of a page failed in a worker.
+    '''
+
+
+def _record_metrics(page_result, output_format):
+    PAGES.inc(format=output_format, status='error' if page_result.error else 'ok')
+    page_metrics = page_result.metrics
+    if page_metrics is None:
+        return
+
+    for stage, duration in page_metrics.stages.items():
+        STAGE_DURATION.observe(duration, stage=stage)
+    PAGE_DURATION.observe(page_metrics.values['duration'], format=output_format)
+    PAGE_SIZE.observe(page_metrics.values['page_bytes'])
+    if 'dom_nodes' in page_metrics.values:
+        DOM_NODES.observe(page_metrics.values['dom_nodes'])
+
+    counters = page_metrics.counters
+    DATEPARSER_CALLS.inc(counters['dateparser_calls'])
+    CACHE_LOOKUPS.inc(counters['date_cache_lookups'] - counters['dateparser_calls'], cache='date', result='hit')
+    CACHE_LOOKUPS.inc(counters['dateparser_calls'], cache='date', result='miss')
+    CACHE_LOOKUPS.inc(counters['template_store_hits'], cache='template', result='hit')
+    CACHE_LOOKUPS.inc(counters['template_store_misses'], cache='template', result='miss')
+    if page_result.error:
+        ERRORS.inc(stage=page_metrics.failed_stage or 'unknown', type=page_result.error_type)
+
+
+def _get_page_result(future, output_format):
+    '''
+    Waits for the result of a page and records its metrics.
+
+    Raises:
+      ExtractionError: if the extraction of the page failed.
+    '''
+    try:
+        page_result = future.result()
+    except Exception as e:
+        # the worker process died (see harvest.worker.WorkerPool)
+        ERRORS.inc(stage='worker', type=type(e).__name__)
+        page_result = PageResult(None, worker.format_error(e), type(e).__name__, None)
+    _record_metrics(page_result, output_format)
+    if page_result.error:
+        raise ExtractionError(page_result.error)
+    return page_result.result
+
+
+def _get_cache_key(forum, output_format):
+    '''
+    Returns:
+      str -- the result cache key of the page or None, if the result cache
+      is disabled.
+    '''
+    if result_cache is None:
+        return None
+    if output_format == 'orbis':
+        variant = (forum.get('text'), bool(forum.get('gold_standard_format')))
+    elif output_format == 'apply':
+        variant = tuple(forum.get(field) for field in Template._fields)
+    else:
+        variant = ()
+    return get_result_key(forum['url'], forum['html'], output_format, *variant)
+
+
+def _submit(forum, output_format, key, block=True):
+    '''
+    Returns:
+      the cached or pending result of the page.
+    '''
+    result = result_cache.get(key) if key else None
+    if key:
+        CACHE_LOOKUPS.inc(cache='result', result='miss' if result is None else 'hit')
+    if result is not None:
+        return _CachedResult(result)
+    return service.submit(forum, output_format, block=block)
+
+
+def _get_request_error(forum, output_format):
+    '''
+    Returns:
+      str -- the reason why the page cannot be processed or None, if it is
+      a valid request.
+    '''
+    if not isinstance(forum, dict) or not forum.get('url') or not isinstance(forum.get('html'), str):
+        return 'the request requires a `url` and `html`'
+    if output_format == 'apply' and not forum.get('text_xpath_pattern'):
+        return 'the request requires a `text_xpath_pattern`'
+    return None
+
+
+def _get_result(forum, output_format):
+    error = _get_request_error(forum, output_format)
+    if error:
+        return jsonify({'error': error}), 400
+    if output_format not in FORMATS:
+        return jsonify({'error': f'unknown format {output_format}'}), 400
+
+    key = _get_cache_key(forum, output_format)
+    if key and request.if_none_match.contains(key):
+        response = Response(status=304)
+        response.set_etag(key)
+        return response
+
+    future = _submit(forum, output_format, key, block=False)
+    if future is None:
+        REJECTED.inc()
+        return jsonify({'error': 'the extraction queue is full'}), 503, {'Retry-After': '1'}
+    try:
+        result = _get_page_result(future, output_format)
+    except ExtractionError as e:
+        return jsonify({'error': str(e)}), 500
+
+    response = jsonify(result)
+    if key:
+        if not isinstance(future, _CachedResult):
+            result_cache.put(key, result)
+        response.set_etag(key)
+    return response
 
 
 @app.route('/extract_from_html', methods=['POST'])
 def events():
-    forum = request.json
-    post_0 = posts.extract_posts(forum['html'], forum['url'])
+    return _get_result(request.json, 'orbis')
+
+
+@app.route('/extract', methods=['POST'])
+def extract():
+    return _get_result(request.json, request.args.get('format', 'harvest'))
+
+
+@app.route('/extract/apply', methods=['POST'])
+def extract_apply():
+    return _get_result(request.json, 'apply')
+
 
-    if 'gold_standard_format' in forum and forum['gold_standard_format']:
-        results = []
+def _serialize(index, url, key, future, output_format):
+    if isinstance(future, Exception):
+        batch_result = BatchResult(index, url, None, worker.format_error(future))
     else:
-        results = {'entities': {}}
-    if post_0['text_xpath_pattern']:
-        search_start_index = 0
-        for post_1 in extract.extract_posts(
-                forum['html'],
-                forum['url'],
-                post_0['text_xpath_pattern'],
-                post_0['url_xpath_pattern'],
-                post_0['date_xpath_pattern'],
-                post_0['user_xpath_pattern'], result_as_datetime=False):
-
-            post_dict = {
-                'user': {'surface_form': post_1.user},
-                'datetime': {'surface_form': post_1.date},
-                'post_link': {'surface_form': post_1.url},
-                'post_text': {'surface_form': post_1.post}
-            }
+        try:
+            batch_result = BatchResult(index, url, _get_page_result(future, output_format), None)
+            if key and not isinstance(future, _CachedResult):
+                result_cache.put(key, batch_result.result)
+        except ExtractionError as e:
+            batch_result = BatchResult(index, url, None, str(e))
+    return json.dumps(batch_result._asdict()) + '\n'
 
-            doc_id = forum['url']
 
-            if 'gold_standard_format' in forum and forum['gold_standard_format']:
-                results.append(post_dict)
-            else:
-                if 'text' in forum:
-                    new_search_start_index = get_start_end_for_post(post_dict, forum['text'], search_start_index,
-                                                                    fuzzy_search=True)
-                    if new_search_start_index > 0:
-                        search_start_index = new_search_start_index
+def _extract_batch(lines, output_format):
+    '''
+    Submits the pages of an NDJSON request and yields their results in
+    request order. At most `queue_depth` pages of a request are pending, so
+    that slow requests apply back pressure to the client.
+    '''
+    pending = deque()
+    index = 0
+    for line in lines:
+        if not line.strip():
+            continue
+        try:
+            forum = json.loads(line)
+            error = _get_request_error(forum, output_format)
+            if error:
+                raise ValueError(error)
+            key = _get_cache_key(forum, output_format)
+            pending.append((index, forum['url'], key, _submit(forum, output_format, key)))
+        except Exception as e:
+            pending.append((index, None, None, e))
+        index += 1
+        while pending and (len(pending) >= service.queue_depth or
+                           isinstance(pending[0][3], Exception) or pending[0][3].done()):
+            yield _serialize(*pending.popleft(), output_format)
+    while pending:
+        yield _serialize(*pending.popleft(), output_format)
+
+
+@app.route('/extract/batch', methods=['POST'])
+def extract_batch():
+    output_format = request.args.get('format', 'harvest')
+    if output_format not in FORMATS:
+        return jsonify({'error': f'unknown format {output_format}'}), 400
+    return Response(stream_with_context(_extract_batch(request.stream, output_format)),
+                    mimetype='application/x-ndjson')
 
-                results['entities'][doc_id] = results['entities'].get(doc_id, [])
-                for item in ['user', 'datetime', 'post_link', 'post_text']:
-                    result = {
-                        'doc_id': doc_id,
-                        'type': item,
-                        'surface_form': post_dict[item]['surface_form']
-                    }
-                    if 'start' in post_dict[item] and 'end' in post_dict[item]:
-                        result['start'] = post_dict[item]['start']
-                        result['end'] = post_dict[item]['end']
 
-                    results['entities'][doc_id].append(result)
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+    return Response(registry.expose(), mimetype='text/plain; version=0.0.4')
 
-    return jsonify(results)
 
+def _get_setting(name, convert=str):
+    value = os.environ.get(name)
+    return convert(value) if value else None
 
-def get_flask_app():
+
+def get_flask_app(workers=None, queue_depth=None, template_store_path=None, time_limit=None, memory_limit=None,
+                  result_cache_size=None, result_cache_path=None):
+    '''
+    Returns the Flask app and starts its extraction workers. Settings that
+    are not given are read from the environment (see module documentation).
+    '''
+    global service, result_cache
+    if result_cache_size is None:
+        result_cache_size = _get_setting('HARVEST_RESULT_CACHE_SIZE', int)
+    if result_cache is None and result_cache_size != 0:
+        result_cache = ResultCache(max_size=result_cache_size or RESULT_CACHE_SIZE,
+                                   path=result_cache_path or _get_setting('HARVEST_RESULT_CACHE'))
+    if service is None:
+        memory_limit = memory_limit or _get_setting('HARVEST_MEMORY_LIMIT', int)
+        service = ExtractionService(workers=workers or _get_setting('HARVEST_WORKERS', int),
+                                    queue_depth=queue_depth or _get_setting('HARVEST_QUEUE_DEPTH', int),
+                                    template_store_path=template_store_path or _get_setting('HARVEST_TEMPLATE_STORE'),
+                                    time_limit=time_limit or _get_setting('HARVEST_TIME_LIMIT', float),
+                                    memory_limit=memory_limit * 1024 * 1024 if memory_limit else None)
+        WORKERS.set(service.workers)
+        QUEUE_DEPTH.set(service.queue_depth)
+        IN_FLIGHT.inc(0)
+        REJECTED.inc(0)
     return app
 
 
+def main():
+    parser = argparse.ArgumentParser(description='Forum harvester - web service')
+    parser.add_argument('--host', default='127.0.0.1', help='Interface to listen on (default: 127.0.0.1).')
+    parser.add_argument('--port', type=int, default=5000, help='Port to listen on (default: 5000).')
+    parser.add_argument('--workers', type=int, help='Number of worker processes (default: number of CPUs).')
+    parser.add_argument('--queue-depth', dest='queue_depth', type=int,
+                        help='Maximum number of pages processed or queued (default: 4 * workers).')
+    parser.add_argument('--template-store', dest='template_store_path',
+                        help='Optional SQLite file for caching learned templates.')
+    parser.add_argument('--time-limit', dest='time_limit', type=float,
+                        help='Optional wall-clock budget per page in seconds.')
+    parser.add_argument('--memory-limit', dest='memory_limit', type=int, help='Optional memory budget per page in MB.')
+    parser.add_argument('--result-cache-size', dest='result_cache_size', type=int,
+                        help='Number of results cached in memory (default: 1024, 0 disables the cache).')
+    parser.add_argument('--result-cache', dest='result_cache_path',
+                        help='Optional SQLite file that persists the cached results.')
+    args = parser.parse_args()
+
+    get_flask_app(args.workers, args.queue_depth, args.template_store_path, args.time_limit, args.memory_limit,
+                  args.result_cache_size, args.result_cache_path)
+    try:
+        app.run(host=args.host, port=args.port, threaded=True)
+    finally:
+        service.close()
+
+
 if __name__ == '__main__':
-    app.run(port=5000, debug=True)
+    main()
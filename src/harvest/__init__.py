@@ -22,8 +22,12 @@ try:
     import re
     from lxml.html import fromstring
 
-    from harvest import posts
+    from harvest import metrics, posts
+    from harvest.document import Document
     from harvest.extract import extract_posts
+    from harvest.template_store import Template, TemplateStore, get_template, is_valid_extraction
+    from harvest.batch import BatchResult, extract_many
+    from harvest.result_cache import ResultCache, get_result_key
 
 except ImportError:
     import warnings
@@ -34,22 +38,77 @@ except ImportError:
 RE_STRIP_XML_DECLARATION = re.compile(r'^<\?xml [^>]+?\?>')
 
 
-def extract_data(html, url):
+def _apply_template(document, url, template):
+    return extract_posts(document.html, url, template.text_xpath_pattern, template.url_xpath_pattern,
+                         template.date_xpath_pattern, template.user_xpath_pattern,
+                         result_as_datetime=False, document=document, date_format=template.date_format)
+
+
+@metrics.accepts_sink
+def extract_data(html, url, template_store=None):
     """
     Extracts posts from an html
     Args:
     html (string): html of the web forum
     url (string): the url to the html
+    template_store (TemplateStore): optional store of learned templates. Known forums skip the learning phase
+                                    and are relearned if the cached template does not yield valid posts anymore.
+    sink (InstrumentationSink): optional sink that receives the timings and counters of the extraction stages
+                                (default: the sink of the current context, see harvest.metrics)
     Returns:
     Dictionary: posts with metadata
     """
-    extract_post_result = posts.extract_posts(html, url)
-    extraction_results = extract_posts(html, url, extract_post_result['text_xpath_pattern'],
-                                       extract_post_result['url_xpath_pattern'],
-                                       extract_post_result['date_xpath_pattern'],
-                                       extract_post_result['user_xpath_pattern'],
-                                       result_as_datetime=False)
+    document = Document(html, url)
+    extraction_results = None
+    template = template_store.get(url) if template_store is not None else None
+    if template_store is not None:
+        metrics.increment('template_store_hits' if template is not None else 'template_store_misses')
+    if template is not None:
+        extraction_results = _apply_template(document, url, template)
+        if not is_valid_extraction(extraction_results):
+            template_store.discard(url)
+            extraction_results = None
+
+    if extraction_results is None:
+        extract_post_result = posts.extract_posts(html, url, document=document)
+        if not extract_post_result['text_xpath_pattern']:
+            # no posts have been identified on the page
+            return {"posts": []}
+
+        extraction_results = extract_posts(html, url, extract_post_result['text_xpath_pattern'],
+                                           extract_post_result['url_xpath_pattern'],
+                                           extract_post_result['date_xpath_pattern'],
+                                           extract_post_result['user_xpath_pattern'],
+                                           result_as_datetime=False, document=document,
+                                           date_format=extract_post_result['date_format'])
+        template = get_template(extract_post_result)
+        if template_store is not None and template is not None and is_valid_extraction(extraction_results):
+            template_store.put(url, template)
 
+    return {"posts": _get_posts(extraction_results)}
+
+
+@metrics.accepts_sink
+def apply_template(html, url, text_xpath_pattern, url_xpath_pattern=None, date_xpath_pattern=None,
+                   user_xpath_pattern=None, date_format=None):
+    """
+    Extracts posts from an html with the known patterns of its forum, skipping the learning phase of extract_data
+    Args:
+    html (string): html of the web forum
+    url (string): the url to the html
+    text_xpath_pattern, url_xpath_pattern, date_xpath_pattern, user_xpath_pattern (string): the forum's xpath patterns
+    date_format (string): the forum's optional date format (see harvest.date_format)
+    sink (InstrumentationSink): optional sink that receives the timings and counters of the extraction stages
+    Returns:
+    Dictionary: posts with metadata and the flag `valid`, which is False if the patterns do not yield valid posts
+                (anymore) and need to be relearned with extract_data
+    """
+    template = Template(text_xpath_pattern, url_xpath_pattern, date_xpath_pattern, user_xpath_pattern, date_format)
+    extraction_results = _apply_template(Document(html, url), url, template)
+    return {"posts": _get_posts(extraction_results), "valid": is_valid_extraction(extraction_results)}
+
+
+def _get_posts(extraction_results):
     final_results = []
     for extraction_result in extraction_results:
         entity = {'post_text': extraction_result.post}
@@ -60,5 +119,4 @@ def extract_data(html, url):
         if hasattr(extraction_result, 'user'):
             entity['user'] = extraction_result.user
         final_results.append(entity)
-
-    return {"posts": final_results}
+    return final_results
@@ -0,0 +1,192 @@
+'''
+asyncio interface to harvest.
+
+The extraction is CPU bound and, therefore, runs in a pool of worker
+processes that is managed by an :class:`AsyncExtractor`. The number of pages
+in flight is bounded, so that a crawler can feed pages at any rate without
+queueing an unbounded amount of HTML in memory.
+
+Example::
+
+   async with AsyncExtractor(workers=4) as extractor:
+       result = await extractor.extract_data(html, url)
+       async for batch_result in extractor.extract_many(pages):
+           ...
+
+The module level :func:`extract_data` and :func:`extract_many` functions use
+a shared default extractor.
+'''
+
+import asyncio
+import os
+
+from collections import deque
+
+from harvest.batch import BatchResult
+from harvest.worker import WorkerPool, extract_data as _extract_data, format_error
+
+# the default extractor used by the module level functions
+_default_extractor = None
+
+
+async def _aenumerate(pages):
+    index = 0
+    if hasattr(pages, '__aiter__'):
+        async for page in pages:
+            yield index, page
+            index += 1
+    else:
+        for page in pages:
+            yield index, page
+            index += 1
+
+
+class AsyncExtractor:
+    '''
+    Runs :func:`harvest.extract_data` on a managed pool of worker processes.
+
+    Args:
+      workers (int): the number of worker processes (default: the number of
+        CPUs).
+      max_concurrency (int): the maximum number of pages that are processed or
+        queued at the same time (default: twice the number of workers).
+      template_store_path (str): an optional SQLite file that backs the
+        :class:`harvest.TemplateStore` of every worker.
+      time_limit (float): an optional wall-clock budget per page in seconds.
+      memory_limit (int): an optional memory budget per page in bytes.
+      max_pages_per_worker (int): replace the worker processes after they
+        have processed the given number of pages on average. The extractor
+        then starts a new pool of workers, while the previous pool finishes
+        its pages and shuts down.
+
+    Pages that exceed their budget raise
+    :class:`harvest.budget.BudgetExceeded`. A page that exceeds its memory
+    budget retires the pool of workers that processed it (see
+    :class:`harvest.worker.WorkerPool`).
+
+    Cancelling a pending extraction removes the page from the pool's queue;
+    a page that is already being processed by a worker finishes in the
+    background and its result is discarded.
+    '''
+
+    def __init__(self, workers=None, max_concurrency=None, template_store_path=None, time_limit=None,
+                 memory_limit=None, max_pages_per_worker=None):
+        self.workers = workers or os.cpu_count() or 1
+        self.max_concurrency = max_concurrency or 2 * self.workers
+        self._pool = WorkerPool(self.workers, template_store_path, time_limit, memory_limit, max_pages_per_worker)
+        # the semaphore is bound to the event loop it is used in
+        self._loop = None
+        self._semaphore = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _get_semaphore(self, loop):
+        if self._loop is not loop:
+            self._loop = loop
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self._semaphore
+
+    def close(self):
+        '''
+        Shuts the worker processes down and cancels all queued pages.
+        '''
+        self._pool.close(cancel=True)
+
+    async def extract_data(self, html, url):
+        '''
+        Extracts posts from an html.
+
+        Args:
+          html (str): html of the web forum.
+          url (str): the url to the html.
+
+        Returns:
+          dict -- the posts with metadata as returned by
+          :func:`harvest.extract_data`. Exceptions raised by the extraction
+          are propagated to the caller.
+        '''
+        loop = asyncio.get_event_loop()
+        async with self._get_semaphore(loop):
+            return await asyncio.wrap_future(self._pool.submit(_extract_data, html, url), loop=loop)
+
+    async def _extract_page(self, index, html, url):
+        try:
+            return BatchResult(index, url, await self.extract_data(html, url), None)
+        except Exception as e:
+            return BatchResult(index, url, None, format_error(e))
+
+    async def extract_many(self, pages, ordered=True):
+        '''
+        Extracts the posts of many forum pages.
+
+        Args:
+          pages: an iterable or asynchronous iterable of (html, url) tuples.
+            Pages are only consumed as long as less than `max_concurrency`
+            pages are in flight.
+          ordered (bool): yield the results in the order of `pages`. Otherwise
+            results are yielded as soon as they are available.
+
+        Returns:
+          async generator -- a :class:`harvest.BatchResult` for every page
+          (see :func:`harvest.extract_many`). Closing the generator cancels
+          all pending pages.
+        '''
+        pending = deque()
+        try:
+            async for index, (html, url) in _aenumerate(pages):
+                pending.append(asyncio.ensure_future(self._extract_page(index, html, url)))
+                if len(pending) >= self.max_concurrency:
+                    for result in await self._next_results(pending, ordered):
+                        yield result
+            while pending:
+                for result in await self._next_results(pending, ordered):
+                    yield result
+        finally:
+            for task in pending:
+                task.cancel()
+
+    @staticmethod
+    async def _next_results(pending, ordered):
+        '''
+        Waits for the next result(s) and removes them from `pending`.
+        '''
+        if ordered:
+            return [await pending.popleft()]
+
+        done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+        for task in done:
+            pending.remove(task)
+        return sorted((task.result() for task in done), key=lambda result: result.index)
+
+
+def get_default_extractor():
+    '''
+    Returns:
+      AsyncExtractor -- the extractor used by the module level functions,
+      which is created on first use.
+    '''
+    global _default_extractor
+    if _default_extractor is None:
+        _default_extractor = AsyncExtractor()
+    return _default_extractor
+
+
+async def extract_data(html, url):
+    '''
+    Extracts posts from an html with the default extractor (see
+    :meth:`AsyncExtractor.extract_data`).
+    '''
+    return await get_default_extractor().extract_data(html, url)
+
+
+async def extract_many(pages, ordered=True):
+    '''
+    Extracts the posts of many forum pages with the default extractor (see
+    :meth:`AsyncExtractor.extract_many`).
+    '''
+    async for result in get_default_extractor().extract_many(pages, ordered=ordered):
+        yield result
@@ -0,0 +1,79 @@
+'''
+Extracts posts from many forum pages in parallel.
+
+:func:`extract_many` distributes the pages over a pool of worker processes,
+each of which imports harvest and its heavy dependencies (dateparser,
+inscriptis) only once (see :mod:`harvest.worker`). Errors are captured per
+page, so that a single malformed page does not abort the whole batch. Optional per-page time and
+memory budgets (see :mod:`harvest.budget`) abort pathological pages; the workers
+are replaced by fresh processes after a page exceeded its memory budget or a
+worker died (see :class:`harvest.worker.WorkerPool`).
+'''
+
+from collections import namedtuple
+from itertools import islice
+
+from harvest.worker import WorkerPool, extract_data, format_error
+
+BatchResult = namedtuple('BatchResult', ('index', 'url', 'result', 'error'))
+
+
+def _extract_page(index, html, url):
+    try:
+        return BatchResult(index, url, extract_data(html, url), None)
+    except Exception as e:
+        return BatchResult(index, url, None, format_error(e))
+
+
+def _extract_pages(chunk):
+    return [_extract_page(index, html, url) for index, (html, url) in chunk]
+
+
+def _iter_chunks(pages, chunksize):
+    pages = enumerate(pages)
+    chunk = list(islice(pages, chunksize))
+    while chunk:
+        yield chunk
+        chunk = list(islice(pages, chunksize))
+
+
+def extract_many(pages, workers=None, chunksize=1, ordered=True, template_store_path=None, time_limit=None,
+                 memory_limit=None, max_pages_per_worker=None):
+    '''
+    Extracts the posts of many forum pages with a pool of worker processes.
+
+    Args:
+      pages: an iterable of (html, url) tuples.
+      workers (int): the number of worker processes (default: the number of
+        CPUs).
+      chunksize (int): the number of pages sent to a worker at once.
+      ordered (bool): yield the results in the order of `pages`. Otherwise
+        results are yielded as soon as they are available.
+      template_store_path (str): an optional SQLite file that backs the
+        :class:`harvest.TemplateStore` of every worker.
+      time_limit (float): an optional wall-clock budget per page in seconds.
+      memory_limit (int): an optional budget for the memory a worker may
+        allocate per page in bytes.
+      max_pages_per_worker (int): replace the worker processes after they
+        have processed the given number of pages on average, which releases
+        the memory retained from large pages.
+
+    Returns:
+      generator -- a :class:`BatchResult` for every page that contains the
+      page's index in `pages`, its URL and either the result of
+      :func:`harvest.extract_data` or the error message of the exception
+      raised for the page. Pages that exceed their budget are reported with
+      a :class:`harvest.budget.BudgetExceeded` error that names the
+      exceeded budget and the stage that was running.
+    '''
+    pool = WorkerPool(workers, template_store_path, time_limit, memory_limit, max_pages_per_worker)
+    try:
+        for chunk, future in pool.imap(_extract_pages, _iter_chunks(pages, max(chunksize, 1)), ordered=ordered):
+            try:
+                yield from future.result()
+            except Exception as e:
+                # the worker process died
+                error = format_error(e)
+                yield from (BatchResult(index, url, None, error) for index, (_, url) in chunk)
+    finally:
+        pool.close(cancel=True)
@@ -0,0 +1,109 @@
+'''
+Per-page time and memory budgets.
+
+A few pathological pages (e.g. huge DOMs with thousands of candidate
+sections) take minutes to process. :func:`page_budget` aborts the processing
+of such a page with a :class:`BudgetExceeded` exception that names the
+exceeded budget and the harvest function (stage) that was running, so that
+batch workers can give up on the page and continue with the next one.
+
+Budgets are checked by an interval timer (``SIGALRM``) and are, therefore,
+only enforced in the main thread of a process on platforms that support
+:func:`signal.setitimer`. Long running calls into C extensions (e.g. a
+single lxml XPath query) are aborted as soon as they return.
+'''
+
+import os
+import signal
+import threading
+import time
+
+from contextlib import contextmanager
+
+# interval in seconds in which the budgets are checked
+BUDGET_CHECK_INTERVAL = 0.05
+
+PAGE_SIZE = os.sysconf('SC_PAGE_SIZE') if hasattr(os, 'sysconf') else 4096
+
+
+class BudgetExceeded(Exception):
+    '''
+    Raised if processing a page exceeds its time or memory budget.
+
+    Args:
+      reason (str): the exceeded budget (``time`` or ``memory``).
+      stage (str): the harvest function that was running when the budget
+        was exceeded.
+    '''
+
+    def __init__(self, reason, stage):
+        super().__init__(f'{reason} budget exceeded in {stage}')
+        self.reason = reason
+        self.stage = stage
+
+    def __reduce__(self):
+        return BudgetExceeded, (self.reason, self.stage)
+
+
+def get_memory_usage():
+    '''
+    Returns:
+      int -- the resident set size of the current process in bytes or None,
+      if it cannot be determined on this platform.
+    '''
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * PAGE_SIZE
+    except (OSError, IndexError, ValueError):
+        return None
+
+
+def _get_stage(frame):
+    '''
+    Returns:
+      str -- the innermost harvest function of the given stack.
+    '''
+    while frame is not None:
+        module = frame.f_globals.get('__name__', '')
+        if module.startswith('harvest.') and module != __name__:
+            return f'{module}.{frame.f_code.co_name}'
+        frame = frame.f_back
+    return 'unknown'
+
+
+@contextmanager
+def page_budget(time_limit=None, memory_limit=None):
+    '''
+    Aborts the enclosed block with :class:`BudgetExceeded`, if it exceeds the
+    given budgets. The exception is raised again at every check until the
+    block has been left.
+
+    Args:
+      time_limit (float): the maximum wall-clock time in seconds.
+      memory_limit (int): the maximum increase of the process' memory usage
+        in bytes.
+    '''
+    if memory_limit is not None and get_memory_usage() is None:
+        memory_limit = None
+    if (time_limit is None and memory_limit is None) or not hasattr(signal, 'setitimer') \
+            or threading.current_thread() is not threading.main_thread():
+        yield
+        return
+
+    start = time.monotonic()
+    baseline = get_memory_usage() if memory_limit is not None else None
+
+    def check_budget(signum, frame):
+        if time_limit is not None and time.monotonic() - start > time_limit:
+            raise BudgetExceeded('time', _get_stage(frame))
+        if baseline is not None and get_memory_usage() - baseline > memory_limit:
+            raise BudgetExceeded('memory', _get_stage(frame))
+
+    interval = min(BUDGET_CHECK_INTERVAL, time_limit) if time_limit else BUDGET_CHECK_INTERVAL
+    previous_handler = signal.signal(signal.SIGALRM, check_budget)
+    signal.setitimer(signal.ITIMER_REAL, interval, interval)
+    try:
+        yield
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        signal.signal(signal.SIGALRM, previous_handler)
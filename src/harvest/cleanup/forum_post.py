@@ -6,6 +6,8 @@ Removes common suffixes and suffixes from forum posts.
 
 import logging
 
+from harvest import metrics
+
 def compute_common_suffix_count(post_list):
     '''
     Returns:
@@ -58,10 +60,13 @@ def remove_prefix(post_list):
     return [' '.join(posts.split(' ')[prefix_count:]) for posts in post_list]
 
 
+@metrics.timed('boilerplate_removal')
 def remove_boilerplate(post_list):
     '''
     Removes common prefixes and suffixes from list posts.
     '''
+    if not post_list:
+        return post_list
     prefix_count = compute_common_prefix_count(post_list)
     suffix_count = compute_common_suffix_count(post_list)
     logging.info(f'{prefix_count}>>{suffix_count}')
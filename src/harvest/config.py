@@ -1 +1,4 @@
-LANGUAGES = ('en', 'de', 'es')
\ No newline at end of file
+# languages considered for resolving dates
+LANGUAGES = ('en', 'de', 'es')
+# language that is always considered in addition to the page language (see harvest.language)
+FALLBACK_LANGUAGE = 'en'
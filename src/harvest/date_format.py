@@ -0,0 +1,297 @@
+'''
+Learns the surface format of a forum's post dates.
+
+The post dates of a forum nearly always share a single format. Instead of
+resolving every post date with dateparser's multilingual search,
+:func:`learn_date_format` describes the format of the dates found on the
+learning page by a compact format string, which is stored with the forum's
+template. :func:`parse_date` uses this format for parsing the dates of
+subsequent pages; texts that do not match the format are still resolved by
+dateparser.
+
+A format is only learned, if it reproduces dateparser's result for every
+date of the learning page and no other format does so.
+
+Format strings use the following directives (whitespace matches any
+whitespace and all other characters are literals):
+
+======  ==============================================================
+``%[``  start of the date mention that is returned as date string
+``%]``  end of the date mention
+``%d``  day of the month
+``%o``  ordinal suffix of the day (e.g. "st" or "th")
+``%m``  month as a number
+``%b``  month name or abbreviation
+``%a``  weekday name or abbreviation (ignored)
+``%Y``  year with century
+``%y``  year without century
+``%H``  hour (24-hour clock)
+``%I``  hour (12-hour clock)
+``%p``  AM or PM
+``%M``  minute
+``%S``  second
+``%N``  number of time units of a relative date (e.g. "3" or "a")
+``%U``  time unit of a relative date (e.g. "hours" or "Tagen")
+``%n``  a number that is not part of the date (e.g. the post number)
+``%%``  a literal percent sign
+======  ==============================================================
+
+Example: ``by %[%d %b %Y %H:%M%]`` matches "by 17 Jul 2011 17:51".
+'''
+
+import re
+
+from collections import namedtuple
+from datetime import datetime, timedelta
+from functools import lru_cache
+from itertools import product
+
+from dateparser.languages.loader import default_loader
+from dateutil.relativedelta import relativedelta
+
+from harvest.config import LANGUAGES
+
+# minimum number of dates required for learning a date format
+MIN_DATE_FORMAT_SAMPLES = 2
+# maximum number of candidate formats considered per date mention
+MAX_DATE_FORMAT_CANDIDATES = 4096
+# tolerated difference between relative dates computed by dateparser and
+# this module (dateparser results are cached, see harvest.date_search)
+RELATIVE_DATE_TOLERANCE = timedelta(minutes=15)
+
+MONTHS = ('january', 'february', 'march', 'april', 'may', 'june', 'july', 'august', 'september', 'october',
+          'november', 'december')
+WEEKDAYS = ('monday', 'tuesday', 'wednesday', 'thursday', 'friday', 'saturday', 'sunday')
+TIME_UNITS = {'year': 'years', 'month': 'months', 'week': 'weeks', 'day': 'days', 'hour': 'hours',
+              'minute': 'minutes', 'second': 'seconds'}
+ORDINAL_SUFFIXES = ('st', 'nd', 'rd', 'th')
+
+RE_TOKEN = re.compile(r'\d+|[^\W\d_]+|\s+|.', re.DOTALL)
+RE_DIRECTIVE = re.compile(r'%.|\s+|[^%\s]+', re.DOTALL)
+
+DateNames = namedtuple('DateNames', ('months', 'weekdays', 'units', 'numbers', 'meridiems'))
+
+
+@lru_cache(maxsize=None)
+def _get_date_names(languages):
+    '''
+    Returns:
+      DateNames -- lower case month, weekday, time unit, number and AM/PM
+      names of the given languages as used by dateparser.
+    '''
+    months, units, numbers, meridiems = {}, {}, {}, {}
+    weekdays = set()
+    for language in languages:
+        info = default_loader.get_locale(language).info
+        for month, key in enumerate(MONTHS, start=1):
+            months.update((name.lower(), month) for name in info.get(key, []))
+        for key in WEEKDAYS:
+            weekdays.update(name.lower() for name in info.get(key, []))
+        for key, unit in TIME_UNITS.items():
+            units.update((name.lower(), unit) for name in info.get(key, []))
+        for key in ('am', 'pm'):
+            meridiems.update((name.lower(), key) for name in info.get(key, []))
+        for simplification in info.get('simplifications', []):
+            numbers.update((word.lower(), int(number)) for word, number in simplification.items()
+                           if word.isalpha() and number.isdigit())
+    return DateNames(months, frozenset(weekdays), units, numbers, meridiems)
+
+
+def _get_alternatives(names):
+    return '|'.join(re.escape(name) for name in sorted(names, key=len, reverse=True))
+
+
+@lru_cache(maxsize=1024)
+def _compile_date_format(date_format, languages):
+    '''
+    Returns:
+      the compiled regular expression of the date format or None, if the
+      format is invalid.
+    '''
+    names = _get_date_names(languages)
+    directives = {'%d': r'(?P<d>\d{1,2})', '%m': r'(?P<m>\d{1,2})', '%Y': r'(?P<Y>\d{4})', '%y': r'(?P<y>\d{2})',
+                  '%H': r'(?P<H>\d{1,2})', '%I': r'(?P<I>\d{1,2})', '%M': r'(?P<M>\d{2})', '%S': r'(?P<S>\d{2})',
+                  '%b': f'(?P<b>{_get_alternatives(names.months)})',
+                  '%a': f'(?:{_get_alternatives(names.weekdays)})',
+                  '%p': f'(?P<p>{_get_alternatives(names.meridiems)})',
+                  '%o': f'(?:{_get_alternatives(ORDINAL_SUFFIXES)})',
+                  '%N': rf'(?P<N>\d+|{_get_alternatives(names.numbers)})',
+                  '%U': f'(?P<U>{_get_alternatives(names.units)})',
+                  '%n': r'\d+', '%[': '(?P<mention>', '%]': ')', '%%': '%'}
+    pattern = []
+    for directive in RE_DIRECTIVE.findall(date_format):
+        if directive.isspace():
+            pattern.append(r'\s+')
+        elif directive.startswith('%'):
+            if directive not in directives:
+                return None
+            pattern.append(directives[directive])
+        else:
+            pattern.append(re.escape(directive))
+
+    try:
+        regex = re.compile(''.join(pattern), re.IGNORECASE)
+    except re.error:
+        return None
+    return regex if 'mention' in regex.groupindex else None
+
+
+def _get_date(fields, names, now):
+    if fields.get('U'):
+        if not fields.get('N') or any(fields.get(field) for field in 'dmbYyHIMS'):
+            return None
+        amount = fields['N']
+        amount = int(amount) if amount.isdigit() else names.numbers[amount.lower()]
+        return now - relativedelta(**{names.units[fields['U'].lower()]: amount})
+
+    if not fields.get('d') or fields.get('N') or bool(fields.get('m')) == bool(fields.get('b')) or \
+            bool(fields.get('I')) != bool(fields.get('p')) or (fields.get('H') and fields.get('I')):
+        return None
+
+    if fields.get('Y'):
+        year = int(fields['Y'])
+    elif fields.get('y'):
+        year = datetime.strptime(fields['y'], '%y').year
+    else:
+        year = now.year
+    month = int(fields['m']) if fields.get('m') else names.months[fields['b'].lower()]
+    if fields.get('I'):
+        hour = int(fields['I']) % 12 + (12 if names.meridiems[fields['p'].lower()] == 'pm' else 0)
+    else:
+        hour = int(fields.get('H') or 0)
+    try:
+        return datetime(year, month, int(fields['d']), hour, int(fields.get('M') or 0), int(fields.get('S') or 0))
+    except ValueError:
+        return None
+
+
+def parse_date(text, date_format, now=None, languages=LANGUAGES):
+    '''
+    Parses the date in the given text with a learned date format.
+
+    Args:
+      text (str): the text containing the date.
+      date_format (str): the date format (see :func:`learn_date_format`).
+      now (datetime): the reference time for relative dates.
+      languages: the languages of month, weekday and time unit names.
+
+    Returns:
+      tuple -- the date mention and the corresponding datetime or None, if
+      the text does not match the format or yields a future date.
+    '''
+    regex = _compile_date_format(date_format, tuple(languages))
+    match = regex.fullmatch(text) if regex is not None else None
+    if match is None:
+        return None
+
+    now = now or datetime.now()
+    date = _get_date(match.groupdict(), _get_date_names(tuple(languages)), now)
+    if date is None or date > now:
+        return None
+    return ' '.join(match.group('mention').split()), date
+
+
+def _get_token_directives(token, date, names):
+    '''
+    Returns:
+      list -- the directives that may have produced the token of a date
+      mention that dateparser resolved to `date`.
+    '''
+    if token.isspace():
+        return [' ']
+    if token.isdigit():
+        value = int(token)
+        directives = [directive for directive, matches in (
+            ('%Y', len(token) == 4 and value == date.year),
+            ('%y', len(token) == 2 and value == date.year % 100),
+            ('%m', value == date.month),
+            ('%d', value == date.day),
+            ('%H', value == date.hour),
+            ('%I', value == (date.hour % 12 or 12)),
+            ('%M', len(token) == 2 and value == date.minute),
+            ('%S', len(token) == 2 and value == date.second)) if matches]
+        return directives + ['%N']
+
+    word = token.lower()
+    if names.months.get(word) == date.month:
+        return ['%b']
+    if word in ORDINAL_SUFFIXES:
+        return ['%o']
+    if word in names.weekdays:
+        return ['%a']
+    if word in names.meridiems:
+        return ['%p']
+    if word in names.units:
+        return ['%U']
+    directives = ['%N'] if word in names.numbers else []
+    return directives + [token.replace('%', '%%')]
+
+
+def _get_context_directive(token):
+    if token.isspace():
+        return ' '
+    return '%n' if token.isdigit() else token.replace('%', '%%')
+
+
+def _get_candidate_formats(text, mention, date, names):
+    # dateparser normalizes the whitespace of date mentions
+    match = re.search(r'\s+'.join(re.escape(part) for part in mention.split()), text) if mention.strip() else None
+    if match is None:
+        return set()
+
+    start, end = match.span()
+    tokens = [(match.start(), match.end(), match.group()) for match in RE_TOKEN.finditer(text)]
+    if start not in {token_start for token_start, _, _ in tokens} or \
+            end not in {token_end for _, token_end, _ in tokens}:
+        return set()
+
+    prefix = ''.join(_get_context_directive(token) for _, token_end, token in tokens if token_end <= start)
+    suffix = ''.join(_get_context_directive(token) for token_start, _, token in tokens if token_start >= end)
+    candidates = [_get_token_directives(token, date, names)
+                  for token_start, token_end, token in tokens if start <= token_start and token_end <= end]
+    count = 1
+    for directives in candidates:
+        count *= len(directives)
+    if count > MAX_DATE_FORMAT_CANDIDATES:
+        return set()
+    return {prefix + '%[' + ''.join(directives) + '%]' + suffix for directives in product(*candidates)}
+
+
+def _reproduces(date_format, text, mention, date, now, languages):
+    result = parse_date(text, date_format, now, languages)
+    if result is None or result[0] != mention:
+        return False
+    if '%U' in date_format:
+        return abs(result[1] - date) <= RELATIVE_DATE_TOLERANCE
+    return result[1] == date
+
+
+def learn_date_format(samples, now=None, languages=LANGUAGES):
+    '''
+    Learns the format of the given post dates.
+
+    Args:
+      samples (list): (text, date mention, datetime) tuples of the post
+        dates found by dateparser.
+      now (datetime): the reference time used for resolving the dates.
+      languages: the languages of month, weekday and time unit names.
+
+    Returns:
+      str -- the only date format that reproduces all samples or None.
+    '''
+    if len(samples) < MIN_DATE_FORMAT_SAMPLES:
+        return None
+
+    now = now or datetime.now()
+    languages = tuple(languages)
+    names = _get_date_names(languages)
+    date_formats = None
+    for text, mention, date in samples:
+        if date_formats is None:
+            date_formats = _get_candidate_formats(text, mention, date, names)
+        date_formats = {date_format for date_format in date_formats
+                        if _reproduces(date_format, text, mention, date, now, languages)}
+        if not date_formats:
+            return None
+
+    return date_formats.pop() if len(date_formats) == 1 else None
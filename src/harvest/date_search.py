@@ -1,10 +1,156 @@
-import dateparser.search
+'''
+Resolves dates with dateparser.
+
+The same short strings are searched for dates many times while learning and
+applying the date xpath of a forum. All dateparser lookups, therefore, go
+through a bounded LRU cache keyed by the text, the languages and the settings.
+
+Relative expressions such as "2 hours ago" are resolved against the time of
+the lookup. Cache entries are therefore only reused within the same
+DATE_CACHE_PERIOD.
+
+Most texts are not dates at all. A cheap lexical pre-filter
+(:func:`might_contain_date`) therefore only passes texts that contain a digit
+or a word of dateparser's date vocabulary (month and weekday names, time
+units, relative expressions and number words) to dateparser.
+
+``dateparser.search`` ignores the date order of the languages' locales.
+Numeric dates such as 08.11.2009, therefore, are resolved with the date order
+of the first (i.e. the page's) language.
+'''
+
 import datetime
+import re
+import time
+import unicodedata
+
+from functools import lru_cache
+from operator import itemgetter
+
+import dateparser.search
+from dateparser.languages.loader import default_loader
+
+from harvest import metrics
 from harvest.config import LANGUAGES
 
+# maximum number of cached dateparser results
+DATE_CACHE_SIZE = 16384
+# time span (in seconds) for which cached results of relative dates are considered valid
+DATE_CACHE_PERIOD = 600
+
+# keys of dateparser's language data that contain date vocabulary
+DATE_VOCABULARY_KEYS = ('january', 'february', 'march', 'april', 'may', 'june', 'july', 'august', 'september',
+                        'october', 'november', 'december', 'monday', 'tuesday', 'wednesday', 'thursday', 'friday',
+                        'saturday', 'sunday', 'decade', 'year', 'month', 'week', 'day', 'hour', 'minute', 'second',
+                        'ago')
+
+RE_DIGIT = re.compile(r'\d')
+RE_WORD = re.compile(r'\w+')
+# date mentions that consist of a single number (e.g. the post number #11) that dateparser reads as day or month
+RE_NUMBER = re.compile(r'^\W*\d+\W*$')
+
+
+def _normalize(text):
+    '''
+    Returns:
+      str -- the lower case text without accents (dateparser matches
+      "à" to "a").
+    '''
+    return ''.join(c for c in unicodedata.normalize('NFKD', text.lower()) if not unicodedata.combining(c))
+
+
+@lru_cache(maxsize=None)
+def _get_date_vocabulary(languages):
+    vocabulary = set()
+    for language in languages:
+        info = default_loader.get_locale(language).info
+        skip = set(info.get('skip', []))
+        phrases = [phrase for key in DATE_VOCABULARY_KEYS for phrase in info.get(key, [])]
+        phrases.extend(phrase for relative_phrases in info.get('relative-type', {}).values()
+                       for phrase in relative_phrases)
+        # simplifications translate number words such as "one" or "zwei"
+        phrases.extend(pattern for simplification in info.get('simplifications', []) for pattern in simplification)
+        for phrase in phrases:
+            vocabulary.update(word for word in RE_WORD.findall(_normalize(phrase)) if word not in skip)
+    return frozenset(vocabulary)
+
+
+def might_contain_date(text, languages=LANGUAGES):
+    '''
+    A cheap test that rejects most texts without a date.
+
+    Args:
+      text (str): the text to test.
+      languages: the languages considered by dateparser.
+
+    Returns:
+      bool -- False, if dateparser will not find a date in the text.
+    '''
+    if RE_DIGIT.search(text):
+        return True
+    return not _get_date_vocabulary(tuple(languages)).isdisjoint(RE_WORD.findall(_normalize(text)))
+
+
+@lru_cache(maxsize=DATE_CACHE_SIZE)
+def _resolve_dates(text, languages, settings, period):
+    metrics.increment('dateparser_calls')
+    results = dateparser.search.search_dates(text, languages=languages,
+                                             settings=dict(settings) if settings is not None else None)
+    return tuple(results) if results is not None else None
 
-def search_dates(text):
-    results = dateparser.search.search_dates(text, languages=LANGUAGES, settings={'RETURN_AS_TIMEZONE_AWARE': False})
+
+def resolve_dates(text, languages=LANGUAGES, settings=None):
+    '''
+    Args:
+      text (str): the text to search for dates.
+      languages: the languages considered by dateparser.
+      settings (dict): optional dateparser settings.
+
+    Returns:
+      list -- the (cached) result of ``dateparser.search.search_dates``, i.e.
+      a list of (date string, datetime) tuples or None, if no date has been
+      found.
+    '''
+    if not might_contain_date(text, languages):
+        return None
+
+    metrics.increment('date_cache_lookups')
+    results = _resolve_dates(text, tuple(languages),
+                             tuple(sorted(settings.items())) if settings is not None else None,
+                             int(time.time() // DATE_CACHE_PERIOD))
+    return list(results) if results is not None else None
+
+
+def _get_settings(languages):
+    '''
+    Returns:
+      dict -- the dateparser settings for resolving dates in the given
+      languages.
+    '''
+    settings = {'RETURN_AS_TIMEZONE_AWARE': False}
+    date_order = default_loader.get_locale(languages[0]).info.get('date_order') if languages else None
+    if date_order:
+        settings['DATE_ORDER'] = date_order
+    return settings
+
+
+def get_date_cache_statistics():
+    '''
+    Returns:
+      dict -- the hits, misses, size and hit rate of the date cache.
+    '''
+    info = _resolve_dates.cache_info()
+    lookups = info.hits + info.misses
+    return {'hits': info.hits, 'misses': info.misses, 'size': info.currsize,
+            'hit_rate': info.hits / lookups if lookups else 0.}
+
+
+def clear_date_cache():
+    _resolve_dates.cache_clear()
+
+
+def search_dates(text, languages=LANGUAGES):
+    results = resolve_dates(text, languages, _get_settings(languages))
     valid_dates = []
     if results is not None:
         for result in results:
@@ -12,3 +158,62 @@ def search_dates(text):
                 valid_dates.append(result)
 
     return valid_dates
+
+
+def _get_latest_date(results, now):
+    for date_mention, date in sorted(results, key=itemgetter(1), reverse=True):
+        if date <= now and not RE_NUMBER.match(date_mention):
+            return date_mention, date
+    return None
+
+
+def get_latest_date(text, now=None, languages=LANGUAGES):
+    '''
+    Args:
+      text (str): the text to search for dates.
+      now (datetime): dates after `now` are ignored.
+      languages: the languages considered by dateparser.
+
+    Returns:
+      tuple -- the date mention and datetime of the most recent date in the
+      text that does not lie in the future or None, if there is no such date.
+    '''
+    results = resolve_dates(text, languages, _get_settings(languages))
+    return _get_latest_date(results, now or datetime.datetime.now()) if results else None
+
+
+def get_latest_dates(texts, now=None, languages=LANGUAGES, fallback_languages=None):
+    '''
+    Resolves the dates of several texts (e.g. of all posts on a page) with
+    a single dateparser search per distinct text and a single reference time.
+
+    Args:
+      texts: the texts to search for dates.
+      now (datetime): dates after `now` are ignored.
+      languages: the languages considered by dateparser.
+      fallback_languages: optional languages that are considered, if none
+        of the texts contains a past date in `languages` (e.g. all
+        LANGUAGES, if the page language has been detected incorrectly).
+        The texts are then resolved a second time.
+
+    Returns:
+      dict -- maps every text that contains a date to the date mention and
+      datetime of its most recent date that does not lie in the future (or
+      None, if all of its dates lie in the future).
+    '''
+    now = now or datetime.datetime.now()
+    texts = list(dict.fromkeys(texts))
+    latest_dates = _get_latest_dates(texts, now, languages)
+    if (fallback_languages is not None and tuple(fallback_languages) != tuple(languages)
+            and not any(latest_dates.values())):
+        latest_dates = _get_latest_dates(texts, now, fallback_languages)
+    return latest_dates
+
+
+def _get_latest_dates(texts, now, languages):
+    latest_dates = {}
+    for text in texts:
+        results = resolve_dates(text, languages, _get_settings(languages))
+        if results:
+            latest_dates[text] = _get_latest_date(results, now)
+    return latest_dates
@@ -0,0 +1,136 @@
+'''
+A parsed forum page.
+
+The learning (:mod:`harvest.posts`) and the extraction phase
+(:mod:`harvest.extract`) operate on the same page. :class:`Document` parses
+the HTML only once and shares the lxml DOM, its ``ElementTree`` and the text
+rendered by inscriptis between both phases.
+
+A Document also caches the results of xpath expressions evaluated on the page
+and, therefore, may be passed to all functions that only evaluate xpath
+expressions on the DOM instead of the DOM itself.
+'''
+
+from lxml import etree
+
+from harvest import metrics
+from harvest.language import get_page_languages
+from harvest.post_text import get_cleaned_text
+from harvest.utils import get_html_dom, ElementIntervals, SubtreeText, XPathEvaluator
+
+
+class _cached_attribute:
+    '''
+    Computes an attribute on first access and stores the result in the
+    instance, so that subsequent lookups do not call the getter again.
+    '''
+
+    def __init__(self, getter):
+        self.getter = getter
+        self.name = getter.__name__
+        self.__doc__ = getter.__doc__
+
+    def __get__(self, instance, owner):
+        if instance is None:
+            return self
+        value = self.getter(instance)
+        instance.__dict__[self.name] = value
+        return value
+
+
+class Document:
+    '''
+    A forum page whose DOM and text representation are computed lazily and
+    at most once.
+
+    Args:
+      html (str): the HTML of the forum page.
+      url (str): the URL of the forum page.
+      dom: an optional, already parsed DOM of the page.
+    '''
+
+    def __init__(self, html, url=None, dom=None):
+        self.html = html
+        self.url = url
+        if dom is not None:
+            self.__dict__['dom'] = dom
+
+    @classmethod
+    def from_dom(cls, dom):
+        '''
+        Returns:
+          Document -- `dom` if it already is a Document, otherwise a Document
+          wrapping the given lxml DOM.
+        '''
+        return dom if isinstance(dom, cls) else cls(None, dom=dom)
+
+    @_cached_attribute
+    def dom(self):
+        '''
+        The lxml document object model (DOM) of the page.
+        '''
+        with metrics.stage('parse'):
+            dom = get_html_dom(self.html)
+        if metrics.get_sink() is not None and dom is not None:
+            metrics.observe('dom_nodes', sum(1 for _ in dom.iter()))
+        return dom
+
+    @_cached_attribute
+    def tree(self):
+        '''
+        The ``ElementTree`` of the page's DOM (used for computing xpaths).
+        '''
+        return etree.ElementTree(self.dom)
+
+    @_cached_attribute
+    def xpath_evaluator(self):
+        '''
+        The :class:`harvest.utils.XPathEvaluator` that caches the xpath
+        results for the page.
+        '''
+        return XPathEvaluator(self.dom)
+
+    def xpath(self, expression):
+        '''
+        Returns:
+          list -- the (cached) result of the xpath expression on the DOM.
+        '''
+        return self.xpath_evaluator.xpath(expression)
+
+    @_cached_attribute
+    def subtree_text(self):
+        '''
+        The normalized text of every element's subtree (see
+        :class:`harvest.utils.SubtreeText`).
+        '''
+        return SubtreeText(self.dom)
+
+    @_cached_attribute
+    def element_intervals(self):
+        '''
+        The pre-order intervals of the page's elements (see
+        :class:`harvest.utils.ElementIntervals`).
+        '''
+        return ElementIntervals(self.dom)
+
+    @_cached_attribute
+    def text_sections(self):
+        '''
+        The cleaned text sections of the page as rendered by inscriptis.
+        '''
+        return get_cleaned_text(self.html, dom=self.dom)
+
+    @_cached_attribute
+    def languages(self):
+        '''
+        The languages considered for resolving the page's dates (see
+        :func:`harvest.language.get_page_languages`).
+        '''
+        return get_page_languages(self)
+
+    @_cached_attribute
+    def reference_text(self):
+        '''
+        The page's text sections joined into a single reference text.
+        '''
+        return " ".join(self.text_sections)
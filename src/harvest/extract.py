@@ -12,15 +12,17 @@ by the machine learning component.
 
 from collections import namedtuple
 from datetime import datetime
-from operator import itemgetter
 from urllib.parse import urljoin, urlparse
-from dateparser.search import search_dates
 from dateutil import parser
 
-from harvest.utils import get_html_dom, get_xpath_tree_text, get_cleaned_element_text, extract_text
+from harvest import metrics
+from harvest.config import LANGUAGES
+from harvest.document import Document
+from harvest.utils import get_xpath_tree_text, get_cleaned_element_text, extract_text
 
 from harvest.cleanup.forum_post import remove_boilerplate
-from harvest.config import LANGUAGES
+from harvest.date_format import parse_date
+from harvest.date_search import get_latest_dates
 
 ExtractionResult = namedtuple('ExtractionResult', ('post', 'url', 'date',
                                                    'user'))
@@ -68,47 +70,58 @@ def _get_user_name(element):
 def _get_date_text(time_element, time_element_as_datetime=True):
     is_tag_time = time_element.tag == 'time'
     if is_tag_time and 'datetime' in time_element.attrib:
+        time = time_element.attrib.get('datetime', '')
         if time_element_as_datetime:
-            time = time_element.attrib.get('datetime', '')
             parsed_time = parser.parse(time, ignoretz=True)
             return is_tag_time, parsed_time
+        # time elements whose text is rendered by scripts only provide the datetime attribute
+        return is_tag_time, get_cleaned_element_text(time_element) or time
 
     return is_tag_time, get_cleaned_element_text(time_element)
 
 
-def get_forum_date(dom, post_date_xpath, result_as_datetime=True):
+def get_forum_date(dom, post_date_xpath, result_as_datetime=True, date_format=None):
     '''
     Selects the date present in the given post_date_xpath. Future dates are
     automatically filtered. If no date has been identified for a post, a None
     value is inserted.
 
     Args:
-        dom: the DOM representation of the forum page.
+        dom: the DOM representation (or Document) of the forum page.
         post_date_xpath (str): The xpath of the forum date.
         result_as_datetime (bool): If true the date are returned as datetime. Otherwise the date are returned as string
+        date_format (str): An optional date format learned for the forum (see harvest.date_format). Dates that
+                           match the format are parsed without invoking dateparser.
 
     Returns:
         list -- A list of dates for every forum post.
     '''
+    languages = Document.from_dom(dom).languages
+    now = datetime.now()
+    date_mentions = [_get_date_text(element, time_element_as_datetime=result_as_datetime)
+                     for element in dom.xpath(post_date_xpath)]
+    texts = [date_mention for is_time_element, date_mention in date_mentions if not is_time_element]
+
+    # dates that match the forum's date format do not require dateparser
+    parsed_dates = {text: parse_date(text, date_format, now, languages) for text in texts} if date_format else {}
+    latest_dates = get_latest_dates((text for text in texts if parsed_dates.get(text) is None), now, languages,
+                                    fallback_languages=LANGUAGES)
+
     result = []
-    date_mentions = (_get_date_text(e, time_element_as_datetime=result_as_datetime)
-                     for e in dom.xpath(post_date_xpath) if
-                     e.tag == 'time' or search_dates(_get_date_text(e)[1], languages=LANGUAGES))
     for is_time_element, date_mention in date_mentions:
-        found = None
         if is_time_element:
-            found = date_mention
+            result.append(date_mention)
+            continue
+
+        date = parsed_dates.get(date_mention) or latest_dates.get(date_mention)
+        if date is None and date_mention not in latest_dates:
+            # the text does not contain any date
+            continue
+
+        if date is None:
+            result.append(None)
         else:
-            for data_as_string, date in sorted(
-                    search_dates(date_mention, settings={'RETURN_AS_TIMEZONE_AWARE': False}, languages=LANGUAGES),
-                    key=itemgetter(1), reverse=True):
-                if date <= datetime.now():
-                    if result_as_datetime:
-                        found = date
-                    else:
-                        found = data_as_string
-                    break
-        result.append(found)
+            result.append(date[1] if result_as_datetime else date[0])
 
     return result
 
@@ -116,7 +129,7 @@ def get_forum_date(dom, post_date_xpath, result_as_datetime=True):
 def get_forum_url(dom, post_url_xpath):
     '''
     Args:
-      dom: The DOM representation of the forum page.
+      dom: The DOM representation (or Document) of the forum page.
       post_url_xpath (str): The xpath to the post URL.
       url (str): The URL of the given page.
 
@@ -130,7 +143,7 @@ def get_forum_url(dom, post_url_xpath):
 def get_forum_user(dom, post_user_xpath):
     '''
     Args:
-      dom: The DOM representation of the forum page.
+      dom: The DOM representation (or Document) of the forum page.
       post_user_xpath (str): The xpath to the post user name.
       url (str): The URL of the given page.
 
@@ -174,43 +187,54 @@ def _get_container_elements(dom, xpath, number_of_posts):
 
 
 def add_anonymous_user(dom, users, post_xpath, post_user_xpath):
-    posts = dom.xpath(post_xpath)
+    document = Document.from_dom(dom)
+    posts = document.xpath(post_xpath)
     if len(posts) > len(users):
-        user_elements = dom.xpath(post_user_xpath)
-        posts = _get_container_elements(dom, post_xpath, len(posts))
+        user_positions = document.element_intervals.get_positions(document.xpath(post_user_xpath))
+        posts = _get_container_elements(document, post_xpath, len(posts))
         for index in range(len(posts)):
-            contains_user = False
-            for tag in posts[index].iterdescendants():
-                if tag in user_elements:
-                    contains_user = True
-                    break
+            contains_user = document.element_intervals.count_descendants(posts[index], user_positions) > 0
             if not contains_user:
                 users.insert(index, "Anonymous")
                 if len(posts) == len(users):
                     break
 
 
+@metrics.accepts_sink
 def extract_posts(html_content, url, post_xpath, post_url_xpath,
-                  post_date_xpath, post_user_xpath, result_as_datetime=True):
+                  post_date_xpath, post_user_xpath, result_as_datetime=True,
+                  document=None, date_format=None):
     '''
+    Args:
+      document: an optional :class:`harvest.document.Document` of the page
+        whose DOM is used instead of parsing `html_content` again.
+      date_format: an optional date format learned for the forum (see
+        :mod:`harvest.date_format`).
+      sink: an optional :class:`harvest.metrics.InstrumentationSink` that
+        receives the timings and counters of the extraction stages (default:
+        the sink of the current context).
+
     Returns:
       dict -- The extracted forum post and the corresponding metadat.
     '''
-    dom = get_html_dom(html_content)
-
-    forum_posts = remove_boilerplate(get_xpath_tree_text(dom, post_xpath))
-    forum_urls = get_forum_url(dom, post_url_xpath) \
-        if post_url_xpath else generate_forum_url(url, len(forum_posts))
-    forum_dates = get_forum_date(dom, post_date_xpath, result_as_datetime=result_as_datetime) \
-        if post_date_xpath else len(forum_posts) * ['']
-    forum_users = get_forum_user(dom, post_user_xpath) \
-        if post_user_xpath else len(forum_posts) * ['']
-
-    add_anonymous_user(dom, forum_users, post_xpath, post_user_xpath)
-    forum_urls = _get_same_size_as_posts(len(forum_posts), forum_urls)
-    forum_dates = _get_same_size_as_posts(len(forum_posts), forum_dates)
-    forum_users = _get_same_size_as_posts(len(forum_posts), forum_users)
-
-    return [ExtractionResult(post, url, date, user)
-            for post, url, date, user in zip(forum_posts, forum_urls,
-                                             forum_dates, forum_users)]
+    if document is None:
+        document = Document(html_content, url)
+
+    with metrics.stage('apply'):
+        forum_posts = remove_boilerplate(get_xpath_tree_text(document, post_xpath, subtree_text=document.subtree_text))
+        forum_urls = get_forum_url(document, post_url_xpath) \
+            if post_url_xpath else generate_forum_url(url, len(forum_posts))
+        forum_dates = get_forum_date(document, post_date_xpath, result_as_datetime=result_as_datetime,
+                                     date_format=date_format) \
+            if post_date_xpath else len(forum_posts) * ['']
+        forum_users = get_forum_user(document, post_user_xpath) \
+            if post_user_xpath else len(forum_posts) * ['']
+
+        add_anonymous_user(document, forum_users, post_xpath, post_user_xpath)
+        forum_urls = _get_same_size_as_posts(len(forum_posts), forum_urls)
+        forum_dates = _get_same_size_as_posts(len(forum_posts), forum_dates)
+        forum_users = _get_same_size_as_posts(len(forum_posts), forum_users)
+
+        return [ExtractionResult(post, url, date, user)
+                for post, url, date, user in zip(forum_posts, forum_urls,
+                                                 forum_dates, forum_users)]
@@ -0,0 +1,164 @@
+'''
+Progress journal for long-running batch jobs.
+
+The :class:`ProgressJournal` records in a SQLite database which inputs have
+been processed and up to which offset every output file has been written.
+Records are committed in batches together with the offsets of the outputs, so
+that after a crash
+
+1. inputs committed as completed are skipped, and
+2. outputs are truncated to their last committed offset, which removes the
+   partial results of inputs that are processed again.
+
+Inputs are identified by their path and a hash of their content (see
+:func:`get_content_hash`). :func:`get_file_signature` is a cheaper
+alternative for large corpora, which does not read the inputs.
+
+Example::
+
+   journal = ProgressJournal('run.journal')
+   journal.truncate_outputs()
+   for path in inputs:
+       content_hash = get_content_hash(path)
+       if journal.is_completed(path, content_hash):
+           continue
+       offset = ...  # write the results and register new output files
+       journal.record(path, content_hash, COMPLETED, offset)
+       if journal.pending >= journal.batch_size:
+           journal.commit(output_offsets)
+   journal.commit(output_offsets)
+'''
+
+import hashlib
+import os
+import sqlite3
+
+COMPLETED = 'completed'
+SKIPPED = 'skipped'
+FAILED = 'failed'
+# the input exceeded its time or memory budget (see harvest.budget)
+ABORTED = 'aborted'
+
+# inputs with these states are not processed again. Whether an input is
+# skipped or aborted depends on the settings of the run (e.g. its filter or
+# budget), so that these inputs are processed again by a resumed run.
+FINAL_STATES = (COMPLETED, )
+
+
+def get_content_hash(path, chunk_size=1 << 20):
+    '''
+    Returns:
+      str -- the SHA-256 hex digest of the file's content.
+    '''
+    content_hash = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            content_hash.update(chunk)
+    return content_hash.hexdigest()
+
+
+def get_file_signature(path):
+    '''
+    Returns:
+      str -- the size and modification time of the file, which identify its
+      content without reading the file (cf. :func:`get_content_hash`).
+    '''
+    stat = os.stat(path)
+    return f'{stat.st_size}:{stat.st_mtime_ns}'
+
+
+class ProgressJournal:
+    '''
+    A SQLite journal of processed inputs and committed output offsets.
+
+    Args:
+      path (str): the SQLite database of the journal.
+      batch_size (int): the number of recorded inputs after which callers
+        should :meth:`commit` the journal.
+    '''
+
+    def __init__(self, path, batch_size=100):
+        self.batch_size = batch_size
+        self._db = sqlite3.connect(path)
+        self._db.execute('CREATE TABLE IF NOT EXISTS inputs (path TEXT PRIMARY KEY, content_hash TEXT, '
+                         'status TEXT NOT NULL, output_offset INTEGER)')
+        self._db.execute('CREATE TABLE IF NOT EXISTS outputs (path TEXT PRIMARY KEY, offset INTEGER NOT NULL)')
+        self._db.commit()
+        self._pending = []
+        # completed inputs are kept in memory, so that lookups do not touch
+        # the database (and are safe from other threads)
+        placeholders = ', '.join('?' * len(FINAL_STATES))
+        self._completed = dict(self._db.execute('SELECT path, content_hash FROM inputs '
+                                                f'WHERE status IN ({placeholders})', FINAL_STATES))
+
+    @property
+    def pending(self):
+        '''
+        The number of recorded inputs that have not been committed yet.
+        '''
+        return len(self._pending)
+
+    def is_completed(self, path, content_hash):
+        '''
+        Returns:
+          bool -- True, if the input has been committed as completed and its
+          content has not changed since.
+        '''
+        return path in self._completed and self._completed[path] == content_hash
+
+    def get_output_offset(self, path):
+        '''
+        Returns:
+          int -- the committed offset of the output file or None, if the
+          file is not known to the journal.
+        '''
+        row = self._db.execute('SELECT offset FROM outputs WHERE path = ?', (path, )).fetchone()
+        return row[0] if row else None
+
+    def register_output(self, path, offset):
+        '''
+        Registers an output file with the offset at which this job starts
+        writing to it. The registration is committed immediately, so that
+        the data written by the job can be removed after a crash. Outputs
+        that are already known keep their committed offset.
+        '''
+        self._db.execute('INSERT OR IGNORE INTO outputs (path, offset) VALUES (?, ?)', (path, offset))
+        self._db.commit()
+
+    def truncate_outputs(self):
+        '''
+        Truncates all registered output files to their last committed offset.
+        Call this method before appending to the outputs of a resumed job.
+        '''
+        for path, offset in self._db.execute('SELECT path, offset FROM outputs').fetchall():
+            if os.path.exists(path) and os.path.getsize(path) > offset:
+                os.truncate(path, offset)
+
+    def record(self, path, content_hash, status, output_offset=None):
+        '''
+        Records the state of a processed input. The record becomes durable
+        with the next :meth:`commit`.
+        '''
+        self._pending.append((path, content_hash, status, output_offset))
+
+    def commit(self, output_offsets=None):
+        '''
+        Commits the recorded inputs together with the output offsets.
+
+        Args:
+          output_offsets (dict): the current offsets of the output files,
+            which must contain all data written for the recorded inputs
+            (i.e. the outputs have been flushed).
+        '''
+        with self._db:
+            self._db.executemany('INSERT OR REPLACE INTO inputs (path, content_hash, status, output_offset) '
+                                 'VALUES (?, ?, ?, ?)', self._pending)
+            self._db.executemany('INSERT OR REPLACE INTO outputs (path, offset) VALUES (?, ?)',
+                                 (output_offsets or {}).items())
+        for path, content_hash, status, _ in self._pending:
+            if status in FINAL_STATES:
+                self._completed[path] = content_hash
+        self._pending = []
+
+    def close(self):
+        self._db.close()
@@ -0,0 +1,111 @@
+'''
+Detects the language of a forum page.
+
+Dateparser's effort grows linearly with the number of languages it considers.
+Dates on pages in one of the configured LANGUAGES are, therefore, only
+resolved in the page's language and the FALLBACK_LANGUAGE. Pages in other or
+unknown languages consider all LANGUAGES.
+
+The page language is taken from the language declared in the HTML (which
+usually corresponds to the language of the forum software and its dates) and
+otherwise estimated from stop words in the page's text.
+'''
+
+import re
+
+from collections import Counter, defaultdict
+
+from harvest.config import FALLBACK_LANGUAGE, LANGUAGES
+
+STOP_WORDS = {
+    'en': ('the', 'and', 'is', 'are', 'was', 'with', 'that', 'this', 'have', 'you', 'not', 'for', 'it', 'of'),
+    'de': ('der', 'die', 'und', 'ist', 'nicht', 'das', 'ich', 'mit', 'auch', 'sich', 'auf', 'ein', 'eine', 'wir'),
+    'es': ('el', 'los', 'las', 'que', 'y', 'por', 'con', 'para', 'una', 'es', 'pero', 'muy', 'está', 'como'),
+    'fr': ('le', 'les', 'et', 'est', 'une', 'pas', 'pour', 'dans', 'je', 'vous', 'du', 'qui', 'avec', 'sur'),
+    'it': ('il', 'che', 'di', 'non', 'per', 'sono', 'con', 'del', 'della', 'gli', 'anche', 'questo', 'ma', 'è'),
+    'nl': ('het', 'een', 'en', 'niet', 'van', 'dat', 'ik', 'op', 'met', 'voor', 'zijn', 'te', 'ook', 'maar'),
+    'pt': ('não', 'uma', 'com', 'para', 'os', 'do', 'da', 'em', 'é', 'mas', 'você', 'muito', 'isso', 'por'),
+}
+# minimum number of stop words required for estimating the page language
+MIN_STOP_WORD_COUNT = 5
+
+RE_WORD = re.compile(r'\w+')
+RE_LANGUAGE_TAG = re.compile(r'[a-z]+')
+
+
+def _get_stop_word_languages():
+    stop_word_languages = defaultdict(list)
+    for language, stop_words in STOP_WORDS.items():
+        for stop_word in stop_words:
+            stop_word_languages[stop_word].append(language)
+    return dict(stop_word_languages)
+
+
+STOP_WORD_LANGUAGES = _get_stop_word_languages()
+
+
+def _get_language(language_tag):
+    '''
+    Returns:
+      str -- the two letter language code of a language tag such as "de-DE",
+      "en_US" or "de,deutsch" or None.
+    '''
+    match = RE_LANGUAGE_TAG.match((language_tag or '').strip().lower())
+    return match.group()[:2] if match and len(match.group()) >= 2 else None
+
+
+def get_declared_language(dom):
+    '''
+    Args:
+      dom: the DOM of the forum page.
+
+    Returns:
+      str -- the language declared by the ``lang`` attribute of the html
+      element or by a content-language, language or og:locale meta tag or
+      None, if no language has been declared.
+    '''
+    root = dom.getroottree().getroot()
+    for language_tag in (root.get('lang'), root.get('{http://www.w3.org/XML/1998/namespace}lang')):
+        if _get_language(language_tag):
+            return _get_language(language_tag)
+
+    for meta in root.iter('meta'):
+        kind = (meta.get('http-equiv') or meta.get('name') or meta.get('property') or '').lower()
+        if kind in ('content-language', 'language', 'og:locale') and _get_language(meta.get('content')):
+            return _get_language(meta.get('content'))
+    return None
+
+
+def get_text_language(text_sections):
+    '''
+    Args:
+      text_sections (list): the text sections of the forum page.
+
+    Returns:
+      str -- the language with the most stop words in the text or None, if
+      the text contains less than MIN_STOP_WORD_COUNT stop words.
+    '''
+    counts = Counter()
+    for text in text_sections:
+        for word in RE_WORD.findall(text.lower()):
+            counts.update(STOP_WORD_LANGUAGES.get(word, ()))
+    if not counts:
+        return None
+
+    language, count = counts.most_common(1)[0]
+    return language if count >= MIN_STOP_WORD_COUNT else None
+
+
+def get_page_languages(document):
+    '''
+    Args:
+      document: the :class:`harvest.document.Document` of the forum page.
+
+    Returns:
+      tuple -- the page language and the FALLBACK_LANGUAGE or LANGUAGES, if
+      the page language is unknown or not one of the LANGUAGES.
+    '''
+    language = get_declared_language(document.dom) or get_text_language(document.text_sections)
+    if language not in LANGUAGES:
+        return LANGUAGES
+    return tuple(dict.fromkeys((language, FALLBACK_LANGUAGE)))
@@ -8,7 +8,10 @@ import logging
 
 from collections import defaultdict
 from datetime import datetime
-from harvest.date_search import search_dates
+from harvest.config import LANGUAGES
+from harvest.date_format import learn_date_format
+from harvest.date_search import get_latest_dates, search_dates
+from harvest.document import Document
 from dateutil import parser
 from lxml import etree
 
@@ -18,7 +21,7 @@ from harvest.utils import (get_xpath_expression, get_cleaned_element_text, get_x
 MAX_DATE_LEN = 120
 
 
-def _get_date(dom, post_elements, base_url, forum_posts):
+def _get_date(dom, post_elements, base_url, forum_posts, languages):
     date_candidates = defaultdict(lambda: {'elements': [],
                                            'most_recent_date': datetime.fromtimestamp(0),  # 1970
                                            'lowermost_date': datetime.fromtimestamp(1E11),  # >5000
@@ -31,13 +34,14 @@ def _get_date(dom, post_elements, base_url, forum_posts):
             text = get_cleaned_element_text(tag)
             # do not consider text larger than MAX_DATE_LEN relevant for date extraction
 
-            if (len(text) > MAX_DATE_LEN or not search_dates(text) or
+            if (len(text) > MAX_DATE_LEN or not search_dates(text, languages) or
                     tag.tag is etree.Comment) and not (tag.tag == 'time' and 'datetime' in tag.attrib):
                 continue
 
             xpath = get_xpath_expression(tag, parent_element=element, single_class_filter=True)
             xpath += get_xpath_expression_child_filter(tag)
             date_candidates[xpath]['elements'].append(tag)
+    contains_dates = bool(date_candidates)
 
     # merge xpath
     for merged_xpath in get_merged_xpath(date_candidates.keys()):
@@ -67,7 +71,7 @@ def _get_date(dom, post_elements, base_url, forum_posts):
                 time = match.attrib.get('datetime', '')
                 extracted_dates = [(time, parser.parse(time, ignoretz=True))]
             else:
-                extracted_dates = search_dates(get_cleaned_element_text(match))
+                extracted_dates = search_dates(get_cleaned_element_text(match), languages)
 
             if not extracted_dates:
                 del date_candidates[xpath]
@@ -97,9 +101,9 @@ def _get_date(dom, post_elements, base_url, forum_posts):
                            key=lambda x: (x[1]['same_size_posts'], x[1]['chronological_order'],
                                           x[1]['most_recent_date']),
                            reverse=True):
-        return xpath
+        return xpath, contains_dates
 
-    return None
+    return None, contains_dates
 
 
 # strategy
@@ -115,18 +119,53 @@ def _get_date(dom, post_elements, base_url, forum_posts):
 def get_date(dom, post_xpath, base_url, forum_posts):
     '''
     Args:
-        dom: The DOM tree to analyze.
+        dom: The DOM tree (or harvest.document.Document) to analyze.
         post_xpath (str): xpath of the post to search dates.
         base_url (str): URL of the forum.
     Returns:
         str: the xpath to the post date.
     '''
     logging.info('Start finding post date')
+    languages = Document.from_dom(dom).languages
+    result, contains_dates = _get_date_xpath(dom, post_xpath, base_url, forum_posts, languages)
+    if not contains_dates and tuple(languages) != tuple(LANGUAGES):
+        # no text of the posts contains a date in the page language, which might have been detected incorrectly
+        result, _ = _get_date_xpath(dom, post_xpath, base_url, forum_posts, LANGUAGES)
+    logging.info(f'Post date xpath: {result}')
+    return result
+
+
+def _get_date_xpath(dom, post_xpath, base_url, forum_posts, languages):
+    '''
+    Returns:
+      tuple -- the date xpath (or None) and whether any text of the posts
+      contains a date in the given languages.
+    '''
     post_elements = dom.xpath(post_xpath)
+    contains_dates = False
     while True:
-        result = _get_date(dom, post_elements, base_url, forum_posts)
+        result, level_contains_dates = _get_date(dom, post_elements, base_url, forum_posts, languages)
+        contains_dates = contains_dates or level_contains_dates
         if result or len(post_elements) <= 1:
-            logging.info(f'Post date xpath: {result}')
-            return result
+            return result, contains_dates
         post_xpath = post_xpath + "/.."
         post_elements = dom.xpath(post_xpath)
+
+
+def get_date_format(dom, post_date_xpath):
+    '''
+    Args:
+        dom: The DOM tree (or harvest.document.Document) to analyze.
+        post_date_xpath (str): xpath of the post dates.
+    Returns:
+        str: the format of the post dates (see harvest.date_format) or None, if no unique format has been found.
+    '''
+    languages = Document.from_dom(dom).languages
+    now = datetime.now()
+    texts = [get_cleaned_element_text(element) for element in dom.xpath(post_date_xpath) if element.tag != 'time']
+    latest_dates = get_latest_dates(texts, now, languages, fallback_languages=LANGUAGES)
+    samples = [(text, *latest_dates[text]) for text in texts if latest_dates.get(text)]
+
+    date_format = learn_date_format(samples, now, languages)
+    logging.info(f'Post date format: {date_format}')
+    return date_format
@@ -116,7 +116,7 @@ def _get_link(dom, post_elements, base_url, forum_posts):
 def get_link(dom, post_xpath, base_url, forum_posts):
     '''
     Args:
-        dom: The DOM tree to analyze.
+        dom: The DOM tree (or harvest.document.Document) to analyze.
         post_xpath (str): xpath of the post to search dates.
         base_url (str): URL of the forum.
     Returns:
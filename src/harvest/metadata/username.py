@@ -8,12 +8,12 @@ import logging
 import re
 import numpy as np
 
-from harvest.config import LANGUAGES
 from itertools import combinations
 from collections import defaultdict
-from dateparser.search import search_dates
 from urllib.parse import urlparse, urljoin
 
+from harvest.date_search import resolve_dates
+from harvest.document import Document
 from harvest.utils import (get_xpath_expression, get_xpath_expression_child_filter, get_merged_xpath,
                            get_cleaned_element_text)
 
@@ -62,11 +62,11 @@ def _filter_items_with_forbidden_words(url_candidates):
                 break
 
 
-def _filter_user_name_without_link_includes_date(url_candidates):
+def _filter_user_name_without_link_includes_date(url_candidates, languages):
     for xpath, candidate in [x for x in url_candidates.items() if not x[1]['is_link']]:
         for element in candidate['elements']:
             text = element.text.strip()
-            if search_dates(text, languages=LANGUAGES) or text in FORBIDDEN_TERMS:
+            if resolve_dates(text, languages) or text in FORBIDDEN_TERMS:
                 del url_candidates[xpath]
                 break
 
@@ -87,11 +87,12 @@ def _filter_user_name_without_link_and_no_text_changes(url_candidates):
             del url_candidates[xpath]
 
 
-def _filter_more_than_one_element_per_post(url_candidates, post_elements):
+def _filter_more_than_one_element_per_post(url_candidates, post_elements, element_intervals):
     if len(post_elements) > 1:
         for xpath, candidate in [x for x in url_candidates.items()]:
+            candidate_positions = element_intervals.get_positions(candidate['elements'])
             for post_element in post_elements:
-                if len([x for x in post_element.iterdescendants() if x in candidate['elements']]) > 1 and \
+                if element_intervals.count_descendants(post_element, candidate_positions) > 1 and \
                         url_candidates[xpath]:
                     del url_candidates[xpath]
                     break
@@ -173,19 +174,19 @@ def get_user_name(name, base_url):
     return ".".join(name.split()) + '@' + urlparse(base_url).netloc
 
 
-def _get_user(dom, post_elements, base_url, posts):
+def _get_user(document, post_elements, base_url, posts):
     url_candidates = _collect_candidates_paths(post_elements)
 
     for merged_xpath in get_merged_xpath(url_candidates.keys()):
-        merged_elements = dom.xpath(merged_xpath)
+        merged_elements = document.xpath(merged_xpath)
         if merged_elements:
             url_candidates[merged_xpath]['elements'] = merged_elements
 
     _filter_url_other_domain(url_candidates, base_url)
     _filter_items_with_forbidden_words(url_candidates)
-    _filter_user_name_without_link_includes_date(url_candidates)
+    _filter_user_name_without_link_includes_date(url_candidates, document.languages)
     _filter_post_links(url_candidates)
-    _filter_more_than_one_element_per_post(url_candidates, post_elements)
+    _filter_more_than_one_element_per_post(url_candidates, post_elements, document.element_intervals)
 
     _set_user_hint_exits(url_candidates)
     _set_text_changes(url_candidates)
@@ -218,17 +219,18 @@ def get_user(dom, post_xpath, base_url, posts):
     Obtains the URL to the given post.
 
     Args:
-        - dom: the forums DOM object
+        - dom: the forums DOM object (or harvest.document.Document)
         - post_xpath: the determined post xpath
         - base url: URL of the given forum
         - posts: the extracted posts
     """
     logging.info('Start finding user name')
-    post_elements = dom.xpath(post_xpath)
+    document = Document.from_dom(dom)
+    post_elements = document.xpath(post_xpath)
     while True:
-        result = _get_user(dom, post_elements, base_url, posts)
+        result = _get_user(document, post_elements, base_url, posts)
         if result or len(post_elements) <= 1:
             logging.info(f'User name xpath: {result}')
             return result
         post_xpath = post_xpath + "/.."
-        post_elements = dom.xpath(post_xpath)
+        post_elements = document.xpath(post_xpath)
@@ -10,7 +10,7 @@ def get_text_xpath_pattern(dom, post_xpath, posts):
     Get the xpath to extract only the text of a post
 
     Args:
-        - dom: the forums DOM object
+        - dom: the forums DOM object (or harvest.document.Document)
         - post_xpath: the determined post xpath
         - posts: the extracted posts
     """
@@ -0,0 +1,379 @@
+'''
+Instrumentation of the extraction stages.
+
+harvest reports the duration of its stages and counters (e.g. dateparser
+calls) to the instrumentation sink of the current context. Embedding
+applications install a sink (see :class:`InstrumentationSink`) for a block
+with :func:`use_sink` or pass it to :func:`harvest.extract_data`,
+:func:`harvest.posts.extract_posts` and :func:`harvest.extract.extract_posts`::
+
+   with record_page() as page_metrics:
+       extract_data(html, url)
+   print(page_metrics.stages, page_metrics.counters)
+
+Sinks are context-local (i.e. per thread and asyncio task; per thread only
+on Python 3.6, which lacks :mod:`contextvars`). If no sink is installed, the
+instrumentation only costs a context variable lookup.
+
+Stages:
+
+- parse: parsing the HTML with lxml.
+- render: rendering the page with inscriptis.
+- text_cleaning: cleaning the rendered text sections.
+- section_matching: matching text sections to DOM nodes (post candidates).
+- node_assessment: assessing the similarity of nodes to the page's text.
+- frame_ascent: ascending to the post frame.
+- class_combination: combining the classes of the post frame.
+- link, date, user: detecting the post links, dates and users.
+- boilerplate_removal: removing common prefixes and suffixes from posts.
+- apply: applying the xpath patterns (:func:`harvest.extract.extract_posts`).
+
+Stages may be nested (e.g. node_assessment within section_matching) and
+their durations include the durations of the nested stages.
+
+:class:`Registry` aggregates measurements (e.g. in the web service) and
+exposes them in the Prometheus text format.
+'''
+
+import time
+
+from bisect import bisect_left
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from functools import wraps
+from threading import Lock, local
+
+try:
+    from contextvars import ContextVar
+except ImportError:  # Python 3.6
+    ContextVar = None
+
+# histogram buckets for durations in seconds
+DURATION_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+class _ThreadLocalVar(local):
+    '''
+    A thread-local replacement of :class:`contextvars.ContextVar`.
+    '''
+
+    def __init__(self, name, default=None):
+        self.value = default
+
+    def get(self):
+        return self.value
+
+    def set(self, value):
+        token = self.value
+        self.value = value
+        return token
+
+    def reset(self, token):
+        self.value = token
+
+
+class _NoStage:
+
+    def __enter__(self):
+        pass
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        pass
+
+
+# the instrumentation sink of the current context
+_sink = (ContextVar or _ThreadLocalVar)('harvest_instrumentation_sink', default=None)
+_no_stage = _NoStage()
+
+
+class InstrumentationSink:
+    '''
+    Receives the instrumentation events of harvest. Subclasses override the
+    events they are interested in.
+    '''
+
+    def on_stage(self, name, duration):
+        '''
+        Called when a stage has been left (`duration` in seconds).
+        '''
+
+    def on_error(self, name, exception):
+        '''
+        Called when a stage is left with an exception (before
+        :meth:`on_stage`).
+        '''
+
+    def on_counter(self, name, value):
+        '''
+        Called when a counter is incremented by `value`.
+        '''
+
+    def on_value(self, name, value):
+        '''
+        Called when a value of the page (e.g. the number of DOM nodes) is
+        observed.
+        '''
+
+
+class PageMetrics(InstrumentationSink):
+    '''
+    A sink that aggregates the measurements of a single page.
+
+    Attributes:
+      stages (dict): the total duration of every stage in seconds.
+      counters (Counter): the counters of the page.
+      values (dict): values observed for the page (e.g. the number of DOM
+        nodes).
+      failed_stage (str): the innermost stage that raised an exception or
+        None.
+    '''
+
+    def __init__(self):
+        self.stages = defaultdict(float)
+        self.counters = Counter()
+        self.values = {}
+        self.failed_stage = None
+
+    def on_stage(self, name, duration):
+        self.stages[name] += duration
+
+    def on_error(self, name, exception):
+        if self.failed_stage is None:
+            self.failed_stage = name
+
+    def on_counter(self, name, value):
+        self.counters[name] += value
+
+    def on_value(self, name, value):
+        self.values[name] = value
+
+
+def get_sink():
+    '''
+    Returns:
+      InstrumentationSink -- the sink of the current context or None.
+    '''
+    return _sink.get()
+
+
+@contextmanager
+def use_sink(sink):
+    '''
+    Installs the sink for the enclosed block.
+    '''
+    token = _sink.set(sink)
+    try:
+        yield sink
+    finally:
+        _sink.reset(token)
+
+
+def record_page():
+    '''
+    Records the stages and counters of the enclosed block.
+
+    Returns:
+      PageMetrics -- the sink of the block.
+    '''
+    return use_sink(PageMetrics())
+
+
+def accepts_sink(function):
+    '''
+    Adds the keyword argument `sink` to a function, which installs the given
+    sink while the function runs.
+    '''
+    @wraps(function)
+    def wrapper(*args, sink=None, **kwargs):
+        if sink is None:
+            return function(*args, **kwargs)
+        with use_sink(sink):
+            return function(*args, **kwargs)
+    return wrapper
+
+
+class _Stage:
+
+    __slots__ = ('sink', 'name', 'start')
+
+    def __init__(self, sink, name):
+        self.sink = sink
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        duration = time.perf_counter() - self.start
+        if exc_type is not None:
+            self.sink.on_error(self.name, exc_value)
+        self.sink.on_stage(self.name, duration)
+
+
+def stage(name):
+    '''
+    Returns:
+      a context manager that reports the duration of the enclosed block as
+      stage `name`.
+    '''
+    sink = _sink.get()
+    return _no_stage if sink is None else _Stage(sink, name)
+
+
+def timed(name):
+    '''
+    Decorator that reports the duration of every call as stage `name`.
+    '''
+    def decorator(function):
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            sink = _sink.get()
+            if sink is None:
+                return function(*args, **kwargs)
+            with _Stage(sink, name):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def increment(name, value=1):
+    '''
+    Increments the counter `name`.
+    '''
+    sink = _sink.get()
+    if sink is not None:
+        sink.on_counter(name, value)
+
+
+def observe(name, value):
+    '''
+    Reports a value (e.g. the page size) of the current page.
+    '''
+    sink = _sink.get()
+    if sink is not None:
+        sink.on_value(name, value)
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    escaped = (str(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n') for _, value in labels)
+    return '{' + ','.join(f'{key}="{value}"' for (key, _), value in zip(labels, escaped)) + '}'
+
+
+def _format_value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+
+    metric_type = None
+
+    def __init__(self, name, documentation):
+        self.name = name
+        self.documentation = documentation
+        self._values = {}
+        self._lock = Lock()
+
+    def expose(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.metric_type}']
+        with self._lock:
+            for labels, value in sorted(self._values.items()):
+                lines.extend(self._expose(labels, value))
+        return lines
+
+    def _expose(self, labels, value):
+        return [f'{self.name}{_format_labels(labels)} {_format_value(value)}']
+
+
+class CounterMetric(_Metric):
+    '''
+    A monotonically increasing counter.
+    '''
+
+    metric_type = 'counter'
+
+    def inc(self, value=1, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + value
+
+
+class GaugeMetric(_Metric):
+    '''
+    A value that may go up and down.
+    '''
+
+    metric_type = 'gauge'
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[tuple(sorted(labels.items()))] = value
+
+    def inc(self, value=1, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + value
+
+    def dec(self, value=1, **labels):
+        self.inc(-value, **labels)
+
+
+class HistogramMetric(_Metric):
+    '''
+    Counts observations in cumulative buckets.
+    '''
+
+    metric_type = 'histogram'
+
+    def __init__(self, name, documentation, buckets=DURATION_BUCKETS):
+        super().__init__(name, documentation)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            counts, total = self._values.get(key, ([0] * (len(self.buckets) + 1), 0))
+            counts[bisect_left(self.buckets, value)] += 1
+            self._values[key] = (counts, total + value)
+
+    def _expose(self, labels, value):
+        counts, total = value
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + ('+Inf', ), counts):
+            cumulative += count
+            bucket_labels = labels + (('le', bound if bound == '+Inf' else _format_value(float(bound))), )
+            lines.append(f'{self.name}_bucket{_format_labels(bucket_labels)} {cumulative}')
+        lines.append(f'{self.name}_sum{_format_labels(labels)} {_format_value(float(total))}')
+        lines.append(f'{self.name}_count{_format_labels(labels)} {cumulative}')
+        return lines
+
+
+class Registry:
+    '''
+    A collection of metrics that are exposed in the Prometheus text format.
+    '''
+
+    def __init__(self):
+        self._metrics = []
+
+    def _register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name, documentation):
+        return self._register(CounterMetric(name, documentation))
+
+    def gauge(self, name, documentation):
+        return self._register(GaugeMetric(name, documentation))
+
+    def histogram(self, name, documentation, buckets=DURATION_BUCKETS):
+        return self._register(HistogramMetric(name, documentation, buckets))
+
+    def expose(self):
+        '''
+        Returns:
+          str -- the metrics in the Prometheus text exposition format.
+        '''
+        return '\n'.join(line for metric in self._metrics for line in metric.expose()) + '\n'
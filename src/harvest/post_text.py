@@ -1,4 +1,7 @@
 from inscriptis import get_text
+from inscriptis.html_engine import Inscriptis
+
+from harvest import metrics
 
 WORDS_TO_IGNORE_DE = {'cookies', 'startseite', 'datenschutzerklärung', 'impressum', 'nutzungsbedingungen',
                       'registrieren'}
@@ -6,14 +9,25 @@ WORDS_TO_IGNORE_EN = {'forum home', 'sign in', 'sign up'}
 WORDS_TO_IGNORE = WORDS_TO_IGNORE_DE.union(WORDS_TO_IGNORE_EN)
 
 
-def get_cleaned_text(html):
+def get_cleaned_text(html, dom=None):
+    """
+    Args:
+        html: the HTML page to render.
+        dom: an optional, already parsed DOM of the page which is rendered instead of parsing `html` again.
+
+    Returns:
+        list -- the cleaned text sections of the page.
+    """
     text_sections = []
-    text = get_text(html)
-    for comment in (c for c in text.split("\n") if c.strip()):
-        if [word for word in WORDS_TO_IGNORE if word in comment.lower()]:
-            continue
-        elif 'copyright' not in comment.lower() and '©' not in comment.lower() and 'powered by' not in comment.lower():
-            text_sections.append(comment.strip())
-        else:
-            break
+    with metrics.stage('render'):
+        text = get_text(html) if dom is None else Inscriptis(dom).get_text()
+    with metrics.stage('text_cleaning'):
+        for comment in (c for c in text.split("\n") if c.strip()):
+            if [word for word in WORDS_TO_IGNORE if word in comment.lower()]:
+                continue
+            elif 'copyright' not in comment.lower() and '©' not in comment.lower() \
+                    and 'powered by' not in comment.lower():
+                text_sections.append(comment.strip())
+            else:
+                break
     return text_sections
\ No newline at end of file
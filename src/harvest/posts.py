@@ -37,14 +37,15 @@ import re
 
 from lxml import etree
 
+from harvest import metrics
 from harvest.cleanup.forum_post import remove_boilerplate
-from harvest.metadata.date import get_date
+from harvest.document import Document
+from harvest.metadata.date import get_date, get_date_format
 from harvest.metadata.link import get_link
 from harvest.metadata.username import get_user
 from harvest.metadata.usertext import get_text_xpath_pattern
-from harvest.post_text import get_cleaned_text
-from harvest.similarity_calculator import assess_node
-from harvest.utils import (get_xpath_expression, get_html_dom, get_xpath_combinations_for_classes,
+from harvest.similarity_calculator import NodeScorer
+from harvest.utils import (get_xpath_expression, get_xpath_combinations_for_classes,
                            get_xpath_tree_text, get_grandparent, elements_have_no_overlap)
 
 CORPUS = "./data/forum/"
@@ -58,31 +59,43 @@ BLACKLIST_POST_TEXT_TAG = ('h1', 'h2', 'h3', 'h4', 'h5', 'a')
 MIN_POST_COUNT = 3
 
 
-def _get_matching_element(comment, dom):
+def _get_text_prefix_index(dom):
     """
     returns
     -------
-    the element that matches the given comment
+    a dictionary that maps the first MATCH_PREFIX_SIZE characters of every element's (stripped) text to the first
+    element in document order that starts with this prefix.
     """
-    if not comment.strip():
-        return None
-
+    text_index = {}
     for e in dom.iter():
         text = (e.text or "").strip()
-        min_length_of_text = len(comment[:MATCH_PREFIX_SIZE])
-        if text and comment.startswith(text[:MATCH_PREFIX_SIZE]) and len(text) >= min_length_of_text and \
-                e.tag is not etree.Comment:
-            return e
+        if text and e.tag is not etree.Comment:
+            text_index.setdefault(text[:MATCH_PREFIX_SIZE], e)
+    return text_index
+
+
+def _get_matching_element(comment, text_index):
+    """
+    An element matches the comment, if its text starts with the comment's first MATCH_PREFIX_SIZE characters and (for
+    comments shorter than MATCH_PREFIX_SIZE) equals the comment. Both conditions are met, if the element's and the
+    comment's MATCH_PREFIX_SIZE prefixes are identical.
+
+    returns
+    -------
+    the first element (in document order) that matches the given comment
+    """
+    if not comment.strip():
+        return None
 
-    return None
+    return text_index.get(comment[:MATCH_PREFIX_SIZE])
 
 
-def _get_xpath_tree(comment, dom, tree):
-    element = _get_matching_element(comment, dom)
+def _get_xpath_tree(comment, text_index, tree):
+    element = _get_matching_element(comment, text_index)
     return (None, None) if element is None else (element, tree.getpath(element))
 
 
-def _remove_trailing_p_element(xpath_score, xpath_element_count, xpath, reference_text, dom):
+def _remove_trailing_p_element(xpath_score, xpath_element_count, xpath, scorer):
     """
     The p elements at the end can be removed. Some posts have several p elements and some have none at all.
     Those without p element can then not be detected. As Example, leading post can not be detected:
@@ -96,36 +109,33 @@ def _remove_trailing_p_element(xpath_score, xpath_element_count, xpath, referenc
     """
     cleaned_xpath = re.sub(r'(?<!([\/]))\/p$', '', xpath)
     if cleaned_xpath != xpath:
-        xpath_score, xpath_element_count = assess_node(reference_content=reference_text, dom=dom,
-                                                       xpath=cleaned_xpath)
+        xpath_score, xpath_element_count = scorer.assess_node(xpath=cleaned_xpath)
     return xpath_score, xpath_element_count, cleaned_xpath
 
 
-def _get_xpaths_candidates(text_sections, dom, tree, reference_text):
+def _get_xpaths_candidates(text_sections, dom, tree, scorer):
     candidate_xpaths = []
+    text_index = _get_text_prefix_index(dom)
     for section_text in text_sections:
-        element, xpath = _get_xpath_tree(section_text, dom, tree)
+        element, xpath = _get_xpath_tree(section_text, text_index, tree)
         logging.debug(f"Processing section of text '{section_text}' with xpath '{xpath}'.")
         if not xpath:
             continue
-        element = _get_matching_element(section_text, dom)
         if element.tag not in BLACKLIST_POST_TEXT_TAG:
             xpath_pattern = get_xpath_expression(element, parent_element=get_grandparent(element),
                                                  single_class_filter=True)
 
-            xpath_score, xpath_element_count = assess_node(reference_content=reference_text, dom=dom,
-                                                           xpath=xpath_pattern, reward_classes=True)
+            xpath_score, xpath_element_count = scorer.assess_node(xpath=xpath_pattern, reward_classes=True)
             if xpath_element_count > 1:
                 candidate_xpaths.append((xpath_score, xpath_element_count, xpath_pattern))
 
     return candidate_xpaths
 
 
-def _get_post_frame(xpath_pattern, xpath_score, reference_text, dom):
+def _get_post_frame(xpath_pattern, xpath_score, scorer):
     while True:
         new_xpath_pattern = xpath_pattern + "/.."
-        new_xpath_score, new_xpath_element_count = assess_node(reference_content=reference_text, dom=dom,
-                                                               xpath=new_xpath_pattern)
+        new_xpath_score, new_xpath_element_count = scorer.assess_node(xpath=new_xpath_pattern)
         if new_xpath_element_count < MIN_POST_COUNT:
             return xpath_pattern, xpath_score
 
@@ -133,15 +143,15 @@ def _get_post_frame(xpath_pattern, xpath_score, reference_text, dom):
         xpath_score = new_xpath_score
 
 
-def _get_combination_of_posts(xpath_pattern, xpath_score, xpath_element_count, reference_text, dom):
+def _get_combination_of_posts(xpath_pattern, xpath_score, xpath_element_count, scorer, document):
     """
     Check if combinations of classes result in detecting leading post
     Args:
         xpath_pattern:
         xpath_score:
         xpath_element_count:
-        reference_text:
-        dom:
+        scorer: the NodeScorer of the page
+        document: the Document of the forum page
 
     Returns:
     Combination of classes if they resulting in a better score. Otherwise the parameters xpath_patter, xpath_score and
@@ -149,11 +159,10 @@ def _get_combination_of_posts(xpath_pattern, xpath_score, xpath_element_count, r
     """
     candidate_xpaths = []
     for final_xpath in get_xpath_combinations_for_classes(xpath_pattern):
-        new_xpath_score, new_xpath_element_count = assess_node(reference_content=reference_text, dom=dom,
-                                                               xpath=final_xpath)
+        new_xpath_score, new_xpath_element_count = scorer.assess_node(xpath=final_xpath)
         if (xpath_element_count < new_xpath_element_count <= xpath_element_count + 2 or
             xpath_element_count * 2 - new_xpath_element_count in range(-1, 2)) and new_xpath_score > xpath_score:
-            if elements_have_no_overlap(dom.xpath(final_xpath)):
+            if elements_have_no_overlap(document.xpath(final_xpath), document.element_intervals):
                 candidate_xpaths.append((new_xpath_score, new_xpath_element_count, final_xpath))
 
     if candidate_xpaths:
@@ -162,39 +171,59 @@ def _get_combination_of_posts(xpath_pattern, xpath_score, xpath_element_count, r
     return xpath_score, xpath_element_count, xpath_pattern
 
 
-def extract_posts(html, url):
-    dom = get_html_dom(html)
-    tree = etree.ElementTree(dom)
+@metrics.accepts_sink
+def extract_posts(html, url, document=None):
+    """
+    Learns the xpath patterns of the posts and their metadata for the given forum page.
+
+    Args:
+        html: the HTML of the forum page.
+        url: the URL of the forum page.
+        document: an optional :class:`harvest.document.Document` of the page, which is used instead of parsing
+                  `html` again.
+        sink: an optional :class:`harvest.metrics.InstrumentationSink` that receives the timings and counters of
+              the extraction stages (default: the sink of the current context).
+
+    Returns:
+        dict -- the learned xpath patterns and the extracted forum posts.
+    """
+    if document is None:
+        document = Document(html, url)
+    dom = document.dom
+    tree = document.tree
     result = {'url': url, 'dragnet': None, 'url_xpath_pattern': None, 'xpath_pattern': None,
               'xpath_score': None, 'forum_posts': None, 'date_xpath_pattern': None, 'user_xpath_pattern': None,
-              'text_xpath_pattern': None}
+              'text_xpath_pattern': None, 'date_format': None}
 
-    text_sections = get_cleaned_text(html)
+    text_sections = document.text_sections
     logging.debug(f"Extracted {len(text_sections)} lines of comments.")
-    reference_text = " ".join(text_sections)
+    scorer = NodeScorer(document.reference_text, document)
 
-    candidate_xpaths = _get_xpaths_candidates(text_sections, dom, tree, reference_text)
+    with metrics.stage('section_matching'):
+        candidate_xpaths = _get_xpaths_candidates(text_sections, dom, tree, scorer)
 
     if not candidate_xpaths:
-        logging.warning("Couldn't identify any candidate posts for forum", url)
+        logging.warning(f"Couldn't identify any candidate posts for forum {url}")
         return result
 
     # obtain anchor node
     candidate_xpaths.sort()
     xpath_score, xpath_element_count, xpath_pattern = candidate_xpaths.pop()
     xpath_score, xpath_element_count, xpath_pattern = _remove_trailing_p_element(xpath_score, xpath_element_count,
-                                                                                 xpath_pattern, reference_text, dom)
+                                                                                 xpath_pattern, scorer)
 
-    xpath_pattern, xpath_score = _get_post_frame(xpath_pattern, xpath_score, reference_text, dom)
+    with metrics.stage('frame_ascent'):
+        xpath_pattern, xpath_score = _get_post_frame(xpath_pattern, xpath_score, scorer)
 
-    xpath_score, xpath_element_count, xpath_pattern = _get_combination_of_posts(xpath_pattern, xpath_score,
-                                                                                xpath_element_count, reference_text,
-                                                                                dom)
+    with metrics.stage('class_combination'):
+        xpath_score, xpath_element_count, xpath_pattern = _get_combination_of_posts(xpath_pattern, xpath_score,
+                                                                                    xpath_element_count, scorer,
+                                                                                    document)
 
     logging.info(
         f"Obtained most likely forum xpath for forum {url}: {xpath_pattern} with a score of {xpath_score}.")
     if xpath_pattern:
-        forum_posts = get_xpath_tree_text(dom, xpath_pattern)
+        forum_posts = get_xpath_tree_text(document, xpath_pattern, subtree_text=document.subtree_text)
         forum_posts = remove_boilerplate(forum_posts)
 
     result['xpath_pattern'] = xpath_pattern
@@ -202,20 +231,24 @@ def extract_posts(html, url):
     result['forum_posts'] = forum_posts
 
     if xpath_pattern:
-        result['text_xpath_pattern'] = get_text_xpath_pattern(dom, xpath_pattern, forum_posts)
+        result['text_xpath_pattern'] = get_text_xpath_pattern(document, xpath_pattern, forum_posts)
 
     # add the post URL
-    url_xpath_pattern = get_link(dom, xpath_pattern, url, forum_posts)
+    with metrics.stage('link'):
+        url_xpath_pattern = get_link(document, xpath_pattern, url, forum_posts)
     if url_xpath_pattern:
         result['url_xpath_pattern'] = url_xpath_pattern
 
     # add the post Date
-    date_xpath_pattern = get_date(dom, xpath_pattern, url, forum_posts)
-    if date_xpath_pattern:
-        result['date_xpath_pattern'] = date_xpath_pattern
+    with metrics.stage('date'):
+        date_xpath_pattern = get_date(document, xpath_pattern, url, forum_posts)
+        if date_xpath_pattern:
+            result['date_xpath_pattern'] = date_xpath_pattern
+            result['date_format'] = get_date_format(document, date_xpath_pattern)
 
     # add the post user
-    user_xpath_pattern = get_user(dom, xpath_pattern, url, forum_posts)
+    with metrics.stage('user'):
+        user_xpath_pattern = get_user(document, xpath_pattern, url, forum_posts)
     if user_xpath_pattern:
         result['user_xpath_pattern'] = user_xpath_pattern
     return result
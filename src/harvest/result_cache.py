@@ -0,0 +1,116 @@
+'''
+Caches extraction results by content.
+
+Crawlers frequently resubmit identical pages (recrawls of unchanged threads,
+retries). The :class:`ResultCache` stores extraction results under a hash of
+the page's domain, its HTML and the harvest version (see
+:func:`get_result_key`), so that repeated pages cost a hash and a lookup
+rather than a full extraction. Results are kept in an in-memory LRU cache
+that is optionally backed by a SQLite database, which keeps the most
+recently stored results.
+'''
+
+import hashlib
+import json
+import sqlite3
+
+from collections import OrderedDict
+from threading import Lock
+from urllib.parse import urlparse
+
+from harvest import __version__
+
+
+def get_result_key(url, html, *variant):
+    '''
+    Args:
+      url (str): the URL of the forum page.
+      html (str): the page's HTML.
+      variant: optional values that influence the result (e.g. the output
+        format).
+
+    Returns:
+      str -- the hex digest that identifies the extraction result. It also
+      serves as HTTP entity tag.
+    '''
+    key = hashlib.sha256()
+    for value in (__version__, urlparse(url).netloc.lower(), *variant):
+        key.update(str(value).encode('utf-8'))
+        key.update(b'\0')
+    key.update(html.encode('utf-8', 'surrogatepass') if isinstance(html, str) else html)
+    return key.hexdigest()
+
+
+class ResultCache:
+    '''
+    An LRU cache of extraction results with an optional SQLite backing file.
+
+    Args:
+      max_size (int): the maximum number of results kept in memory.
+      path (str): an optional SQLite database that persists the results.
+      max_stored (int): the maximum number of results kept in the database.
+        Storing a result removes the results that have been stored before
+        the last `max_stored` results.
+    '''
+
+    def __init__(self, max_size=1024, path=None, max_stored=65536):
+        self.max_size = max_size
+        self.max_stored = max_stored
+        self.hits = 0
+        self.misses = 0
+        self._results = OrderedDict()
+        self._lock = Lock()
+        self._db = None
+        if path:
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute('CREATE TABLE IF NOT EXISTS results (key TEXT PRIMARY KEY, result TEXT NOT NULL)')
+            self._db.commit()
+
+    def __len__(self):
+        return len(self._results)
+
+    def _remember(self, key, result):
+        self._results[key] = result
+        self._results.move_to_end(key)
+        while len(self._results) > self.max_size:
+            self._results.popitem(last=False)
+
+    def get(self, key):
+        '''
+        Returns:
+          the cached result for the given key or None, if the result is not
+          known.
+        '''
+        with self._lock:
+            result = self._results.get(key)
+            if result is not None:
+                self._results.move_to_end(key)
+            elif self._db is not None:
+                row = self._db.execute('SELECT result FROM results WHERE key = ?', (key,)).fetchone()
+                if row:
+                    result = json.loads(row[0])
+                    self._remember(key, result)
+
+            if result is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            return result
+
+    def put(self, key, result):
+        '''
+        Stores a (JSON serializable) extraction result.
+        '''
+        with self._lock:
+            self._remember(key, result)
+            if self._db is not None:
+                cursor = self._db.execute('INSERT OR REPLACE INTO results (key, result) VALUES (?, ?)',
+                                          (key, json.dumps(result)))
+                # rowids increase with every stored (or replaced) result
+                self._db.execute('DELETE FROM results WHERE rowid <= ?', (cursor.lastrowid - self.max_stored, ))
+                self._db.commit()
+
+    def close(self):
+        if self._db is not None:
+            self._db.close()
+            self._db = None
@@ -1,11 +1,15 @@
-from itertools import chain
+from functools import lru_cache
+from zlib import crc32
 
-from harvest.utils import get_xpath_tree_text
+from harvest import metrics
+from harvest.document import Document
 import logging
 import re
 import numpy as np
 
 VSM_MODEL_SIZE = 5000
+# number of token ids cached by _get_token_id
+TOKEN_ID_CACHE_SIZE = 2 ** 16
 
 # tags that are not allowed to be part of a forum xpath (lowercase)
 BLACKLIST_TAGS = ('option', 'footer', 'form', 'head', 'tfoot')
@@ -19,32 +23,131 @@ def _text_to_vsm(text):
 
     VSM_MODEL_SIZE determines the size of the vsm.
     '''
-    vms = np.full(VSM_MODEL_SIZE, 0)
-    for word in text.split():
-        index = word.__hash__() % VSM_MODEL_SIZE
-        vms[index] += 1
-    return vms
+    return np.bincount(text_to_token_ids(text), minlength=VSM_MODEL_SIZE)
 
 
-def _descendants_contain_blacklisted_tag(xpath, dom, blacklisted_tags):
-    descendants = set([t.tag for t in chain(*[e.iterdescendants() for e in dom.xpath(xpath)])])
-    for tag in blacklisted_tags:
-        if tag in descendants:
-            return True
-    return False
+@lru_cache(maxsize=TOKEN_ID_CACHE_SIZE)
+def _get_token_id(word):
+    '''
+    returns
+    -------
+    the word's dimension in the vector space model. In contrast to str.__hash__ the CRC32 checksum does not depend on
+    PYTHONHASHSEED and, therefore, yields the same dimension in every process.
+    '''
+    return crc32(word.encode('utf-8', 'surrogatepass')) % VSM_MODEL_SIZE
+
+
+def text_to_token_ids(text):
+    '''
+    returns
+    -------
+    the dimensions of the text's words in the vector space model (hashing trick). The token ids are stable across
+    processes and runs and, therefore, can be persisted (see :func:`save_token_ids`) and shared between workers.
+    '''
+    return np.fromiter((_get_token_id(word) for word in text.split()), dtype=np.uint16)
+
+
+def save_token_ids(file, token_ids):
+    '''
+    Stores a list of token id vectors (see :func:`text_to_token_ids`) in a single .npz file.
+
+    The vectors are concatenated and stored together with their offsets and the VSM_MODEL_SIZE they have been
+    computed with.
+    '''
+    offsets = np.cumsum([0] + [len(ids) for ids in token_ids])
+    ids = np.concatenate(token_ids).astype(np.uint16) if token_ids else np.empty(0, dtype=np.uint16)
+    np.savez(file, token_ids=ids, offsets=offsets, vsm_model_size=VSM_MODEL_SIZE)
+
+
+def load_token_ids(file):
+    '''
+    returns
+    -------
+    the list of token id vectors stored with :func:`save_token_ids`.
 
+    raises
+    ------
+    ValueError if the vectors have been computed for a different VSM_MODEL_SIZE.
+    '''
+    with np.load(file) as data:
+        if int(data['vsm_model_size']) != VSM_MODEL_SIZE:
+            raise ValueError(f"Token ids have been computed for a VSM_MODEL_SIZE of {int(data['vsm_model_size'])} "
+                             f"rather than {VSM_MODEL_SIZE}.")
+        ids, offsets = data['token_ids'], data['offsets']
+    return [ids[start:end] for start, end in zip(offsets[:-1], offsets[1:])]
+
+
+def _token_ids_to_sparse_vsm(token_ids):
+    '''
+    returns
+    -------
+    the non-zero dimensions of the vector space model and their counts.
+    '''
+    return np.unique(token_ids, return_counts=True)
+
+
+class TagMasks:
+    """
+    Encodes a set of tags as bits and annotates every element of a DOM (in a single pass) with the bitmask of the tags
+    that occur among its descendants. Testing whether the descendants of a node contain any of these tags, therefore,
+    only requires OR-ing integers.
 
-def _ancestors_contains_blacklisted_tag(xpath_string, blacklisted_tags):
+    The ancestor test considers the steps of the xpath expression rather than the element's ancestors in the DOM, so
+    that forums which are (as a whole) contained in a blacklisted tag such as 'form' are still detected.
+    """
+
+    def __init__(self, dom, tags):
+        self.bits = {tag: 1 << no for no, tag in enumerate(tags)}
+        self.descendant_masks = {}
+        self.xpath_masks = {}
+        if dom is None:
+            return
+
+        # reversed document order visits all children before their parent
+        for element in reversed(list(dom.iter())):
+            mask = 0
+            for child in element:
+                mask |= self.bits.get(child.tag, 0) | self.descendant_masks.get(child, 0)
+            if mask:
+                self.descendant_masks[element] = mask
+
+    def get_descendant_mask(self, elements):
+        """
+        returns
+        -------
+        the bitmask of the tags that occur among the descendants of the given elements
+        """
+        mask = 0
+        for element in elements:
+            mask |= self.descendant_masks.get(element, 0)
+        return mask
+
+    def get_xpath_mask(self, xpath_string):
+        """
+        returns
+        -------
+        the bitmask of the tags that are a step of the given xpath
+        """
+        mask = self.xpath_masks.get(xpath_string)
+        if mask is None:
+            mask = 0
+            for step in xpath_string.split("/"):
+                mask |= self.bits.get(step, 0)
+            self.xpath_masks[xpath_string] = mask
+        return mask
+
+
+def _descendants_contain_blacklisted_tag(elements, tag_masks):
+    return tag_masks.get_descendant_mask(elements) != 0
+
+
+def _ancestors_contains_blacklisted_tag(xpath_string, tag_masks):
     """
     returns
     -------
     True, if the xpath_string (i.e. the ancestors) contains any blacklisted_tag
     """
-    xpath = xpath_string.split("/")
-    for tag in blacklisted_tags:
-        if tag in xpath:
-            return True
-    return False
+    return tag_masks.get_xpath_mask(xpath_string) != 0
 
 
 def _ancestors_contains_class(xpath, rewarded_classes):
@@ -57,35 +160,76 @@ def _ancestors_contains_class(xpath, rewarded_classes):
                     return True
 
 
+class NodeScorer:
+    """
+    Assesses nodes against the reference content of a forum page.
+
+    The reference content is vectorized only once per page, candidate nodes are represented by sparse vectors (the
+    non-zero dimensions and their counts) and compared to the reference without creating dense arrays. The token ids
+    of the page's text fragments are computed once, so that the tokens of any subtree are a slice of them.
+    """
+
+    def __init__(self, reference_content, dom):
+        self.reference_content = reference_content
+        self.document = Document.from_dom(dom)
+        self.reference_vsm = _text_to_vsm(reference_content)
+        self.reference_norm = np.linalg.norm(self.reference_vsm)
+
+        self.subtree_text = self.document.subtree_text
+        self.tag_masks = TagMasks(self.document.dom, BLACKLIST_TAGS)
+        fragment_token_ids = [text_to_token_ids(fragment) for fragment in self.subtree_text.fragments]
+        self.token_ids = np.concatenate(fragment_token_ids) if fragment_token_ids else np.empty(0, dtype=np.uint16)
+        self.token_offsets = np.cumsum([0] + [len(token_ids) for token_ids in fragment_token_ids])
+
+    def _get_token_ids(self, element):
+        span = self.subtree_text.get_span(element)
+        if span is None:
+            return text_to_token_ids(self.subtree_text.get_text(element))
+        return self.token_ids[self.token_offsets[span[0]]:self.token_offsets[span[1]]]
+
+    @metrics.timed('node_assessment')
+    def assess_node(self, xpath, reward_classes=False):
+        """
+        returns
+        -------
+        a metric that is based on
+          (i) the vector space model and
+         (ii) the number of returned elements
+        (iii) whether the descendants contain any blacklisted tags
+        to assess whether the node is likely to be part of a forum post.
+        """
+        if xpath == "//":
+            return 0., 1
+
+        xpath_elements = self.document.xpath(xpath)
+        if _descendants_contain_blacklisted_tag(xpath_elements, self.tag_masks):
+            return 0., 1
+
+        xpath_element_count = len(xpath_elements)
+
+        token_ids = [self._get_token_ids(element) for element in xpath_elements]
+        dimensions, counts = _token_ids_to_sparse_vsm(np.concatenate(token_ids) if token_ids else
+                                                      np.empty(0, dtype=np.uint16))
+
+        divisor = self.reference_norm * np.sqrt(np.dot(counts, counts))
+        if not divisor:
+            logging.warning("Cannot compute similarity - empty reference (%s) or xpath (%ss) text.",
+                            self.reference_content,
+                            ' '.join(self.subtree_text.get_text(element) for element in xpath_elements))
+            return 0., 1
+        similarity = np.dot(self.reference_vsm[dimensions], counts) / divisor
+
+        # discount any node that contains BLACKLIST_TAGS
+        if _ancestors_contains_blacklisted_tag(xpath, self.tag_masks):
+            similarity /= 10
+        elif reward_classes and _ancestors_contains_class(xpath, REWARDED_CLASSES):
+            similarity += 0.1
+        return similarity, xpath_element_count
+
+
 def assess_node(reference_content, dom, xpath, reward_classes=False):
     """
-    returns
-    -------
-    a metric that is based on
-      (i) the vector space model and
-     (ii) the number of returned elements
-    (iii) whether the descendants contain any blacklisted tags
-    to assess whether the node is likely to be part of a forum post.
+    Assesses a single node (see :meth:`NodeScorer.assess_node`). Use a :class:`NodeScorer` for assessing multiple
+    nodes of the same page.
     """
-    if xpath == "//" or _descendants_contain_blacklisted_tag(xpath, dom, BLACKLIST_TAGS):
-        return 0., 1
-
-    xpath_content_list = get_xpath_tree_text(dom, xpath)
-    xpath_element_count = len(xpath_content_list)
-
-    reference_vsm = _text_to_vsm(reference_content)
-    xpath_vsm = _text_to_vsm(' '.join(xpath_content_list))
-
-    divisor = (np.linalg.norm(reference_vsm) * np.linalg.norm(xpath_vsm))
-    if not divisor:
-        logging.warning("Cannot compute similarity - empty reference (%s) or xpath (%ss) text.", reference_content,
-                        ' '.join(xpath_content_list))
-        return 0., 1
-    similarity = np.dot(reference_vsm, xpath_vsm) / divisor
-
-    # discount any node that contains BLACKLIST_TAGS
-    if _ancestors_contains_blacklisted_tag(xpath, BLACKLIST_TAGS):
-        similarity /= 10
-    elif reward_classes and _ancestors_contains_class(xpath, REWARDED_CLASSES):
-        similarity += 0.1
-    return similarity, xpath_element_count
+    return NodeScorer(reference_content, dom).assess_node(xpath, reward_classes=reward_classes)
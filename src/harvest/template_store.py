@@ -0,0 +1,161 @@
+'''
+Caches the xpath patterns learned for a forum.
+
+Pages of the same forum share their markup and, therefore, the xpath patterns
+(and the format of their post dates) learned by
+:func:`harvest.posts.extract_posts`. The :class:`TemplateStore`
+keeps these patterns per domain (or per domain and path prefix) in an
+in-memory LRU cache that is optionally backed by a SQLite database, so that
+subsequent pages of a known forum skip the learning phase and are directly
+passed to :func:`harvest.extract.extract_posts`.
+'''
+
+import json
+import re
+import sqlite3
+
+from collections import OrderedDict, namedtuple
+from threading import Lock
+from urllib.parse import urlparse
+
+Template = namedtuple('Template', ('text_xpath_pattern', 'url_xpath_pattern', 'date_xpath_pattern',
+                                   'user_xpath_pattern', 'date_format'))
+# the date format is optional (namedtuple's `defaults` requires Python 3.7)
+Template.__new__.__defaults__ = (None, )
+
+# minimum share of non-empty posts required for accepting a cached template
+MIN_NON_EMPTY_RATIO = 0.8
+# minimum number of posts required for accepting a cached template. Learning
+# only accepts post patterns that match more than one element, so that a
+# template that matches a single element (e.g. a sidebar box of a changed
+# layout) has most likely become stale.
+MIN_POST_COUNT = 2
+
+RE_DIGITS = re.compile(r'\d+')
+
+
+def get_template_key(url, path_segments=0):
+    '''
+    Args:
+      url (str): the URL of the forum page.
+      path_segments (int): the number of leading path segments that are
+        considered in addition to the domain.
+
+    Returns:
+      str -- the key under which the forum's template is stored. Digits in
+      the path segments are normalized, so that e.g. ``/forum/12/`` and
+      ``/forum/7/`` share a template.
+    '''
+    parsed_url = urlparse(url)
+    key = parsed_url.netloc.lower()
+    if path_segments:
+        segments = [s for s in parsed_url.path.split('/') if s][:path_segments]
+        key += '/' + '/'.join(RE_DIGITS.sub('0', s) for s in segments)
+    return key
+
+
+def get_template(extract_post_result):
+    '''
+    Returns:
+      Template -- the template learned by :func:`harvest.posts.extract_posts`
+      or None, if no post pattern has been found.
+    '''
+    if not extract_post_result.get('text_xpath_pattern'):
+        return None
+    return Template(**{field: extract_post_result.get(field) for field in Template._fields})
+
+
+def is_valid_extraction(extraction_results):
+    '''
+    Cheap sanity check of the posts extracted with a cached template.
+
+    Returns:
+      bool -- True, if at least MIN_POST_COUNT posts have been extracted and
+      at least MIN_NON_EMPTY_RATIO of them contain text.
+    '''
+    if len(extraction_results) < MIN_POST_COUNT:
+        return False
+    non_empty = sum(1 for result in extraction_results if result.post and result.post.strip())
+    return non_empty / len(extraction_results) >= MIN_NON_EMPTY_RATIO
+
+
+class TemplateStore:
+    '''
+    An LRU cache of forum templates with an optional SQLite backing file.
+
+    Args:
+      max_size (int): the maximum number of templates kept in memory.
+      path (str): an optional SQLite database that persists the templates.
+      path_segments (int): the number of path segments that are part of the
+        template key (see :func:`get_template_key`).
+    '''
+
+    def __init__(self, max_size=1024, path=None, path_segments=0):
+        self.max_size = max_size
+        self.path_segments = path_segments
+        self._templates = OrderedDict()
+        self._lock = Lock()
+        self._db = None
+        if path:
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute('CREATE TABLE IF NOT EXISTS templates (key TEXT PRIMARY KEY, template TEXT NOT NULL)')
+            self._db.commit()
+
+    def __len__(self):
+        return len(self._templates)
+
+    def _remember(self, key, template):
+        self._templates[key] = template
+        self._templates.move_to_end(key)
+        while len(self._templates) > self.max_size:
+            self._templates.popitem(last=False)
+
+    def get(self, url):
+        '''
+        Returns:
+          Template -- the template for the given URL or None, if the forum is
+          not known yet.
+        '''
+        key = get_template_key(url, self.path_segments)
+        with self._lock:
+            template = self._templates.get(key)
+            if template is not None:
+                self._templates.move_to_end(key)
+                return template
+
+            if self._db is not None:
+                row = self._db.execute('SELECT template FROM templates WHERE key = ?', (key,)).fetchone()
+                if row:
+                    stored = json.loads(row[0])
+                    template = Template(**{field: stored.get(field) for field in Template._fields})
+                    self._remember(key, template)
+            return template
+
+    def put(self, url, template):
+        '''
+        Stores the template for the forum of the given URL.
+        '''
+        key = get_template_key(url, self.path_segments)
+        with self._lock:
+            self._remember(key, template)
+            if self._db is not None:
+                self._db.execute('INSERT OR REPLACE INTO templates (key, template) VALUES (?, ?)',
+                                 (key, json.dumps(template._asdict())))
+                self._db.commit()
+
+    def discard(self, url):
+        '''
+        Removes the template for the forum of the given URL (e.g. because it
+        did not yield valid results anymore).
+        '''
+        key = get_template_key(url, self.path_segments)
+        with self._lock:
+            self._templates.pop(key, None)
+            if self._db is not None:
+                self._db.execute('DELETE FROM templates WHERE key = ?', (key,))
+                self._db.commit()
+
+    def close(self):
+        if self._db is not None:
+            self._db.close()
+            self._db = None
@@ -4,10 +4,18 @@ Functions that are shared across modules.
 
 import re
 
+from bisect import bisect_left, bisect_right
+from collections import defaultdict
+from functools import lru_cache
 from lxml import etree
 
 VALID_NODE_TYPE_QUALIFIERS = ('class',)
 RE_FILTER_XML_HEADER = re.compile("<\\?xml version=\".*? encoding=.*?\\?>")
+RE_MULTIPLE_WHITESPACES = re.compile(r'\s\s+')
+RE_CLASS_DETECTION = re.compile(r"\[@class=\".*\"\]")
+RE_CLASS_SYNTAX = re.compile(r"@class=|\"|\[|\]")
+# number of compiled xpath expressions kept by compile_xpath
+XPATH_CACHE_SIZE = 4096
 
 
 def get_html_dom(html_content):
@@ -22,6 +30,45 @@ def get_html_dom(html_content):
     return etree.HTML(html)
 
 
+@lru_cache(maxsize=XPATH_CACHE_SIZE)
+def compile_xpath(expression):
+    '''
+    Returns:
+      etree.XPath -- the compiled xpath expression (cached process-wide).
+    '''
+    return etree.XPath(expression)
+
+
+class XPathEvaluator:
+    '''
+    Evaluates xpath expressions on a single DOM.
+
+    The expressions are compiled only once per process and the results are
+    cached per DOM, since the learning and the extraction phase evaluate the
+    same expressions many times on the same page.
+    '''
+
+    def __init__(self, dom):
+        self.dom = dom
+        self.results = {}
+        self.hits = 0
+        self.misses = 0
+
+    def xpath(self, expression):
+        '''
+        Returns:
+          The result of evaluating the expression on the DOM (a copy of the
+          cached node list, which the caller may modify).
+        '''
+        result = self.results.get(expression)
+        if result is None:
+            self.misses += 1
+            result = self.results[expression] = compile_xpath(expression)(self.dom)
+        else:
+            self.hits += 1
+        return list(result) if isinstance(result, list) else result
+
+
 def extract_text(element):
     '''
     Returns:
@@ -105,15 +152,136 @@ def _get_xpath_element_expression(element, without_class_filter=False):
     return element.tag + "[%s]" % attr_filter if attr_filter else element.tag
 
 
-def get_xpath_tree_text(dom, xpath):
+class SubtreeText:
+    '''
+    The normalized text of every element's subtree.
+
+    A single pass over the DOM collects all text fragments in document order.
+    Since the fragments of a subtree are contiguous, the text of any element
+    is the join of the fragments between its start and end offset, so that
+    the text of ancestors is composed from the fragments of their children
+    rather than extracted again.
+    '''
+
+    def __init__(self, dom):
+        self.fragments = []
+        self.spans = {}
+        if dom is None:
+            return
+
+        self._add_fragment(dom.text)
+        stack = [(dom, 0, iter(dom))]
+        while stack:
+            element, start, children = stack[-1]
+            child = next(children, None)
+            if child is None:
+                stack.pop()
+                self.spans[element] = (start, len(self.fragments))
+                if stack:
+                    self._add_fragment(element.tail)
+                continue
+
+            child_start = len(self.fragments)
+            # the text of comments and processing instructions is not part of
+            # the element's text (see lxml's itertext), but their tail is
+            if isinstance(child.tag, str):
+                self._add_fragment(child.text)
+            stack.append((child, child_start, iter(child)))
+
+    def _add_fragment(self, text):
+        text = (text or '').strip()
+        if text:
+            self.fragments.append(RE_MULTIPLE_WHITESPACES.sub(' ', text))
+
+    def get_span(self, element):
+        '''
+        Returns:
+          tuple -- the start and end offset of the element's fragments or
+          None, if the element is not part of the indexed DOM.
+        '''
+        return self.spans.get(element)
+
+    def get_text(self, element):
+        '''
+        Returns:
+          str -- the element's text with normalized whitespaces (i.e. the
+          result of ``extract_text`` with multiple whitespaces collapsed).
+        '''
+        span = self.spans.get(element)
+        if span is None:
+            return RE_MULTIPLE_WHITESPACES.sub(' ', extract_text(element))
+        return ' '.join(self.fragments[span[0]:span[1]])
+
+
+class ElementIntervals:
+    '''
+    Assigns every element of a DOM its pre-order number and the end of its
+    subtree (i.e. the pre-order number following its last descendant), so
+    that ancestor, descendant and overlap tests are integer comparisons.
+    '''
+
+    def __init__(self, dom):
+        self.intervals = {}
+        if dom is None:
+            return
+
+        elements = list(dom.iter())
+        subtree_sizes = {}
+        # reversed document order visits all children before their parent
+        for element in reversed(elements):
+            subtree_sizes[element] = 1 + sum(subtree_sizes[child] for child in element)
+        for pre, element in enumerate(elements):
+            self.intervals[element] = (pre, pre + subtree_sizes[element])
+
+    def get_interval(self, element):
+        '''
+        Returns:
+          tuple -- the element's pre-order number and the end of its subtree.
+        '''
+        return self.intervals[element]
+
+    def is_descendant(self, element, ancestor):
+        '''
+        Returns:
+          bool -- True, if element is a (proper) descendant of ancestor.
+        '''
+        pre, _ = self.intervals[element]
+        ancestor_pre, ancestor_end = self.intervals[ancestor]
+        return ancestor_pre < pre < ancestor_end
+
+    def get_positions(self, elements):
+        '''
+        Returns:
+          list -- the sorted pre-order numbers of the given (distinct) elements.
+        '''
+        return sorted({self.intervals[element][0] for element in elements})
+
+    def count_descendants(self, ancestor, positions):
+        '''
+        Args:
+          ancestor: the element whose descendants are counted.
+          positions: sorted pre-order numbers (see get_positions).
+
+        Returns:
+          int -- the number of positions that are descendants of ancestor.
+        '''
+        ancestor_pre, ancestor_end = self.intervals[ancestor]
+        return bisect_left(positions, ancestor_end) - bisect_right(positions, ancestor_pre)
+
+
+def get_xpath_tree_text(dom, xpath, subtree_text=None):
     '''
     Args:
       xpath (str): The xpath to extract.
+      subtree_text (SubtreeText): optional precomputed subtree texts of the
+        DOM.
     Returns:
        list -- A list of text obtained by all elements matching the given
        xpath.
     '''
-    return [re.sub(r'\s\s+', ' ', extract_text(element)) for element in dom.xpath(xpath)]
+    if subtree_text is None:
+        return [RE_MULTIPLE_WHITESPACES.sub(' ', extract_text(element)) for element in dom.xpath(xpath)]
+    return [subtree_text.get_text(element) for element in dom.xpath(xpath)]
 
 
 def get_cleaned_element_text(element):
@@ -135,61 +303,69 @@ def _get_merged_classes_xpath_condition(classes, classes2):
            _get_classes_concat_with_and_condition(classes2) + "]"
 
 
-def _get_classes(regex_class_detection, xpath):
+def _get_classes(class_match):
     """
     Args:
-        regex_class_detection: regex to detect class
-        xpath: xpath string to get classes
+        class_match: match of RE_CLASS_DETECTION
 
     Returns: list of classes
     """
-    classes = re.findall(regex_class_detection, xpath)
-    return list(filter(None, re.sub(r"@class=|\"|\[|\]", "", classes[0]).split(" ")))
+    return list(filter(None, RE_CLASS_SYNTAX.sub("", class_match.group(0)).split(" ")))
 
 
-def _get_merged_xpath(regex_class_detection, xpath, xpath_to_compare, merged_xpath):
+def _get_merged_xpath(xpath, classes, classes_to_compare):
     """
     Args:
-        regex_class_detection: Regex expression to look for class attributes
         xpath: xpath string
-        xpath_to_compare: xpath string to compare with param xpath
-        merged_xpath: dictionary with already merged xpath
+        classes: classes of the xpath
+        classes_to_compare: classes of an xpath with the same class-free skeleton
 
     Returns: merged xpath if possible. If no match is found, none is returned
 
     """
-    xpath_without_class = re.sub(regex_class_detection, "", xpath)
-    xpath_to_compare_without_class = re.sub(regex_class_detection, "", xpath_to_compare)
-    if xpath_without_class == xpath_to_compare_without_class and xpath_to_compare not in merged_xpath:
-        classes = _get_classes(regex_class_detection, xpath)
-        classes_to_compare = _get_classes(regex_class_detection, xpath_to_compare)
-        same_classes = list(set(classes).intersection(classes_to_compare))
-        if same_classes:
-            same_classes.sort()
-            return re.sub(regex_class_detection, "[" + _get_classes_concat_with_and_condition(same_classes) + "]",
-                          xpath)
-
-        if classes and classes_to_compare:
-            merged_xpath_classes = _get_merged_classes_xpath_condition(classes, classes_to_compare)
-            return re.sub(regex_class_detection, merged_xpath_classes, xpath)
+    same_classes = list(set(classes).intersection(classes_to_compare))
+    if same_classes:
+        same_classes.sort()
+        return RE_CLASS_DETECTION.sub("[" + _get_classes_concat_with_and_condition(same_classes) + "]", xpath)
+
+    if classes and classes_to_compare:
+        merged_xpath_classes = _get_merged_classes_xpath_condition(classes, classes_to_compare)
+        return RE_CLASS_DETECTION.sub(merged_xpath_classes, xpath)
 
 
 def get_merged_xpath(xpaths):
     """
+    Merges xpaths that only differ in their class attribute. The classes are stripped only once per xpath and
+    xpaths are grouped by their class-free skeleton, so that only xpaths of the same group are compared.
+
     Args:
         xpaths: List of xpaths to look for xpaths which can be merged
 
     Returns: A list with the merged xpath
     """
+    xpaths = list(xpaths)
+    xpath_classes = {}
+    xpath_skeletons = {}
+    skeleton_groups = defaultdict(list)
+    for xpath in xpaths:
+        if xpath not in xpath_classes:
+            class_match = RE_CLASS_DETECTION.search(xpath)
+            if not class_match:
+                continue
+            xpath_classes[xpath] = _get_classes(class_match)
+            xpath_skeletons[xpath] = RE_CLASS_DETECTION.sub("", xpath)
+        skeleton_groups[xpath_skeletons[xpath]].append(xpath)
+
     merged_xpaths = dict()
-    regex_class_detection = r"\[@class=\".*\"\]"
     for xpath in xpaths:
-        if re.search(regex_class_detection, xpath):
-            for xpath_to_compare in [x for x in xpaths if x != xpath]:
-                if re.search(regex_class_detection, xpath_to_compare):
-                    merged_xpath = _get_merged_xpath(regex_class_detection, xpath, xpath_to_compare, merged_xpaths)
-                    if merged_xpath:
-                        merged_xpaths[xpath] = merged_xpath
+        if xpath not in xpath_classes:
+            continue
+        for xpath_to_compare in skeleton_groups[xpath_skeletons[xpath]]:
+            # xpaths that have already been merged are not considered as merge partner
+            if xpath_to_compare != xpath and xpath_to_compare not in merged_xpaths:
+                merged_xpath = _get_merged_xpath(xpath, xpath_classes[xpath], xpath_classes[xpath_to_compare])
+                if merged_xpath:
+                    merged_xpaths[xpath] = merged_xpath
 
     return list(merged_xpaths.values())
 
@@ -200,10 +376,26 @@ def get_grandparent(element):
         return element.getparent().getparent()
 
 
-def elements_have_no_overlap(elements):
-    for element in elements:
-        for element_to_compare in [child for child in [x for x in elements if x is not element]]:
-            for child_element in element.iterdescendants():
-                if element_to_compare is child_element:
-                    return False
+def elements_have_no_overlap(elements, element_intervals=None):
+    '''
+    Args:
+      elements: the elements to test.
+      element_intervals (ElementIntervals): optional intervals of the
+        elements' DOM.
+
+    Returns:
+      bool -- True, if none of the elements is a descendant of another one.
+    '''
+    if not elements:
+        return True
+    if element_intervals is None:
+        element_intervals = ElementIntervals(elements[0].getroottree().getroot())
+
+    # in pre-order, an element is nested if it starts before the subtree of a
+    # preceding element ends
+    subtree_end = -1
+    for pre, end in sorted({element_intervals.get_interval(element) for element in elements}):
+        if pre < subtree_end:
+            return False
+        subtree_end = max(subtree_end, end)
     return True
@@ -0,0 +1,288 @@
+'''
+Runs extractions in worker processes.
+
+The worker processes of :func:`harvest.extract_many`, :mod:`harvest.aio` and
+the web service are managed by a :class:`WorkerPool`. Every worker process
+calls :func:`initialize_worker` once, which imports harvest and its heavy
+dependencies (dateparser, inscriptis) and sets up the process's
+:class:`harvest.TemplateStore` and page budget. Pages are then processed with
+:func:`extract_data` or :func:`run_with_budget`.
+
+A page that exceeds its memory budget leaves the worker's heap fragmented,
+so that the worker is retired: the :class:`WorkerPool` replaces its worker
+processes before it processes the next page.
+'''
+
+import gc
+import os
+import sys
+import traceback
+
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from collections import deque
+from threading import Lock, Thread
+
+from harvest.budget import BudgetExceeded, page_budget
+
+# per-process TemplateStore and page budget (time_limit, memory_limit) used by the workers
+_template_store = None
+_page_budget = (None, None)
+_initialized = False
+# set once a page exceeded the memory budget of the worker
+_retired = False
+
+
+def initialize_worker(template_store_path=None, time_limit=None, memory_limit=None):
+    '''
+    Imports harvest and loads dateparser's language data once per worker
+    process.
+
+    Args:
+      template_store_path (str): an optional SQLite file that backs the
+        worker's :class:`harvest.TemplateStore`.
+      time_limit (float): an optional wall-clock budget per page in seconds.
+      memory_limit (int): an optional memory budget per page in bytes.
+    '''
+    global _template_store, _page_budget, _initialized
+    import dateparser.search
+    import inscriptis  # noqa: F401
+
+    from harvest import TemplateStore
+    from harvest.config import LANGUAGES
+
+    dateparser.search.search_dates('1 January 2020', languages=LANGUAGES)
+    _template_store = TemplateStore(path=template_store_path) if template_store_path else None
+    _page_budget = (time_limit, memory_limit)
+    _initialized = True
+
+
+def format_error(e):
+    '''
+    Returns:
+      str -- the exception's type and message as reported for failed pages.
+    '''
+    return ''.join(traceback.format_exception_only(type(e), e)).strip()
+
+
+def run_with_budget(function, *args, **kwargs):
+    '''
+    Calls `function` within the worker's page budget (see
+    :func:`harvest.budget.page_budget`). Exceeding the memory budget retires
+    the worker.
+    '''
+    global _retired
+    try:
+        with page_budget(*_page_budget):
+            return function(*args, **kwargs)
+    except BudgetExceeded as e:
+        if e.reason == 'memory':
+            _retired = True
+            gc.collect()
+        raise
+
+
+def extract_data(html, url):
+    '''
+    Runs :func:`harvest.extract_data` with the worker's template store and
+    page budget.
+    '''
+    from harvest import extract_data
+    return run_with_budget(extract_data, html, url, template_store=_template_store)
+
+
+def _run_task(initargs, function, *args):
+    '''
+    Calls `function` in a worker process.
+
+    Returns:
+      tuple -- whether the worker has been retired, the result and the
+      exception raised by `function`.
+    '''
+    if not _initialized:
+        initialize_worker(*initargs)
+    try:
+        result = function(*args)
+    except Exception as e:
+        return _retired, None, e
+    return _retired, result, None
+
+
+def _shutdown(executor):
+    '''
+    Shuts the executor down without blocking. Its pending pages are still
+    processed.
+    '''
+    # shutdown(wait=False) may leave the worker processes behind on Python < 3.9
+    Thread(target=executor.shutdown, daemon=True).start()
+
+
+class _PageFuture(Future):
+    '''
+    The future of a page that is processed by a :class:`WorkerPool`.
+    Cancelling it removes the page from the pool's queue.
+    '''
+
+    def __init__(self, task):
+        super().__init__()
+        self._task = task
+
+    def cancel(self):
+        return self._task.cancel() and super().cancel()
+
+
+class WorkerPool:
+    '''
+    A pool of worker processes (see :class:`concurrent.futures.ProcessPoolExecutor`),
+    which is replaced by a new pool
+
+    - after its workers have processed `max_pages_per_worker` pages on
+      average,
+    - after a page exceeded its memory budget (i.e. a worker has been
+      retired) and
+    - after a worker process died (e.g. killed by the OOM killer), which
+      fails the pool's pending pages with
+      :class:`concurrent.futures.process.BrokenProcessPool`.
+
+    A replaced pool finishes its pending pages in the background.
+
+    Args:
+      workers (int): the number of worker processes (default: the number of
+        CPUs).
+      template_store_path (str): an optional SQLite file that backs the
+        :class:`harvest.TemplateStore` of every worker.
+      time_limit (float): an optional wall-clock budget per page in seconds.
+      memory_limit (int): an optional memory budget per page in bytes.
+      max_pages_per_worker (int): replace the worker processes after they
+        have processed the given number of pages on average.
+    '''
+
+    def __init__(self, workers=None, template_store_path=None, time_limit=None, memory_limit=None,
+                 max_pages_per_worker=None):
+        self.workers = workers or os.cpu_count() or 1
+        self._initargs = (template_store_path, time_limit, memory_limit)
+        self._max_pages = max_pages_per_worker * self.workers if max_pages_per_worker else None
+        self._lock = Lock()
+        self._executor = self._create_executor()
+        self._submitted_pages = 0
+        self._pending = set()
+
+    def _create_executor(self):
+        if sys.version_info < (3, 7):
+            # the workers are initialized with their first page (see _run_task)
+            return ProcessPoolExecutor(self.workers)
+        return ProcessPoolExecutor(self.workers, initializer=initialize_worker, initargs=self._initargs)
+
+    def _replace_executor(self):
+        _shutdown(self._executor)
+        self._executor = self._create_executor()
+        self._submitted_pages = 0
+
+    def _retire(self, executor):
+        '''
+        Replaces the given executor with a new one, unless it has already
+        been replaced.
+        '''
+        with self._lock:
+            if executor is self._executor:
+                self._replace_executor()
+
+    def submit(self, function, *args):
+        '''
+        Calls `function` with the given arguments in a worker process.
+
+        Returns:
+          Future -- the future of the result.
+        '''
+        with self._lock:
+            if self._max_pages and self._submitted_pages >= self._max_pages:
+                self._replace_executor()
+            try:
+                task = self._executor.submit(_run_task, self._initargs, function, *args)
+            except BrokenProcessPool:
+                # a worker died before the pool's pending pages have been failed
+                self._replace_executor()
+                task = self._executor.submit(_run_task, self._initargs, function, *args)
+            self._submitted_pages += 1
+            executor = self._executor
+
+        future = _PageFuture(task)
+        self._pending.add(future)
+        future.add_done_callback(self._pending.discard)
+        task.add_done_callback(lambda task: self._complete(executor, task, future))
+        return future
+
+    def _complete(self, executor, task, future):
+        if task.cancelled():
+            Future.cancel(future)
+            return
+
+        error = task.exception()
+        if error is None:
+            retired, result, error = task.result()
+            if retired:
+                self._retire(executor)
+        elif isinstance(error, BrokenProcessPool):
+            self._retire(executor)
+
+        if error is None:
+            future.set_result(result)
+        else:
+            future.set_exception(error)
+
+    def imap(self, function, items, ordered=True, max_pending=None):
+        '''
+        Calls `function` for every item in a worker process. Items are only
+        consumed as long as less than `max_pending` (default: twice the
+        number of workers) items are pending.
+
+        Args:
+          function: a picklable function that is called with a single item.
+          items: an iterable of picklable items.
+          ordered (bool): yield the results in the order of `items`.
+            Otherwise results are yielded as soon as they are available.
+
+        Returns:
+          generator -- the item and the (done) future of its result for
+          every item.
+        '''
+        max_pending = max_pending or 2 * self.workers
+        pending = deque()
+        try:
+            for item in items:
+                pending.append((item, self.submit(function, item)))
+                while len(pending) >= max_pending:
+                    yield from self._next_results(pending, ordered)
+            while pending:
+                yield from self._next_results(pending, ordered)
+        finally:
+            for _, future in pending:
+                future.cancel()
+
+    @staticmethod
+    def _next_results(pending, ordered):
+        '''
+        Waits for the next result(s) and removes them from `pending`.
+        '''
+        if ordered:
+            item, future = pending.popleft()
+            wait((future, ))
+            return [(item, future)]
+
+        done, _ = wait([future for _, future in pending], return_when=FIRST_COMPLETED)
+        results = [(item, future) for item, future in pending if future in done]
+        for result in results:
+            pending.remove(result)
+        return results
+
+    def close(self, cancel=False):
+        '''
+        Shuts the worker processes down without blocking.
+
+        Args:
+          cancel (bool): cancel the queued pages rather than processing them.
+        '''
+        if cancel:
+            for future in list(self._pending):
+                future.cancel()
+        _shutdown(self._executor)
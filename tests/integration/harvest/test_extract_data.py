@@ -4,7 +4,7 @@ from json import load
 import pytest
 from fuzzywuzzy import fuzz
 
-from harvest import extract_data
+from harvest import apply_template, extract_data, TemplateStore
 
 
 # @Todo lead post not detected-> test_forum_healthunlocked
@@ -338,3 +338,27 @@ def test_forum_pistonheads(load_test_data, compare):
     forum_test_data = load_test_data("www.pistonheads.com.gassing.topic.asp.1858583.json")
     response = extract_data(forum_test_data['html'], forum_test_data['url'])['posts']
     compare(forum_test_data['gold_standard_annotation'], response, ['post_link', 'datetime'])
+
+
+def test_extract_data_with_template_store(load_test_data):
+    forum_test_data = load_test_data("forum.videolan.org.viewtopic.php.92075.json")
+    template_store = TemplateStore()
+    learned = extract_data(forum_test_data['html'], forum_test_data['url'], template_store=template_store)
+    assert template_store.get(forum_test_data['url']) is not None
+
+    applied = extract_data(forum_test_data['html'], forum_test_data['url'], template_store=template_store)
+    assert applied == learned
+
+
+def test_apply_template(load_test_data):
+    forum_test_data = load_test_data("bbs.archlinux.org.viewtopic.php.json")
+    template_store = TemplateStore()
+    learned = extract_data(forum_test_data['html'], forum_test_data['url'], template_store=template_store)
+    template = template_store.get(forum_test_data['url'])
+
+    applied = apply_template(forum_test_data['html'], forum_test_data['url'], *template)
+    assert applied == {'posts': learned['posts'], 'valid': True}
+
+    # patterns that do not match anymore
+    assert apply_template(forum_test_data['html'], forum_test_data['url'], '//div[@class="missing"]') == \
+        {'posts': [], 'valid': False}
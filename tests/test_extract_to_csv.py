@@ -0,0 +1,71 @@
+import gzip
+import json
+import os
+import sqlite3
+import sys
+
+from harvest.journal import ABORTED, COMPLETED, ProgressJournal
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'scripts'))
+
+POST = '<div class="post"><span class="user">{0}</span><p class="text">This is post number {0} of the thread.</p></div>'
+HTML = '<html><body>' + ''.join(POST.format(i) for i in range(5)) + '</body></html>'
+ROW = ['https://forum.example.org/t/1', 'https://forum.example.org/t/1#p1', 'alice', '2020-04-01', 'Hello']
+
+
+def _write(result_directory, journal=None):
+    from extract_to_csv import CsvWriters
+    csv_writers = CsvWriters(result_directory, max_open=1, journal=journal)
+    csv_writers.writerows('forum.example.org', [ROW])
+    # the file is closed and reopened during the run
+    csv_writers.writerows('other.example.org', [ROW])
+    csv_writers.writerows('forum.example.org', [ROW])
+    csv_writers.close()
+    with open(os.path.join(result_directory, 'forum.example.org.csv')) as f:
+        return f.read().splitlines()
+
+
+def test_csv_writers_start_over_without_journal(tmp_path):
+    assert len(_write(str(tmp_path))) == 3
+    assert len(_write(str(tmp_path))) == 3
+
+
+def test_csv_writers_append_with_journal(tmp_path):
+    journal = ProgressJournal(str(tmp_path / 'journal.db'))
+    assert len(_write(str(tmp_path), journal)) == 3
+    assert len(_write(str(tmp_path), journal)) == 5
+    journal.close()
+
+
+def test_extract_to_csv_with_budget(tmp_path, monkeypatch):
+    from extract_to_csv import extract_to_csv
+    corpus = tmp_path / 'corpus'
+    corpus.mkdir()
+    for name, html in (('small', HTML), ('huge', HTML * 2000)):
+        with gzip.open(str(corpus / f'{name}.json.gz'), 'wt') as f:
+            json.dump({'url': f'https://forum.example.org/t/{name}', 'html': html}, f)
+
+    output_file = str(tmp_path / 'patterns.jsonl')
+    journal = str(tmp_path / 'journal.db')
+    monkeypatch.setattr(sys, 'argv', ['extract_to_csv.py', str(corpus) + '/', output_file, '--workers', '2',
+                                      '--time-limit', '0.5', '--journal', journal])
+    extract_to_csv()
+
+    def get_states():
+        db = sqlite3.connect(journal)
+        states = dict((os.path.basename(path), status) for path, status in db.execute('SELECT path, status FROM inputs'))
+        db.close()
+        return states
+
+    with open(output_file) as f:
+        assert [json.loads(line)['url'] for line in f] == ['https://forum.example.org/t/small']
+    assert get_states() == {'small.json.gz': COMPLETED, 'huge.json.gz': ABORTED}
+
+    # a resumed run with a larger budget only processes the aborted file
+    monkeypatch.setattr(sys, 'argv', ['extract_to_csv.py', str(corpus) + '/', output_file, '--workers', '2',
+                                      '--time-limit', '600', '--journal', journal])
+    extract_to_csv()
+    with open(output_file) as f:
+        assert sorted(json.loads(line)['url'] for line in f) == ['https://forum.example.org/t/huge',
+                                                                 'https://forum.example.org/t/small']
+    assert get_states() == {'small.json.gz': COMPLETED, 'huge.json.gz': COMPLETED}
@@ -1,5 +1,204 @@
+import os
+import sys
+
 import requests
 import json
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'scripts'))
+
+EMPTY_PAGE = {'url': 'https://forum.example.org/t/1', 'html': '<html><body><p>No posts here.</p></body></html>'}
+
+
+POST = '<div class="post"><span class="user">{0}</span><p class="text">This is post number {0} of the thread.</p></div>'
+HTML = '<html><body>' + ''.join(POST.format(i) for i in range(5)) + '</body></html>'
+PAGES = [{'url': f'https://forum.example.org/t/{i}', 'html': HTML} for i in range(6)]
+
+
+@pytest.fixture
+def create_client():
+    import webservice
+
+    def create(**settings):
+        settings.setdefault('result_cache_size', 0)
+        return webservice.get_flask_app(workers=1, **settings).test_client()
+
+    yield create
+    webservice.service.close()
+    webservice.service = None
+    webservice.result_cache = None
+
+
+@pytest.fixture
+def client(create_client):
+    return create_client()
+
+
+def _read_ndjson(response):
+    return [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+
+
+def test_extract_from_html_without_posts(client):
+    response = client.post('/extract_from_html', json=EMPTY_PAGE)
+    assert response.status_code == 200
+    assert response.get_json() == {'entities': {}}
+
+    response = client.post('/extract_from_html', json=dict(EMPTY_PAGE, gold_standard_format=True))
+    assert response.status_code == 200
+    assert response.get_json() == []
+
+    response = client.post('/extract', json=EMPTY_PAGE)
+    assert response.status_code == 200
+    assert response.get_json() == {'posts': []}
+
+
+def test_extract_with_invalid_request(client):
+    response = client.post('/extract', json=[1, 2])
+    assert response.status_code == 400
+    assert response.get_json() == {'error': 'the request requires a `url` and `html`'}
+
+    response = client.post('/extract/apply', json=EMPTY_PAGE)
+    assert response.status_code == 400
+    assert response.get_json() == {'error': 'the request requires a `text_xpath_pattern`'}
+
+    response = client.post('/extract/batch', data='[1, 2]\n')
+    assert response.status_code == 200
+    assert _read_ndjson(response) == [
+        {'index': 0, 'url': None, 'result': None, 'error': 'ValueError: the request requires a `url` and `html`'}]
+
+
+def _exit_worker(forum, output_format):
+    os._exit(1)
+
+
+def test_extract_with_dead_worker(client, monkeypatch):
+    import webservice
+    monkeypatch.setattr(webservice, '_process_page', _exit_worker)
+    response = client.post('/extract', json=EMPTY_PAGE)
+    assert response.status_code == 500
+    assert 'BrokenProcessPool' in response.get_json()['error']
+
+    # the workers have been replaced
+    monkeypatch.undo()
+    response = client.post('/extract', json=EMPTY_PAGE)
+    assert response.status_code == 200
+    assert response.get_json() == {'posts': []}
+
+
+def test_extract_batch(create_client, monkeypatch):
+    import webservice
+    from harvest import extract_data
+    client = create_client(queue_depth=2)
+
+    # record the number of pages in flight whenever a page is submitted
+    futures, in_flight = [], []
+    submit = webservice._submit
+
+    def record_submit(*args, **kwargs):
+        futures.append(submit(*args, **kwargs))
+        in_flight.append(sum(not future.done() for future in futures))
+        return futures[-1]
+
+    monkeypatch.setattr(webservice, '_submit', record_submit)
+    lines = [json.dumps(page) for page in PAGES[:3]] + ['{"url": ', ''] + [json.dumps(page) for page in PAGES[3:]]
+    response = client.post('/extract/batch', data='\n'.join(lines) + '\n')
+    assert response.status_code == 200
+    assert response.mimetype == 'application/x-ndjson'
+    assert response.is_streamed
+
+    results = _read_ndjson(response)
+    assert [result['index'] for result in results] == list(range(7))
+    assert [result['url'] for result in results] == [page['url'] for page in PAGES[:3]] + [None] + \
+        [page['url'] for page in PAGES[3:]]
+    assert results[3]['result'] is None and results[3]['error'].startswith('json.decoder.JSONDecodeError')
+    assert [result['result'] for result in results[:3] + results[4:]] == [extract_data(page['html'], page['url'])
+                                                                          for page in PAGES]
+    assert all(result['error'] is None for result in results[:3] + results[4:])
+    # at most `queue_depth` pages of the request are in flight
+    assert len(futures) == 6 and max(in_flight) <= 2
+
+
+def test_extract_with_full_queue(create_client):
+    import webservice
+    client = create_client(queue_depth=1)
+    webservice.service._slots.acquire()
+    try:
+        response = client.post('/extract', json=EMPTY_PAGE)
+    finally:
+        webservice.service._slots.release()
+    assert response.status_code == 503
+    assert response.headers['Retry-After'] == '1'
+    assert response.get_json() == {'error': 'the extraction queue is full'}
+
+    response = client.post('/extract', json=EMPTY_PAGE)
+    assert response.status_code == 200
+
+
+def test_extract_apply(client):
+    from harvest import apply_template
+    patterns = {'text_xpath_pattern': '//div[@class="post"]/p[@class="text"]',
+                'user_xpath_pattern': '//div[@class="post"]/span[@class="user"]'}
+    response = client.post('/extract/apply', json=dict(PAGES[0], **patterns))
+    assert response.status_code == 200
+    result = response.get_json()
+    assert result == apply_template(HTML, PAGES[0]['url'], **patterns)
+    assert result['valid'] and len(result['posts']) == 5
+
+    response = client.post('/extract/batch?format=apply', data=json.dumps(dict(PAGES[0], **patterns)) + '\n')
+    assert _read_ndjson(response) == [{'index': 0, 'url': PAGES[0]['url'], 'result': result, 'error': None}]
+
+
+def test_extract_with_etag(create_client, monkeypatch):
+    import webservice
+    client = create_client(result_cache_size=16)
+    stored = []
+    put = webservice.result_cache.put
+    monkeypatch.setattr(webservice.result_cache, 'put', lambda key, result: stored.append(key) or put(key, result))
+    response = client.post('/extract', json=PAGES[0])
+    assert response.status_code == 200
+    etag = response.headers['ETag']
+    result = response.get_json()
+
+    response = client.post('/extract', json=PAGES[0], headers={'If-None-Match': etag})
+    assert response.status_code == 304
+    assert response.headers['ETag'] == etag
+    assert not response.get_data()
+
+    # a cached result
+    response = client.post('/extract', json=PAGES[0])
+    assert response.status_code == 200
+    assert response.headers['ETag'] == etag
+    assert response.get_json() == result
+    # cached results are not stored again
+    assert stored == [etag.strip('"')]
+
+    # other output formats of the same page have their own ETag
+    response = client.post('/extract?format=orbis', json=PAGES[0], headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert response.headers['ETag'] != etag
+
+
+def _get_metric(client, sample):
+    for line in client.get('/metrics').get_data(as_text=True).splitlines():
+        if line.startswith(sample + ' '):
+            return float(line.rsplit(' ', 1)[1])
+    return 0
+
+
+def test_metrics(client):
+    ok_pages = _get_metric(client, 'harvest_pages_total{format="harvest",status="ok"}')
+    durations = _get_metric(client, 'harvest_page_duration_seconds_count{format="harvest"}')
+    client.post('/extract', json=PAGES[0])
+
+    response = client.get('/metrics')
+    assert response.status_code == 200
+    assert response.mimetype == 'text/plain'
+    text = response.get_data(as_text=True)
+    assert '# TYPE harvest_pages_total counter' in text
+    assert '# TYPE harvest_stage_duration_seconds histogram' in text
+    assert 'harvest_workers 1' in text
+    assert _get_metric(client, 'harvest_pages_total{format="harvest",status="ok"}') == ok_pages + 1
+    assert _get_metric(client, 'harvest_page_duration_seconds_count{format="harvest"}') == durations + 1
 
 
 def query():
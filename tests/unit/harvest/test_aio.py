@@ -0,0 +1,98 @@
+import asyncio
+
+import pytest
+
+from harvest import extract_data
+from harvest.aio import AsyncExtractor
+from harvest.budget import BudgetExceeded, get_memory_usage
+
+POST = '<div class="post"><span class="user">{0}</span><p class="text">This is post number {0} of the thread.</p></div>'
+HTML = '<html><body>' + ''.join(POST.format(i) for i in range(5)) + '</body></html>'
+PAGES = [(HTML, f'https://forum.example.org/t/{i}') for i in range(4)]
+
+
+def run_in_new_loop(coroutine):
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coroutine)
+    finally:
+        loop.close()
+
+
+def test_extract_data():
+    async def run():
+        async with AsyncExtractor(workers=2) as extractor:
+            return await asyncio.gather(*(extractor.extract_data(html, url) for html, url in PAGES))
+
+    results = run_in_new_loop(run())
+    assert results == [extract_data(html, url) for html, url in PAGES]
+
+
+def test_extract_many():
+    async def pages():
+        for page in PAGES + [(None, 'https://forum.example.org/broken')]:
+            yield page
+
+    async def run(ordered):
+        async with AsyncExtractor(workers=2, max_concurrency=2) as extractor:
+            return [result async for result in extractor.extract_many(pages(), ordered=ordered)]
+
+    results = run_in_new_loop(run(ordered=True))
+    assert [result.index for result in results] == [0, 1, 2, 3, 4]
+    assert all(result.error is None for result in results[:4])
+    assert results[0].result == extract_data(*PAGES[0])
+    assert results[4].result is None and results[4].error
+
+    results = run_in_new_loop(run(ordered=False))
+    assert sorted(result.index for result in results) == [0, 1, 2, 3, 4]
+
+
+def test_cancellation():
+    async def run():
+        async with AsyncExtractor(workers=1, max_concurrency=8) as extractor:
+            tasks = [asyncio.ensure_future(extractor.extract_data(html, url)) for html, url in PAGES * 2]
+            await asyncio.sleep(0)
+            for task in tasks[1:]:
+                task.cancel()
+            first = await tasks[0]
+            await asyncio.gather(*tasks[1:], return_exceptions=True)
+            return first, [task.cancelled() for task in tasks[1:]]
+
+    first, cancelled = run_in_new_loop(run())
+    assert first == extract_data(*PAGES[0])
+    assert all(cancelled)
+
+
+def test_extractor_in_several_loops():
+    extractor = AsyncExtractor(workers=1, max_pages_per_worker=1)
+    try:
+        for html, url in PAGES[:3]:
+            assert run_in_new_loop(extractor.extract_data(html, url)) == extract_data(html, url)
+    finally:
+        extractor.close()
+
+
+def test_close_cancels_pending_pages():
+    async def run():
+        extractor = AsyncExtractor(workers=1, max_concurrency=8)
+        tasks = [asyncio.ensure_future(extractor.extract_data(html, url)) for html, url in PAGES * 2]
+        await asyncio.sleep(0)
+        extractor.close()
+        return await asyncio.gather(*tasks, return_exceptions=True)
+
+    results = run_in_new_loop(run())
+    assert any(isinstance(result, asyncio.CancelledError) for result in results)
+
+
+@pytest.mark.skipif(get_memory_usage() is None, reason='memory usage is not available on this platform')
+def test_memory_budget_retires_workers():
+    async def run():
+        async with AsyncExtractor(workers=1, memory_limit=1024 * 1024) as extractor:
+            executor = extractor._pool._executor
+            with pytest.raises(BudgetExceeded) as e:
+                await extractor.extract_data(HTML * 3000, 'https://forum.example.org/t/huge')
+            assert e.value.reason == 'memory'
+            assert extractor._pool._executor is not executor
+            return await extractor.extract_data(*PAGES[0])
+
+    assert run_in_new_loop(run()) == extract_data(*PAGES[0])
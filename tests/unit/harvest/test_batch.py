@@ -0,0 +1,23 @@
+from harvest import BatchResult, extract_data, extract_many
+
+POST = '<div class="post"><span class="user">{0}</span><p class="text">This is post number {0} of the thread.</p></div>'
+HTML = '<html><body>' + ''.join(POST.format(i) for i in range(5)) + '</body></html>'
+PAGES = [(HTML, f'https://forum.example.org/t/{i}') for i in range(4)]
+
+
+def test_extract_many():
+    results = list(extract_many(PAGES, workers=2))
+    assert [result.index for result in results] == [0, 1, 2, 3]
+    assert [result.url for result in results] == [url for _, url in PAGES]
+    assert all(result.error is None for result in results)
+    assert results[0].result == extract_data(*PAGES[0])
+
+
+def test_extract_many_unordered_with_errors():
+    results = list(extract_many(PAGES + [(None, 'https://forum.example.org/broken')], workers=2, chunksize=2,
+                                ordered=False))
+    assert sorted(result.index for result in results) == [0, 1, 2, 3, 4]
+
+    broken = next(result for result in results if result.index == 4)
+    assert isinstance(broken, BatchResult)
+    assert broken.result is None and broken.error
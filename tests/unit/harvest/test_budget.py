@@ -0,0 +1,76 @@
+import os
+import time
+
+import pytest
+
+from harvest.budget import BudgetExceeded, get_memory_usage, page_budget
+from harvest.batch import extract_many
+from harvest.worker import WorkerPool, run_with_budget
+
+POST = '<div class="post"><span class="user">{0}</span><p class="text">This is post number {0} of the thread.</p></div>'
+HTML = '<html><body>' + ''.join(POST.format(i) for i in range(5)) + '</body></html>'
+
+
+def _busy(seconds):
+    start = time.monotonic()
+    while time.monotonic() - start < seconds:
+        pass
+
+
+def test_page_budget():
+    with page_budget(time_limit=1):
+        _busy(0.1)
+
+    with pytest.raises(BudgetExceeded) as e:
+        with page_budget(time_limit=0.1):
+            _busy(2)
+    assert e.value.reason == 'time'
+
+
+@pytest.mark.skipif(get_memory_usage() is None, reason='memory usage is not available on this platform')
+def test_page_budget_memory():
+    with pytest.raises(BudgetExceeded) as e:
+        with page_budget(memory_limit=16 * 1024 * 1024):
+            blocks = []
+            for _ in range(256):
+                blocks.append(bytearray(1024 * 1024))
+                _busy(0.005)
+    assert e.value.reason == 'memory'
+
+
+def _allocate(megabytes):
+    blocks = []
+    for _ in range(megabytes):
+        blocks.append(bytearray(1024 * 1024))
+        _busy(0.005)
+    return os.getpid()
+
+
+def _process_page(megabytes):
+    try:
+        return run_with_budget(_allocate, megabytes), None
+    except BudgetExceeded as e:
+        return os.getpid(), e.reason
+
+
+@pytest.mark.skipif(get_memory_usage() is None, reason='memory usage is not available on this platform')
+def test_memory_budget_retires_pool_worker():
+    pool = WorkerPool(1, memory_limit=16 * 1024 * 1024)
+    try:
+        first, _ = pool.submit(_process_page, 1).result()
+        aborted, reason = pool.submit(_process_page, 256).result()
+        replacement, reason_after_replacement = pool.submit(_process_page, 1).result()
+    finally:
+        pool.close()
+
+    assert reason == 'memory'
+    assert aborted == first
+    assert replacement != aborted and reason_after_replacement is None
+
+
+def test_extract_many_with_budget():
+    pages = [(HTML, 'https://forum.example.org/t/1'), (HTML * 2000, 'https://forum.example.org/t/2')]
+    results = list(extract_many(pages, workers=1, time_limit=0.5, max_pages_per_worker=1))
+    assert results[0].error is None
+    assert results[1].result is None
+    assert results[1].error.startswith('harvest.budget.BudgetExceeded: time budget exceeded in harvest.')
@@ -0,0 +1,40 @@
+from datetime import datetime
+
+from harvest.date_format import learn_date_format, parse_date
+
+NOW = datetime(2020, 6, 1, 12, 0)
+
+
+def test_learn_date_format():
+    samples = [('by  17 Jul 2011 17:51', 'by 17 Jul 2011 17:51', datetime(2011, 7, 17, 17, 51)),
+               ('by  2 Aug 2011 09:05', 'by 2 Aug 2011 09:05', datetime(2011, 8, 2, 9, 5))]
+    assert learn_date_format(samples, NOW) == '%[by %d %b %Y %H:%M%]'
+
+    samples = [('» Sun Jul 28  2013 11:59 am', 'Sun Jul 28 2013 11:59 am', datetime(2013, 7, 28, 11, 59)),
+               ('» Mon Jul 29  2013 1:05 pm', 'Mon Jul 29 2013 1:05 pm', datetime(2013, 7, 29, 13, 5))]
+    assert learn_date_format(samples, NOW) == '» %[%a %b %d %Y %I:%M %p%]'
+
+
+def test_learn_date_format_requires_a_unique_format():
+    # too few samples
+    assert learn_date_format([('10-04-2017', '10-04-2017', datetime(2017, 10, 4))], NOW) is None
+    # day and month cannot be distinguished
+    samples = [('01.01.19', '01.01.19', datetime(2019, 1, 1)), ('02.02.19', '02.02.19', datetime(2019, 2, 2))]
+    assert learn_date_format(samples, NOW) is None
+    # inconsistent samples
+    samples = [('29/07/2004', '29/07/2004', datetime(2004, 7, 29)), ('04/02/2005', '04/02/2005', datetime(2005, 4, 2))]
+    assert learn_date_format(samples, NOW) is None
+
+
+def test_parse_date():
+    assert parse_date('by 3 Mar 2012 08:15', '%[by %d %b %Y %H:%M%]', NOW) == \
+        ('by 3 Mar 2012 08:15', datetime(2012, 3, 3, 8, 15))
+    assert parse_date('» Tue Dec 31  2019 12:22 am', '» %[%a %b %d %Y %I:%M %p%]', NOW) == \
+        ('Tue Dec 31 2019 12:22 am', datetime(2019, 12, 31, 0, 22))
+    assert parse_date('vor 3 Tagen', '%[vor %N %U%]', NOW) == ('vor 3 Tagen', datetime(2020, 5, 29, 12, 0))
+    assert parse_date('Sunday 8th March', '%[%a %d%o %b%]', NOW) == ('Sunday 8th March', datetime(2020, 3, 8))
+
+    # mismatches, invalid and future dates
+    assert parse_date('edited by 3 Mar 2012 08:15', '%[by %d %b %Y %H:%M%]', NOW) is None
+    assert parse_date('31-02-2012', '%[%d-%m-%Y%]', NOW) is None
+    assert parse_date('01-07-2020', '%[%d-%m-%Y%]', NOW) is None
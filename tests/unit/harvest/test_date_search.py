@@ -1,4 +1,5 @@
-from harvest.date_search import search_dates
+from harvest.date_search import (search_dates, resolve_dates, get_date_cache_statistics, get_latest_dates,
+                                 might_contain_date)
 import datetime
 
 
@@ -12,3 +13,60 @@ def test_date_found_by_external_library():
 def test_date_found_by_external_library_is_to_old():
     result = search_dates("asdfad 29-April-1993 21:46  afd adsf")
     assert len(result) == 0
+
+
+def test_resolve_dates_is_cached():
+    text = "posted on 12 March 2015 10:30"
+    misses = get_date_cache_statistics()['misses']
+    first = resolve_dates(text)
+    first.clear()
+    assert resolve_dates(text) == [("on 12 March 2015 10:30", datetime.datetime(2015, 3, 12, 10, 30))]
+
+    statistics = get_date_cache_statistics()
+    assert statistics['misses'] == misses + 1
+    assert statistics['hits'] >= 1
+    assert resolve_dates("no date in here") is None
+
+
+def test_might_contain_date():
+    for text in ("12.03.2015", "vor 2 Stunden", "yesterday", "hace una semana", "Montag", "Bonjour à tous"):
+        assert might_contain_date(text)
+    for text in ("", "Reply", "Quote", "Thanks for the help"):
+        assert not might_contain_date(text)
+    assert resolve_dates("Reply") is None
+
+
+def test_get_latest_dates():
+    now = datetime.datetime(2020, 6, 1)
+    latest_dates = get_latest_dates(["25-February-2012 21:46", "Reply", "1 July 2020",
+                                     "25-February-2012 21:46"], now=now)
+    assert latest_dates == {"25-February-2012 21:46": ("25-February-2012 21:46",
+                                                       datetime.datetime(2012, 2, 25, 21, 46)),
+                            "1 July 2020": None}
+
+
+def test_get_latest_dates_in_date_order_of_page_language():
+    now = datetime.datetime(2020, 6, 1)
+    assert get_latest_dates(["08.11.2009, 11:49"], now=now, languages=('de', 'en')) == {
+        "08.11.2009, 11:49": ("08.11.2009, 11:49", datetime.datetime(2009, 11, 8, 11, 49))}
+    assert get_latest_dates(["11/08/2009"], now=now, languages=('en', 'de')) == {
+        "11/08/2009": ("11/08/2009", datetime.datetime(2009, 11, 8))}
+
+
+def test_get_latest_dates_ignores_numbers():
+    # dateparser reads the post number as day or month of the current year
+    text = "#11 erstellt: 20. Apr 2004"
+    assert get_latest_dates([text], now=datetime.datetime(2100, 1, 1), languages=('de', 'en')) == {
+        text: ("20. Apr 2004", datetime.datetime(2004, 4, 20))}
+
+
+def test_get_latest_dates_with_fallback_languages():
+    text = "hace una semana"
+    assert get_latest_dates([text], languages=('de', 'en')) == {}
+    latest_dates = get_latest_dates([text], languages=('de', 'en'), fallback_languages=('en', 'de', 'es'))
+    assert latest_dates[text][0] == text
+
+    # the fallback is only considered, if none of the texts contains a date in the page language
+    texts = [text, "25-February-2012 21:46"]
+    assert get_latest_dates(texts, languages=('de', 'en'), fallback_languages=('en', 'de', 'es')) == {
+        "25-February-2012 21:46": ("25-February-2012 21:46", datetime.datetime(2012, 2, 25, 21, 46))}
@@ -0,0 +1,22 @@
+from harvest.document import Document
+from harvest.post_text import get_cleaned_text
+
+HTML = '<html><body><div class="post">First post of the thread</div><div class="post">A reply</div></body></html>'
+
+
+def test_document_is_parsed_only_once():
+    document = Document(HTML, 'https://forum.example.org/thread/1')
+    assert document.dom is document.dom
+    assert document.tree.getroot() is document.dom
+
+
+def test_document_text_sections():
+    document = Document(HTML, 'https://forum.example.org/thread/1')
+    assert document.text_sections == get_cleaned_text(HTML)
+    assert document.reference_text == 'First post of the thread A reply'
+
+
+def test_document_from_dom():
+    document = Document(HTML)
+    assert Document.from_dom(document) is document
+    assert Document.from_dom(document.dom).dom is document.dom
@@ -0,0 +1,17 @@
+from datetime import datetime
+
+from harvest.extract import get_forum_date
+from harvest.utils import get_html_dom
+
+HTML = '''<html><body>
+<div class="post"><time datetime="2020-04-21T12:17:00Z">21 April 2020</time><p>First post</p></div>
+<div class="post"><time datetime="2020-04-22T08:30:00Z"></time><p>Second post</p></div>
+</body></html>'''
+
+
+def test_get_forum_date_of_time_elements():
+    dom = get_html_dom(HTML)
+    assert get_forum_date(dom, '//div[@class="post"]/time', result_as_datetime=False) == [
+        '21 April 2020', '2020-04-22T08:30:00Z']
+    assert get_forum_date(dom, '//div[@class="post"]/time') == [datetime(2020, 4, 21, 12, 17),
+                                                                datetime(2020, 4, 22, 8, 30)]
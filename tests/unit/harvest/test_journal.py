@@ -0,0 +1,53 @@
+from harvest.journal import ABORTED, COMPLETED, FAILED, SKIPPED, ProgressJournal, get_content_hash, \
+    get_file_signature
+
+
+def test_progress_journal(tmp_path):
+    inputs = []
+    for no in range(3):
+        fname = tmp_path / f'{no}.json'
+        fname.write_text(f'input {no}')
+        inputs.append((str(fname), get_content_hash(fname)))
+    output = tmp_path / 'output.jsonl'
+    output.write_text('')
+
+    journal = ProgressJournal(str(tmp_path / 'journal.db'), batch_size=2)
+    journal.register_output(str(output), 0)
+    journal.record(*inputs[0], COMPLETED, 0)
+    journal.record(*inputs[1], SKIPPED)
+    assert journal.pending == 2
+    output.write_text('result 0\n')
+    journal.commit({str(output): 9})
+    assert journal.pending == 0
+
+    # the job crashes after writing the (uncommitted) result of the third input
+    journal.record(*inputs[2], COMPLETED, 9)
+    output.write_text('result 0\nresult 2\n')
+    journal.close()
+
+    journal = ProgressJournal(str(tmp_path / 'journal.db'))
+    journal.truncate_outputs()
+    assert output.read_text() == 'result 0\n'
+    assert journal.get_output_offset(str(output)) == 9
+    # skipped inputs depend on the settings of the run and are processed again
+    assert [journal.is_completed(*input) for input in inputs] == [True, False, False]
+    # changed inputs are processed again
+    assert not journal.is_completed(inputs[0][0], get_content_hash(inputs[2][0]))
+
+    # failed and aborted inputs are retried
+    journal.record(*inputs[1], ABORTED)
+    journal.record(*inputs[2], FAILED)
+    journal.commit()
+    assert not journal.is_completed(*inputs[1])
+    assert not journal.is_completed(*inputs[2])
+    journal.close()
+
+
+def test_get_file_signature(tmp_path):
+    fname = tmp_path / 'input.json'
+    fname.write_text('input')
+    signature = get_file_signature(str(fname))
+    assert get_file_signature(str(fname)) == signature
+
+    fname.write_text('changed input')
+    assert get_file_signature(str(fname)) != signature
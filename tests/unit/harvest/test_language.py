@@ -0,0 +1,31 @@
+from harvest.config import LANGUAGES
+from harvest.document import Document
+from harvest.language import get_declared_language, get_page_languages, get_text_language
+from harvest.utils import get_html_dom
+
+TEXT = '<p>Ich habe das Problem auch und es ist nicht gelöst. Hat jemand eine Idee, wie man das auf Linux löst?</p>'
+
+
+def test_get_declared_language():
+    assert get_declared_language(get_html_dom('<html lang="de-DE"><body></body></html>')) == 'de'
+    assert get_declared_language(get_html_dom('<html><head><meta property="og:locale" content="en_US"></head>'
+                                              '<body></body></html>')) == 'en'
+    assert get_declared_language(get_html_dom('<html><head><meta http-equiv="Content-Language" content="de,deutsch">'
+                                              '</head><body></body></html>')) == 'de'
+    assert get_declared_language(get_html_dom('<html><body></body></html>')) is None
+
+
+def test_get_text_language():
+    assert get_text_language(['Ich habe das Problem auch und es ist nicht gelöst.']) == 'de'
+    assert get_text_language(['Has anyone tried this with the new release? It is not working for me.']) == 'en'
+    assert get_text_language(['Hola', 'Gracias']) is None
+
+
+def test_get_page_languages():
+    assert get_page_languages(Document(f'<html><body>{TEXT}</body></html>')) == ('de', 'en')
+    # the declared language takes precedence over the text
+    assert get_page_languages(Document(f'<html lang="es"><body>{TEXT}</body></html>')) == ('es', 'en')
+    assert get_page_languages(Document(f'<html lang="en"><body>{TEXT}</body></html>')) == ('en', )
+    # languages whose dates are not resolved
+    assert get_page_languages(Document(f'<html lang="fr"><body>{TEXT}</body></html>')) == LANGUAGES
+    assert get_page_languages(Document('<html><body><p>Hallo</p></body></html>')) == LANGUAGES
@@ -0,0 +1,111 @@
+import asyncio
+import sys
+
+from threading import Thread
+
+import pytest
+
+from harvest import extract_data, posts
+from harvest.metrics import _ThreadLocalVar, InstrumentationSink, Registry, get_sink, record_page, stage, use_sink
+
+POST = '<div class="post"><span class="user">{0}</span><p class="text">This is post number {0} of the thread.</p></div>'
+HTML = '<html><body>' + ''.join(POST.format(i) for i in range(5)) + '</body></html>'
+
+
+def test_record_page():
+    with record_page() as page_metrics:
+        extract_data(HTML, 'https://forum.example.org/t/1')
+    assert {'parse', 'render', 'text_cleaning', 'section_matching', 'node_assessment', 'apply'} <= set(page_metrics.stages)
+    assert page_metrics.values['dom_nodes'] == 17
+    assert page_metrics.failed_stage is None
+
+
+def test_failed_stage():
+    with record_page() as page_metrics:
+        try:
+            with stage('outer'):
+                with stage('inner'):
+                    raise ValueError()
+        except ValueError:
+            pass
+    assert page_metrics.failed_stage == 'inner'
+    assert set(page_metrics.stages) == {'outer', 'inner'}
+
+
+class EventSink(InstrumentationSink):
+
+    def __init__(self):
+        self.events = []
+
+    def on_stage(self, name, duration):
+        self.events.append(('stage', name))
+
+    def on_counter(self, name, value):
+        self.events.append(('counter', name))
+
+
+def test_sink_argument():
+    sink = EventSink()
+    posts.extract_posts(HTML, 'https://forum.example.org/t/1', sink=sink)
+    assert ('stage', 'frame_ascent') in sink.events
+    assert ('stage', 'apply') not in sink.events
+    assert get_sink() is None
+
+    extract_data(HTML, 'https://forum.example.org/t/1', sink=sink)
+    assert ('stage', 'apply') in sink.events
+    assert ('stage', 'boilerplate_removal') in sink.events
+
+
+@pytest.mark.skipif(sys.version_info < (3, 7), reason='sinks are thread-local without contextvars')
+def test_context_local_sink():
+    async def record(sink):
+        with use_sink(sink):
+            await asyncio.sleep(0)
+            with stage('task'):
+                await asyncio.sleep(0)
+            return get_sink()
+
+    async def main():
+        return await asyncio.gather(record(EventSink()), record(EventSink()))
+
+    loop = asyncio.new_event_loop()
+    try:
+        sinks = loop.run_until_complete(main())
+    finally:
+        loop.close()
+    assert [sink.events for sink in sinks] == [[('stage', 'task')], [('stage', 'task')]]
+    assert get_sink() is None
+
+
+def test_registry():
+    registry = Registry()
+    pages = registry.counter('pages_total', 'Processed pages.')
+    duration = registry.histogram('duration_seconds', 'Duration.', buckets=(0.1, 1))
+    pages.inc(stage='a "b"')
+    duration.observe(0.1)
+    duration.observe(5)
+
+    assert registry.expose().splitlines() == [
+        '# HELP pages_total Processed pages.',
+        '# TYPE pages_total counter',
+        'pages_total{stage="a \\"b\\""} 1',
+        '# HELP duration_seconds Duration.',
+        '# TYPE duration_seconds histogram',
+        'duration_seconds_bucket{le="0.1"} 1',
+        'duration_seconds_bucket{le="1.0"} 1',
+        'duration_seconds_bucket{le="+Inf"} 2',
+        'duration_seconds_sum 5.1',
+        'duration_seconds_count 2']
+
+
+def test_thread_local_sink():
+    sink = EventSink()
+    thread_sink = _ThreadLocalVar('sink')
+    token = thread_sink.set(sink)
+    assert thread_sink.get() is sink
+    thread = Thread(target=lambda: sink.events.append(('thread', thread_sink.get())))
+    thread.start()
+    thread.join()
+    thread_sink.reset(token)
+    assert thread_sink.get() is None
+    assert sink.events == [('thread', None)]
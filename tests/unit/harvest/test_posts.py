@@ -0,0 +1,22 @@
+from harvest.posts import _get_matching_element, _get_text_prefix_index
+from harvest.utils import get_html_dom
+
+HTML = '''<html><body>
+<!-- This is the first post of the thread and a comment -->
+<div id="short">Thanks</div>
+<div id="first">This is the first post of the thread and some more text</div>
+<div id="second">This is the first post of the thread, repeated as a quote</div>
+<div id="prefix">Thanks a lot</div>
+</body></html>'''
+
+
+def test_get_matching_element():
+    text_index = _get_text_prefix_index(get_html_dom(HTML))
+
+    # long comments match the first element that shares the prefix
+    assert _get_matching_element('This is the first post of the thread and more', text_index).get('id') == 'first'
+    # short comments require an exact match
+    assert _get_matching_element('Thanks', text_index).get('id') == 'short'
+    assert _get_matching_element('Thanks a lot', text_index).get('id') == 'prefix'
+    assert _get_matching_element('Thanks a', text_index) is None
+    assert _get_matching_element('  ', text_index) is None
@@ -0,0 +1,42 @@
+from harvest.result_cache import ResultCache, get_result_key
+
+HTML = '<html><body><p>Hello</p></body></html>'
+
+
+def test_get_result_key():
+    key = get_result_key('https://forum.example.org/t/1', HTML)
+    # the key depends on the domain, the html and the variant but not on the path
+    assert key == get_result_key('https://forum.example.org/t/2', HTML)
+    assert key == get_result_key('https://forum.example.org/t/1', HTML.encode('utf-8'))
+    assert key != get_result_key('https://other.example.org/t/1', HTML)
+    assert key != get_result_key('https://forum.example.org/t/1', HTML + ' ')
+    assert key != get_result_key('https://forum.example.org/t/1', HTML, 'orbis')
+
+
+def test_result_cache(tmp_path):
+    path = str(tmp_path / 'results.db')
+    cache = ResultCache(max_size=1, path=path)
+    cache.put('a', {'posts': [1]})
+    cache.put('b', {'posts': [2]})
+    assert len(cache) == 1
+    # evicted results are restored from the database
+    assert cache.get('a') == {'posts': [1]}
+    assert cache.get('c') is None
+    assert (cache.hits, cache.misses) == (1, 1)
+    cache.close()
+
+    assert ResultCache(path=path).get('b') == {'posts': [2]}
+    assert ResultCache(max_size=1).get('a') is None
+
+
+def test_result_cache_max_stored(tmp_path):
+    path = str(tmp_path / 'results.db')
+    cache = ResultCache(max_size=1, path=path, max_stored=2)
+    for key in 'abcd':
+        cache.put(key, {'posts': [key]})
+    # a replaced result counts as most recently stored
+    cache.put('c', {'posts': ['c']})
+    cache.close()
+
+    cache = ResultCache(path=path)
+    assert [key for key in 'abcd' if cache.get(key)] == ['c', 'd']
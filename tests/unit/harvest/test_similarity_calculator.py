@@ -0,0 +1,62 @@
+import numpy as np
+import pytest
+
+from harvest import similarity_calculator
+from harvest.similarity_calculator import NodeScorer, TagMasks, assess_node, load_token_ids, save_token_ids, \
+    text_to_token_ids, _text_to_vsm
+from harvest.utils import get_html_dom
+
+HTML = '''<html><body>
+<div class="post"><p>Has anyone tried the new release?</p></div>
+<div class="post"><p>Yes, the new release works fine.</p></div>
+<div class="post"><p>It crashes on startup for me.</p></div>
+<form><div class="search">Search the forum</div></form>
+</body></html>'''
+
+REFERENCE = 'Has anyone tried the new release? Yes, the new release works fine. It crashes on startup for me.'
+
+
+def test_node_scorer():
+    dom = get_html_dom(HTML)
+    scorer = NodeScorer(REFERENCE, dom)
+
+    score, count = scorer.assess_node('//div[@class="post"]/p')
+    reference_vsm, xpath_vsm = _text_to_vsm(REFERENCE), _text_to_vsm(REFERENCE)
+    assert count == 3
+    assert np.isclose(score, np.dot(reference_vsm, xpath_vsm) /
+                      (np.linalg.norm(reference_vsm) * np.linalg.norm(xpath_vsm)))
+    assert (score, count) == assess_node(REFERENCE, dom, '//div[@class="post"]/p')
+
+
+def test_node_scorer_blacklisted_tags():
+    scorer = NodeScorer(REFERENCE, get_html_dom(HTML))
+    assert scorer.assess_node('//body') == (0., 1)
+    assert scorer.assess_node('//form/div')[0] < scorer.assess_node('//div[@class="post"]')[0]
+
+
+def test_text_to_token_ids_is_stable():
+    # the token ids must not depend on PYTHONHASHSEED
+    assert text_to_token_ids('forum post forum').tolist() == [1621, 1197, 1621]
+    assert len(text_to_token_ids('')) == 0
+
+
+def test_save_and_load_token_ids(tmp_path, monkeypatch):
+    token_ids = [text_to_token_ids(text) for text in ('forum post forum', '', 'Has anyone tried the new release?')]
+    save_token_ids(tmp_path / 'token_ids.npz', token_ids)
+
+    loaded = load_token_ids(tmp_path / 'token_ids.npz')
+    assert [ids.tolist() for ids in loaded] == [ids.tolist() for ids in token_ids]
+    assert all(ids.dtype == np.uint16 for ids in loaded)
+
+    monkeypatch.setattr(similarity_calculator, 'VSM_MODEL_SIZE', 1000)
+    with pytest.raises(ValueError):
+        load_token_ids(tmp_path / 'token_ids.npz')
+
+
+def test_tag_masks():
+    dom = get_html_dom(HTML)
+    tag_masks = TagMasks(dom, ('option', 'footer', 'form'))
+    assert tag_masks.get_descendant_mask(dom.xpath('//body')) == 0b100
+    assert tag_masks.get_descendant_mask(dom.xpath('//div[@class="post"]')) == 0
+    assert tag_masks.get_xpath_mask('//form/div') == 0b100
+    assert tag_masks.get_xpath_mask('//form[@class="search"]/div') == 0
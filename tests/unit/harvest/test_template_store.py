@@ -0,0 +1,57 @@
+from harvest.extract import ExtractionResult
+from harvest.template_store import (Template, TemplateStore, get_template, get_template_key,
+                                    is_valid_extraction)
+
+TEMPLATE = Template('//div[@class="post"]', None, '//div/span[@class="date"]', '//div/a[@class="user"]')
+
+
+def test_get_template_key():
+    assert get_template_key('https://Forum.example.org/threads/topic.123/') == 'forum.example.org'
+    assert get_template_key('https://forum.example.org/threads/topic.123/', path_segments=1) == \
+           'forum.example.org/threads'
+    assert get_template_key('https://forum.example.org/f/12/t/7', path_segments=2) == \
+           get_template_key('https://forum.example.org/f/3/t/9', path_segments=2)
+
+
+def test_get_template():
+    assert get_template({'text_xpath_pattern': None}) is None
+    assert get_template({'text_xpath_pattern': '//div[@class="post"]', 'url_xpath_pattern': None,
+                         'date_xpath_pattern': '//div/span[@class="date"]',
+                         'user_xpath_pattern': '//div/a[@class="user"]', 'xpath_score': 0.9}) == TEMPLATE
+
+
+def test_template_store_lru():
+    store = TemplateStore(max_size=2)
+    store.put('https://a.example.org/1', TEMPLATE)
+    store.put('https://b.example.org/1', TEMPLATE)
+    assert store.get('https://a.example.org/2') == TEMPLATE
+    store.put('https://c.example.org/1', TEMPLATE)
+
+    assert len(store) == 2
+    assert store.get('https://b.example.org/1') is None
+    assert store.get('https://a.example.org/1') == TEMPLATE
+
+    store.discard('https://a.example.org/1')
+    assert store.get('https://a.example.org/1') is None
+
+
+def test_template_store_sqlite(tmp_path):
+    db = str(tmp_path / 'templates.db')
+    store = TemplateStore(path=db)
+    store.put('https://forum.example.org/thread/1', TEMPLATE)
+    store.put('https://dates.example.org/thread/1', TEMPLATE._replace(date_format='%[%d.%m.%Y%]'))
+    store.close()
+
+    store = TemplateStore(path=db)
+    assert store.get('https://forum.example.org/thread/2') == TEMPLATE
+    assert store.get('https://dates.example.org/thread/2').date_format == '%[%d.%m.%Y%]'
+
+
+def test_is_valid_extraction():
+    assert not is_valid_extraction([])
+    # a single post is not enough, even if it contains text
+    assert not is_valid_extraction([ExtractionResult('Hello', None, None, None)])
+    assert is_valid_extraction([ExtractionResult('Hello', None, None, None),
+                                ExtractionResult('World', None, None, None)])
+    assert not is_valid_extraction([ExtractionResult('Hello', None, None, None),
+                                    ExtractionResult('', None, None, None)])
@@ -1,4 +1,7 @@
-from harvest.utils import get_merged_xpath
+import re
+
+from harvest.utils import (get_merged_xpath, get_html_dom, get_xpath_tree_text, extract_text, SubtreeText,
+                           XPathEvaluator, ElementIntervals, elements_have_no_overlap)
 
 
 def test_get_merge_xpath():
@@ -27,3 +30,59 @@ def test_get_merge_xpath_with_no_merges():
               r'//a[@class="user-name"][not(*) and string-length(text()) > 0]']
     merged_xpath = get_merged_xpath(xpaths)
     assert not merged_xpath
+
+
+def test_get_merge_xpath_groups_by_skeleton():
+    xpaths = [r'//div[@class="post-even"]/a',
+              r'//span[@class="post-odd"]/a',
+              r'//div[@class="post-odd"]/a',
+              r'//div[@class="post-first"]/a']
+    merged_xpath = get_merged_xpath(xpaths)
+    # the span xpath has a different skeleton and, therefore, is never merged
+    assert merged_xpath == [r"//div[(contains(@class, 'post-even')) or (contains(@class, 'post-first'))]/a",
+                            r"//div[(contains(@class, 'post-odd')) or (contains(@class, 'post-first'))]/a"]
+
+
+def test_subtree_text():
+    dom = get_html_dom('<html><body><div class="post">Hello <b>dear</b>   world<!-- comment -->!\n\n'
+                       '<p>Second   paragraph</p> tail</div><div class="post">Bye</div></body></html>')
+    subtree_text = SubtreeText(dom)
+    for element in dom.iter('div', 'b', 'p', 'body'):
+        assert subtree_text.get_text(element) == re.sub(r'\s\s+', ' ', extract_text(element))
+
+    assert get_xpath_tree_text(dom, '//div', subtree_text=subtree_text) == \
+           ['Hello dear world ! Second paragraph tail', 'Bye']
+    assert get_xpath_tree_text(dom, '//div', subtree_text=subtree_text) == get_xpath_tree_text(dom, '//div')
+
+
+def test_xpath_evaluator():
+    dom = get_html_dom('<html><body><div class="post">Hello</div><div class="post">World</div></body></html>')
+    evaluator = XPathEvaluator(dom)
+
+    posts = evaluator.xpath('//div[@class="post"]')
+    assert posts == dom.xpath('//div[@class="post"]')
+    posts.pop()
+    assert evaluator.xpath('//div[@class="post"]') == dom.xpath('//div[@class="post"]')
+    assert (evaluator.hits, evaluator.misses) == (1, 1)
+
+
+def test_element_intervals():
+    dom = get_html_dom('<html><body><div id="a"><p id="b">One</p><p id="c">Two <b id="d">!</b></p></div>'
+                       '<div id="e">Three</div></body></html>')
+    a, b, c, d, e = (dom.xpath(f'//*[@id="{x}"]')[0] for x in 'abcde')
+    intervals = ElementIntervals(dom)
+
+    assert intervals.is_descendant(d, a)
+    assert intervals.is_descendant(d, c)
+    assert not intervals.is_descendant(d, b)
+    assert not intervals.is_descendant(a, a)
+
+    positions = intervals.get_positions([b, d, e])
+    assert intervals.count_descendants(a, positions) == 2
+    assert intervals.count_descendants(c, positions) == 1
+    assert intervals.count_descendants(e, positions) == 0
+
+    assert elements_have_no_overlap([b, c, e], intervals)
+    assert not elements_have_no_overlap([a, d], intervals)
+    assert not elements_have_no_overlap([d, e, c])
+    assert elements_have_no_overlap([])